@@ -1,11 +1,43 @@
 import argparse
+import hashlib
+import io
+import json
+import multiprocessing
 import os
 import re
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.ipc as paipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 CHUNK_SIZE = 200_000
+DEFAULT_SHARD_MB = 256
+DEFAULT_DEDUP_MEM_MB = 512
+SPILL_PARTITIONS = 64
+ARROW_BLOCK_BYTES = 16 * 1024 * 1024
+
+# 列指向出力（parquet / arrow）の schema_version。列や型を変えたら上げる（price_index.py も合わせる）
+SCHEMA_VERSION = 1
+COLUMNAR_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+OUTPUT_COLS = ["campus", "code", "description", "gross_charge", "cash_price"]
+DEDUP_COLS = ["campus", "code", "description", "cash_price"]
 
 CASH_PATTERNS = [
     r"standard_charge\|discounted_cash",
@@ -141,20 +173,23 @@ def safe_preview(path: str, fmt: CsvFormat):
     )
 
 
-def safe_chunks(path: str, fmt: CsvFormat, usecols):
-    return pd.read_csv(
-        path,
-        engine="python",
-        sep=fmt.sep,
-        skiprows=fmt.skiprows,
-        usecols=usecols,
-        chunksize=CHUNK_SIZE,
-        on_bad_lines="skip",
-    )
-
-
-def build_one_file(path, rows):
-    fmt = sniff_format(path)
+@dataclass
+class ColumnMap:
+    code: Optional[str]
+    desc: Optional[str]
+    gross: Optional[str]
+    cash: str
+
+    @property
+    def use_cols(self) -> List[str]:
+        out = []
+        for c in [self.code, self.desc, self.gross, self.cash]:
+            if c and c not in out:
+                out.append(c)
+        return out
+
+
+def detect_columns(path: str, fmt: CsvFormat) -> ColumnMap:
     preview = safe_preview(path, fmt)
     cols = list(preview.columns)
 
@@ -176,65 +211,546 @@ def build_one_file(path, rows):
             f"Detected sep='{fmt.sep}', skiprows={fmt.skiprows}\n"
             f"Columns sample: {cols[:60]}"
         )
+    return ColumnMap(code=code_col, desc=desc_col, gross=gross_col, cash=cash_col)
+
+
+def to_price(s):
+    """価格列を float に（"$1,234.50" -> 1234.5、数値にならない値は NaN）。行ループなしのベクトル演算。"""
+    if s.dtype.kind in "iuf":
+        return s.astype("float64")
+    return pd.to_numeric(s.astype(str).str.replace(r"[$,\s]", "", regex=True), errors="coerce")
+
+
+def shape_chunk(chunk, campus: str, cm: ColumnMap):
+    out = pd.DataFrame(index=chunk.index)
+    out["campus"] = campus
+
+    if cm.code and cm.code in chunk.columns:
+        out["code"] = chunk[cm.code].astype(str)
+    else:
+        out["code"] = ""
+
+    if cm.desc and cm.desc in chunk.columns:
+        out["description"] = chunk[cm.desc].astype(str)
+    else:
+        out["description"] = ""
+
+    if cm.gross and cm.gross in chunk.columns:
+        out["gross_charge"] = to_price(chunk[cm.gross])
+    else:
+        out["gross_charge"] = float("nan")
+
+    out["cash_price"] = to_price(chunk[cm.cash])
+
+    # 空/ゼロ/数値にならない値を除外
+    return out[out["cash_price"] > 0]
+
+
+# ---- 並列取り込み（--workers / --shard-mb） ----
+
+def plan_shards(path: str, fmt: CsvFormat, shard_bytes: int) -> List[Tuple[Optional[int], Optional[int]]]:
+    """
+    データ行のバイト範囲 [(start, end), ...]。行境界で区切る（header 行の後から）。
+    shard_bytes 以下のファイルは [(None, None)]（ファイル全体を通常どおり読む）。
+    """
+    size = os.path.getsize(path)
+    if shard_bytes <= 0 or size <= shard_bytes:
+        return [(None, None)]
+    with open(path, "rb") as f:
+        for _ in range(fmt.skiprows + 1):
+            f.readline()
+        bounds = [f.tell()]
+        while bounds[-1] + shard_bytes < size:
+            f.seek(bounds[-1] + shard_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
 
-    use_cols = []
-    for c in [code_col, desc_col, gross_col, cash_col]:
-        if c and c not in use_cols:
-            use_cols.append(c)
 
-    campus = infer_campus_from_path(path)
+def _header_bytes(path: str, fmt: CsvFormat) -> bytes:
+    with open(path, "rb") as f:
+        for _ in range(fmt.skiprows):
+            f.readline()
+        return f.readline()
 
-    for chunk in safe_chunks(path, fmt, use_cols):
-        out = pd.DataFrame()
-        out["campus"] = campus
 
-        if code_col and code_col in chunk.columns:
-            out["code"] = chunk[code_col].astype(str)
-        else:
-            out["code"] = ""
+class ByteRangeReader(io.RawIOBase):
+    """header 行 + [start, end) のバイトを1つのストリームとして読む。"""
 
-        if desc_col and desc_col in chunk.columns:
-            out["description"] = chunk[desc_col].astype(str)
-        else:
-            out["description"] = ""
+    def __init__(self, path: str, header: bytes, start: int, end: int):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._prefix = header
+        self._left = end - start
 
-        if gross_col and gross_col in chunk.columns:
-            out["gross_charge"] = chunk[gross_col]
-        else:
-            out["gross_charge"] = None
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        if self._left <= 0:
+            return 0
+        data = self._f.read(min(len(b), self._left))
+        self._left -= len(data)
+        b[:len(data)] = data
+        return len(data)
 
-        out["cash_price"] = chunk[cash_col]
+    def close(self):
+        self._f.close()
+        super().close()
 
-        # 空/ゼロを除外
-        out = out.dropna(subset=["cash_price"])
-        try:
-            out = out[out["cash_price"].astype(float) > 0]
-        except Exception:
-            out = out[out["cash_price"].astype(str).str.strip() != ""]
 
-        rows.append(out)
+@dataclass
+class ShardTask:
+    path: str
+    shard: int
+    start: Optional[int]
+    end: Optional[int]
+    fmt: CsvFormat
+    columns: ColumnMap
+    out_path: str
+    engine: str
+
+
+def _peak_rss_mb() -> float:
+    # Linux: ru_maxrss は KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _ingest_pandas(task: ShardTask, campus: str) -> Tuple[int, int]:
+    if task.start is None:
+        source, skiprows = task.path, task.fmt.skiprows
+    else:
+        raw = ByteRangeReader(task.path, _header_bytes(task.path, task.fmt), task.start, task.end)
+        source = io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8", errors="ignore")
+        skiprows = 0
+
+    rows_in = rows_out = 0
+    first = True
+    try:
+        for chunk in pd.read_csv(
+            source,
+            engine=task.engine,
+            sep=task.fmt.sep,
+            skiprows=skiprows,
+            usecols=task.columns.use_cols,
+            chunksize=CHUNK_SIZE,
+            on_bad_lines="skip",
+        ):
+            rows_in += len(chunk)
+            out = shape_chunk(chunk, campus, task.columns).drop_duplicates(subset=DEDUP_COLS)
+            out.to_csv(task.out_path, mode="w" if first else "a", header=first, index=False)
+            first = False
+            rows_out += len(out)
+    finally:
+        if task.start is not None:
+            source.close()
+    if first:
+        pd.DataFrame(columns=OUTPUT_COLS).to_csv(task.out_path, index=False)
+    return rows_in, rows_out
+
+
+# ---- Arrow（--engine pyarrow / parquet・arrow 出力） ----
+
+def shard_schema():
+    return pa.schema([
+        ("campus", pa.string()),
+        ("code", pa.string()),
+        ("description", pa.string()),
+        ("gross_charge", pa.float64()),
+        ("cash_price", pa.float64()),
+    ])
+
+
+def price_schema(metadata: Dict[str, str]):
+    # campus / code は値の種類が少ないので辞書エンコード、価格は float32
+    return pa.schema([
+        ("campus", pa.dictionary(pa.int32(), pa.string())),
+        ("code", pa.dictionary(pa.int32(), pa.string())),
+        ("description", pa.string()),
+        ("gross_charge", pa.float32()),
+        ("cash_price", pa.float32()),
+    ], metadata=metadata)
+
+
+def arrow_price(arr):
+    """to_price の Arrow 版（文字列列 -> float64、数値にならない値は null）。"""
+    s = pc.replace_substring_regex(arr, pattern=r"[$,\s]", replacement="")
+    ok = pc.match_substring_regex(s, pattern=r"^-?(\d+\.?\d*|\.\d+)$")
+    return pc.cast(pc.if_else(ok, s, pa.scalar(None, pa.string())), pa.float64())
+
+
+def shape_batch(batch, campus: str, cm: ColumnMap):
+    n = batch.num_rows
+    names = batch.schema.names
+
+    def text(col):
+        if col and col in names:
+            return pc.fill_null(batch.column(col), "")
+        return pa.nulls(n, pa.string()).fill_null("")
+
+    gross = arrow_price(batch.column(cm.gross)) if cm.gross in names else pa.nulls(n, pa.float64())
+    table = pa.Table.from_arrays(
+        [pa.nulls(n, pa.string()).fill_null(campus), text(cm.code), text(cm.desc), gross, arrow_price(batch.column(cm.cash))],
+        schema=shard_schema(),
+    )
+    table = table.filter(pc.greater(table["cash_price"], 0))
+    # バッチ内の重複除去（gross_charge は先頭の値）
+    dedup = table.group_by(DEDUP_COLS, use_threads=False).aggregate([("gross_charge", "first")])
+    return dedup.rename_columns([c if c != "gross_charge_first" else "gross_charge" for c in dedup.column_names]).select(OUTPUT_COLS)
+
+
+def _skip_invalid_row(row):
+    return "skip"
+
+
+def _ingest_arrow(task: ShardTask, campus: str) -> Tuple[int, int]:
+    cm = task.columns
+    if task.start is None:
+        source, skiprows = task.path, task.fmt.skiprows
+    else:
+        raw = ByteRangeReader(task.path, _header_bytes(task.path, task.fmt), task.start, task.end)
+        source, skiprows = io.BufferedReader(raw), 0
+
+    rows_in = rows_out = 0
+    try:
+        # ストリーミング読み込み（ブロック単位）。使う列だけ、型は明示的に文字列
+        reader = pacsv.open_csv(
+            source,
+            read_options=pacsv.ReadOptions(skip_rows=skiprows, block_size=ARROW_BLOCK_BYTES),
+            parse_options=pacsv.ParseOptions(delimiter=task.fmt.sep, invalid_row_handler=_skip_invalid_row),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=cm.use_cols,
+                column_types={c: pa.string() for c in cm.use_cols},
+            ),
+        )
+        with paipc.new_file(task.out_path, shard_schema()) as writer:
+            for batch in reader:
+                rows_in += batch.num_rows
+                table = shape_batch(batch, campus, cm)
+                writer.write_table(table)
+                rows_out += table.num_rows
+    finally:
+        if task.start is not None:
+            source.close()
+    return rows_in, rows_out
+
+
+def ingest_shard(task: ShardTask) -> dict:
+    started = time.time()
+    campus = infer_campus_from_path(task.path)
+    if task.engine == "pyarrow":
+        rows_in, rows_out = _ingest_arrow(task, campus)
+    else:
+        rows_in, rows_out = _ingest_pandas(task, campus)
+
+    return {
+        "path": task.path,
+        "shard": task.shard,
+        "out_path": task.out_path,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "started": started,
+        "finished": time.time(),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def plan_tasks(inputs: List[str], shard_dir: Path, shard_bytes: int, engine: str) -> List[ShardTask]:
+    tasks = []
+    for n, path in enumerate(inputs):
+        fmt = sniff_format(path)
+        cm = detect_columns(path, fmt)
+        for i, (start, end) in enumerate(plan_shards(path, fmt, shard_bytes)):
+            suffix = "arrow" if engine == "pyarrow" else "csv"
+            out_path = shard_dir / f"{n:03d}_{Path(path).stem}.{i:04d}.{suffix}"
+            tasks.append(ShardTask(path, i, start, end, fmt, cm, str(out_path), engine))
+    return tasks
+
+
+def run_tasks(tasks: List[ShardTask], workers: int) -> Iterator[dict]:
+    # workers=1 でも子プロセスで実行。maxtasksperchild=1 でシャードごとに新プロセスにし、
+    # ru_maxrss（プロセス生存中の最大値）をシャード単位の peak RSS として測る。大きいシャードから投入
+    ordered = sorted(tasks, key=lambda t: -((t.end or os.path.getsize(t.path)) - (t.start or 0)))
+    with multiprocessing.Pool(max(workers, 1), maxtasksperchild=1) as pool:
+        yield from pool.imap_unordered(ingest_shard, ordered)
+
+
+def read_shard(path: str) -> Iterator["pd.DataFrame"]:
+    if path.endswith(".arrow"):
+        with pa.memory_map(path) as source:
+            reader = paipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+    else:
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=CHUNK_SIZE)
+
+
+def normalize_prices(df):
+    # シャード間で表記ゆれ（1470 / 1470.0）があっても同じ価格として重複除去
+    df = df[OUTPUT_COLS].copy()
+    df["gross_charge"] = to_price(df["gross_charge"])
+    df["cash_price"] = to_price(df["cash_price"])
+    return df
+
+
+def row_hashes(df) -> "np.ndarray":
+    """DEDUP_COLS の 64bit ハッシュ（1億キーで衝突確率 ~3e-4）。"""
+    return pd.util.hash_pandas_object(df[DEDUP_COLS], index=False).to_numpy()
+
+
+# ---- ストリーミング重複除去（--dedup-mem-mb） ----
+
+class StreamingDedup:
+    """
+    行キーのハッシュで重複除去しながら、初出の行をそのまま write(df) へ流す（全行を溜めない）。
+    見たキーはソート済み uint64 配列の集合（1キー8バイト、サイズが倍々になるよう併合）。
+    見たキーが mem_bytes に収まらなくなったら、以降の新しい行はハッシュで SPILL_PARTITIONS 個の
+    ファイルへ退避し、最後にパーティションごとに（それぞれメモリに収まる大きさで）重複除去する。
+    """
+
+    def __init__(self, write, mem_bytes: int, spill_dir: Path, partitions: int = SPILL_PARTITIONS):
+        self.write = write
+        self.mem_bytes = mem_bytes
+        self.spill_dir = spill_dir
+        self.partitions = partitions
+        self.runs: List["np.ndarray"] = []
+        self.spilling = False
+        self.rows_in = self.rows_out = self.rows_spilled = 0
+
+    @property
+    def seen_bytes(self) -> int:
+        return sum(r.nbytes for r in self.runs)
+
+    def _seen(self, h):
+        mask = np.zeros(len(h), dtype=bool)
+        for run in self.runs:
+            pos = np.searchsorted(run, h)
+            pos[pos == len(run)] = 0
+            mask |= run[pos] == h
+        return mask
+
+    def _remember(self, h) -> None:
+        self.runs.append(np.sort(h))
+        while len(self.runs) > 1 and 2 * len(self.runs[-1]) >= len(self.runs[-2]):
+            b, a = self.runs.pop(), self.runs.pop()
+            # ソート済み2本の連結なので stable(timsort) はほぼ線形
+            self.runs.append(np.sort(np.concatenate([a, b]), kind="stable"))
+
+    def _spill(self, df, h) -> None:
+        self.spill_dir.mkdir(exist_ok=True)
+        part = h % self.partitions
+        for p in np.unique(part):
+            sel = part == p
+            path = self.spill_dir / f"part{p:03d}.csv"
+            df[sel].assign(_h=h[sel].astype(str)).to_csv(path, mode="a", header=not path.exists(), index=False)
+        self.rows_spilled += len(df)
+
+    def add(self, df) -> None:
+        self.rows_in += len(df)
+        if not len(df):
+            return
+        df = normalize_prices(df)
+        h = row_hashes(df)
+        keep = ~(self._seen(h) | pd.Series(h).duplicated().to_numpy())
+        if not keep.any():
+            return
+        df, h = df[keep], h[keep]
+        # 併合中は一時的に倍のメモリを使うので 2 倍で判定
+        if not self.spilling and 2 * (self.seen_bytes + h.nbytes) > self.mem_bytes:
+            self.spilling = True
+            print(f"  dedup: seen-set reached {self.seen_bytes / 2**20:,.0f}MB; spilling new rows to {self.spill_dir}")
+        if self.spilling:
+            self._spill(df, h)
+            return
+        self._remember(h)
+        self.write(df)
+        self.rows_out += len(df)
+
+    def finish(self) -> dict:
+        if self.spilling:
+            for path in sorted(self.spill_dir.glob("part*.csv")):
+                df = pd.read_csv(path, dtype=str, keep_default_na=False)
+                h = df.pop("_h").astype("uint64").to_numpy()
+                df = normalize_prices(df)[~pd.Series(h).duplicated().to_numpy()]
+                self.write(df)
+                self.rows_out += len(df)
+                path.unlink()
+        return {
+            "rows": self.rows_in,
+            "kept": self.rows_out,
+            "spilled": self.rows_spilled,
+            "seen_mb": round(self.seen_bytes / 2**20, 1),
+        }
+
+
+class GrowingDictionary:
+    """出力全体で共通の追記のみの辞書（Arrow IPC ファイルは辞書の差し替え不可、追記=delta は可）。"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, s):
+        codes, uniques = pd.factorize(s.astype(str))
+        ids = np.empty(len(uniques), dtype=np.int32)
+        for i, v in enumerate(uniques):
+            if v not in self.ids:
+                self.ids[v] = len(self.values)
+                self.values.append(v)
+            ids[i] = self.ids[v]
+        return pa.DictionaryArray.from_arrays(pa.array(ids[codes], pa.int32()), pa.array(self.values, pa.string()))
+
+
+def source_hashes(paths: List[str]) -> List[dict]:
+    out = []
+    for p in paths:
+        h = hashlib.sha256()
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        out.append({"file": os.path.basename(p), "bytes": os.path.getsize(p), "sha256": h.hexdigest()})
+    return out
+
+
+class OutputWriter:
+    """受け付けた行を順に書く: csv / parquet（zstd、チャンク = row group）/ arrow（非圧縮 IPC、memory-map 可）。"""
+
+    def __init__(self, path: Path, fmt: str, sources: List[dict]):
+        self.fmt = fmt
+        self.rows = 0
+        if fmt == "csv":
+            self._f = open(path, "w", encoding="utf-8", newline="")
+            return
+        self.schema = price_schema({
+            "medbill.schema_version": str(SCHEMA_VERSION),
+            "medbill.sources": json.dumps(sources),
+            "medbill.created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        })
+        self._dicts = {"campus": GrowingDictionary(), "code": GrowingDictionary()}
+        if fmt == "parquet":
+            self._w = pq.ParquetWriter(str(path), self.schema, compression="zstd", use_dictionary=["campus", "code"])
+        else:
+            self._w = paipc.new_file(str(path), self.schema, options=paipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    def write(self, df) -> None:
+        if self.fmt == "csv":
+            df.to_csv(self._f, header=self.rows == 0, index=False)
+        elif len(df):
+            self._w.write_table(pa.Table.from_arrays([
+                self._dicts["campus"].encode(df["campus"]),
+                self._dicts["code"].encode(df["code"]),
+                pa.array(df["description"].astype(str), pa.string()),
+                pa.array(df["gross_charge"].astype("float32"), pa.float32(), from_pandas=True),
+                pa.array(df["cash_price"].astype("float32"), pa.float32(), from_pandas=True),
+            ], schema=self.schema))
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self.fmt == "csv":
+            if self.rows == 0:
+                pd.DataFrame(columns=OUTPUT_COLS).to_csv(self._f, index=False)
+            self._f.close()
+        else:
+            self._w.close()
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("inputs", nargs="+", help="MRF CSV paths")
     parser.add_argument("-o", "--output", required=True, help="Output csv path")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (0 = one per CPU; 1 = serial)")
+    parser.add_argument(
+        "--shard-mb", type=int, default=DEFAULT_SHARD_MB,
+        help="split files larger than this into byte-range shards on line boundaries (0 = never; "
+             "use 0 for files with newlines inside quoted fields)",
+    )
+    parser.add_argument(
+        "--engine", choices=["python", "c", "pyarrow"], default="python",
+        help="CSV reader: pandas python / c engine, or the pyarrow streaming reader",
+    )
+    parser.add_argument(
+        "--format", choices=["auto", "csv", "parquet", "arrow"], default="auto",
+        help="output format (auto = from the -o suffix: .parquet / .arrow / .feather, else csv)",
+    )
+    parser.add_argument(
+        "--dedup-mem-mb", type=int, default=DEFAULT_DEDUP_MEM_MB,
+        help="memory for the dedup seen-set (8 bytes per unique row); beyond it rows spill to disk partitions",
+    )
     args = parser.parse_args()
 
-    rows = []
-    for p in args.inputs:
-        build_one_file(p, rows)
-
-    df = pd.concat(rows, ignore_index=True)
-
-    # 軽量KBとして重複除去
-    df = df.drop_duplicates(subset=["campus", "code", "description", "cash_price"])
-
     out_path = Path(args.output)
+    fmt = args.format if args.format != "auto" else COLUMNAR_FORMATS.get(out_path.suffix.lower(), "csv")
+    if (fmt != "csv" or args.engine == "pyarrow") and not PYARROW_AVAILABLE:
+        parser.error("parquet / arrow output and --engine pyarrow need pyarrow (pip install pyarrow)")
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(out_path, index=False)
-
-    print(f"✅ saved: {out_path} rows={len(df)}")
+    shard_dir = Path(tempfile.mkdtemp(prefix=out_path.name + ".shards.", dir=out_path.parent))
+
+    # 入力ファイルの sha256（列指向出力のメタデータ用）は取り込みと並行して計算
+    hasher = ThreadPoolExecutor(max_workers=1)
+    hashes = hasher.submit(source_hashes, args.inputs) if fmt != "csv" else None
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    writer: Optional[OutputWriter] = None
+    try:
+        tasks = plan_tasks(args.inputs, shard_dir, args.shard_mb * 1024 * 1024, args.engine)
+        pending = {}
+        for t in tasks:
+            pending[t.path] = pending.get(t.path, 0) + 1
+        order = {t.out_path: i for i, t in enumerate(tasks)}
+
+        per_file: Dict[str, List[dict]] = {}
+        finished: Dict[int, dict] = {}
+        next_shard = 0
+        dedup: Optional[StreamingDedup] = None
+        for r in run_tasks(tasks, workers):
+            done = per_file.setdefault(r["path"], [])
+            done.append(r)
+            if len(done) == pending[r["path"]]:
+                rows_in = sum(x["rows_in"] for x in done)
+                rows_out = sum(x["rows_out"] for x in done)
+                wall = max(x["finished"] for x in done) - min(x["started"] for x in done)
+                print(
+                    f"  {r['path']}: shards={len(done)} rows={rows_in:,} kept={rows_out:,} "
+                    f"{rows_in / max(wall, 1e-6):,.0f} rows/s peak_rss={max(x['peak_rss_mb'] for x in done):,.0f}MB"
+                )
+
+            # 終わったシャードから計画順に重複除去して出力へ（並列数によらず同じ出力、シャードはすぐ削除）
+            finished[order[r["out_path"]]] = r
+            while next_shard in finished:
+                if dedup is None:
+                    writer = OutputWriter(tmp_path, fmt, hashes.result() if hashes else [])
+                    dedup = StreamingDedup(writer.write, args.dedup_mem_mb * 1024 * 1024, shard_dir / "spill")
+                shard_path = finished.pop(next_shard)["out_path"]
+                for chunk in read_shard(shard_path):
+                    dedup.add(chunk)
+                os.remove(shard_path)
+                next_shard += 1
+
+        stats = dedup.finish()
+        writer.close()
+        writer = None
+        os.replace(tmp_path, out_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        hasher.shutdown(wait=False)
+
+    print(
+        f"  dedup: rows={stats['rows']:,} kept={stats['kept']:,} seen_set={stats['seen_mb']:,}MB "
+        f"spilled={stats['spilled']:,} main_process_peak_rss={_peak_rss_mb():,.0f}MB"
+    )
+    print(f"✅ saved: {out_path} ({fmt}) rows={stats['kept']}")
 
 
 if __name__ == "__main__":
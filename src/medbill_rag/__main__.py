@@ -1,3 +1,5 @@
+import argparse
+import json
 import os
 import sys
 
@@ -7,17 +9,76 @@ from .email_templates import write_hospital_email_output
 from .pipeline_end2end import run_bill_folder
 
 
-def main():
-    bill_id = None
-    if len(sys.argv) >= 2:
-        bill_id = sys.argv[1]
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m medbill_rag",
+        description="Run the bill pipeline for one BILL_FOLDER_ID, or many in batch mode.",
+    )
+    parser.add_argument("bill_id", nargs="?", help="Bill folder ID (default: $BILL_FOLDER_ID)")
+
+    batch = parser.add_argument_group("batch mode")
+    src = batch.add_mutually_exclusive_group()
+    src.add_argument("--ids-file", help="File with one bill folder ID per line ('-' = stdin)")
+    src.add_argument("--stdin", action="store_true", help="Read bill folder IDs from stdin")
+    src.add_argument(
+        "--gcs-prefix",
+        metavar="ID_PREFIX",
+        help="Process every gs://$BUCKET_CASE/bills/<id>/ whose id starts with ID_PREFIX ('' = all)",
+    )
+    batch.add_argument("--concurrency", type=int, default=None, help="Bills in flight (default: $BATCH_CONCURRENCY or 4)")
+    batch.add_argument("--summary", help="Write the batch summary JSON to this path")
+    parser.add_argument(
+        "--ocr-engine",
+        choices=["online", "batch", "local"],
+        default=None,
+        help="OCR engine for this run (default: $OCR_ENGINE or online)",
+    )
+    parser.add_argument(
+        "--deadline-s",
+        type=float,
+        default=None,
+        help="Time budget per bill in seconds (default: $BILL_DEADLINE_S; 0 = none)",
+    )
+    return parser.parse_args(argv)
+
+
+def _main_batch(args) -> int:
+    from .batch import read_bill_ids, read_bill_ids_file, read_bill_ids_gcs, run_batch
+    from .config import settings
+
+    if args.stdin:
+        bill_ids = read_bill_ids(sys.stdin)
+    elif args.ids_file:
+        bill_ids = read_bill_ids_file(args.ids_file)
+    else:
+        bill_ids = read_bill_ids_gcs(args.gcs_prefix)
+
+    concurrency = args.concurrency or settings.batch_concurrency
+    print(f"▶ batch: {len(bill_ids)} bills, concurrency={concurrency}", file=sys.stderr)
+
+    summary = run_batch(bill_ids, concurrency=concurrency, ocr_engine=args.ocr_engine, deadline_s=args.deadline_s)
+
+    summary_text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(summary_text)
+    print(summary_text, file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.ids_file or args.stdin or args.gcs_prefix is not None:
+        raise SystemExit(_main_batch(args))
+
+    bill_id = args.bill_id
     if not bill_id:
         bill_id = os.environ.get("BILL_FOLDER_ID")
 
     if not bill_id:
         raise SystemExit("BILL_FOLDER_ID is required. Usage: python -m medbill_rag <BILL_FOLDER_ID>")
 
-    result = run_bill_folder(bill_id)
+    result = run_bill_folder(bill_id, ocr_engine=args.ocr_engine, deadline_s=args.deadline_s)
 
     # Add patient-led hospital email doc
     try:
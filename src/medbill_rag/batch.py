@@ -0,0 +1,146 @@
+"""
+Batch runner: process many bill folders in one process with bounded concurrency.
+
+Each finished bill is streamed as one JSON line; a summary with throughput and
+latency percentiles is produced at the end.
+"""
+import asyncio
+import json
+import math
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+from .case_discovery import list_bill_folder_ids
+from .email_templates import write_hospital_email_output
+from .ocr_engines import get_ocr_engine
+from . import hedging, llm_cache, rate_limit
+from .pipeline_end2end import run_bill_folder_async
+from .client_registry import aclose_loop
+from .config import settings
+
+
+def read_bill_ids(lines: Iterable[str]) -> List[str]:
+    """One ID per line; blank lines and '#' comments are ignored, duplicates dropped."""
+    seen = set()
+    ids = []
+    for line in lines:
+        bid = line.split("#", 1)[0].strip()
+        if bid and bid not in seen:
+            seen.add(bid)
+            ids.append(bid)
+    return ids
+
+
+def read_bill_ids_file(path: str) -> List[str]:
+    if path == "-":
+        return read_bill_ids(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return read_bill_ids(f)
+
+
+def read_bill_ids_gcs(id_prefix: str = "") -> List[str]:
+    return list_bill_folder_ids(id_prefix)
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(pct / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(records: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    lat = sorted(r["seconds"] for r in records)
+    ok = sum(1 for r in records if r["ok"])
+
+    def rnd(v):
+        return round(v, 3) if v is not None else None
+
+    return {
+        "bills": len(records),
+        "succeeded": ok,
+        "failed": len(records) - ok,
+        "wall_seconds": rnd(wall_seconds),
+        "bills_per_minute": rnd(len(records) / wall_seconds * 60.0) if wall_seconds > 0 else None,
+        "latency_seconds": {
+            "p50": rnd(_percentile(lat, 50)),
+            "p90": rnd(_percentile(lat, 90)),
+            "p99": rnd(_percentile(lat, 99)),
+            "max": rnd(lat[-1]) if lat else None,
+        },
+        "failed_bill_ids": [r["bill_folder_id"] for r in records if not r["ok"]],
+    }
+
+
+async def _run_one(bill_id: str, engine, deadline_s: Optional[float] = None) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    rec: Dict[str, Any] = {"bill_folder_id": bill_id, "ok": False}
+    try:
+        result = await run_bill_folder_async(bill_id, ocr_engine=engine, deadline_s=deadline_s)
+        if result.get("error"):
+            rec["error"] = result["error"]
+        else:
+            rec["ok"] = True
+            if result.get("skipped_stages"):
+                rec["skipped_stages"] = result["skipped_stages"]
+            # Same local patient-led email artifact as the single-bill CLI
+            try:
+                await asyncio.to_thread(write_hospital_email_output, bill_id, result)
+            except Exception as e:
+                rec["warning"] = f"hospital email skipped: {type(e).__name__}: {e}"
+    except Exception as e:
+        rec["error"] = f"{type(e).__name__}: {e}"
+    rec["seconds"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+
+async def run_batch_async(
+    bill_ids: List[str],
+    concurrency: int = 4,
+    out: Optional[TextIO] = None,
+    ocr_engine: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Run every bill with at most `concurrency` in flight (each with its own deadline_s).
+    Writes one JSON line per finished bill to `out` (default stdout) and returns the summary.
+    One OCR engine instance is shared by all bills (the batch engine coalesces their files).
+    """
+    out = out or sys.stdout
+    engine = get_ocr_engine(ocr_engine)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    records: List[Dict[str, Any]] = []
+
+    async def worker(bid: str) -> None:
+        async with sem:
+            rec = await _run_one(bid, engine, deadline_s)
+        records.append(rec)
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        out.flush()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(b) for b in bill_ids))
+    summary = summarize(records, time.perf_counter() - t0)
+    summary["llm_cache"] = llm_cache.stats()
+    summary["rate_limits"] = rate_limit.stats()
+    if settings.hedge_enabled:
+        summary["hedging"] = hedging.stats()
+    return summary
+
+
+def run_batch(
+    bill_ids: List[str],
+    concurrency: int = 4,
+    out: Optional[TextIO] = None,
+    ocr_engine: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    async def _run():
+        try:
+            return await run_batch_async(bill_ids, concurrency, out, ocr_engine, deadline_s)
+        finally:
+            await aclose_loop()
+
+    return asyncio.run(_run())
@@ -0,0 +1,27 @@
+"""
+Regexes for billing evidence shared by prompt packing, OCR compaction and the line-item parser.
+
+- MONEY: "$45", "$1,234.50", "1,234.50", "(45.00)", "45.00-", "45.00 CR"; groups neg, num,
+  cents (None for whole dollars after "$") and suffix, so the parser can read the value
+- BILLING_CODE: CPT, HCPCS level II, revenue code, ICD-10-CM
+- DATE: 01/02/2025, 2025-01-02, Jan 2
+"""
+import re
+
+MONEY = re.compile(
+    r"(?<![\w.,])(?P<neg>\(|-)?(?=\$|\d[\d,]*\.\d{2}(?![\d,]))"
+    r"\$?\s?(?P<num>\d{1,3}(?:,\d{3})+|\d+)(?:\.(?P<cents>\d{2}))?(?![\d,])\)?"
+    r"(?P<suffix>\s?CR\b|-(?!\d))?",
+    re.IGNORECASE,
+)
+BILLING_CODE = re.compile(
+    r"\b\d{5}\b"                # CPT
+    r"|\b[A-V]\d{4}\b"          # HCPCS level II
+    r"|\b0\d{3}\b"              # revenue code
+    r"|\b[A-TV-Z]\d{2}\.\d+\b"  # ICD-10-CM
+)
+DATE = re.compile(
+    r"\b\d{1,2}/\d{1,2}/\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b"
+    r"|\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2}\b",
+    re.IGNORECASE,
+)
@@ -1,7 +1,10 @@
+import asyncio
 import re
 from typing import Dict, List, Optional
-from google.cloud import storage
+from .client_registry import storage_client
 from .config import settings
+from .deadline import call_timeout
+from .gcs_case import GCS_TIMEOUT_S
 
 EOB_PAT = re.compile(r"\beob\b", re.IGNORECASE)
 ITEMIZED_PAT = re.compile(r"itemized|itemised|detail", re.IGNORECASE)
@@ -22,8 +25,8 @@ def list_bill_folder_files(bill_folder_id: str) -> List[Dict]:
         raise ValueError("BUCKET_CASE is not set")
 
     prefix = f"bills/{bill_folder_id}/"
-    client = storage.Client()
-    blobs = list(client.list_blobs(settings.bucket_case, prefix=prefix))
+    client = storage_client()
+    blobs = list(client.list_blobs(settings.bucket_case, prefix=prefix, timeout=call_timeout(GCS_TIMEOUT_S)))
 
     files = []
     for b in blobs:
@@ -44,9 +47,29 @@ def list_bill_folder_files(bill_folder_id: str) -> List[Dict]:
             "mime_type": mime,
             "hint": _guess_kind_from_name(b.name),
             "blob_name": b.name,
+            # content identity (OCR cache key)
+            "bucket": settings.bucket_case,
+            "generation": str(b.generation) if b.generation else None,
+            "md5_hash": b.md5_hash,
         })
     return files
 
+def list_bill_folder_ids(id_prefix: str = "") -> List[str]:
+    """List bill folder IDs under bills/ (optionally only those starting with id_prefix)."""
+    if not settings.bucket_case:
+        raise ValueError("BUCKET_CASE is not set")
+
+    client = storage_client()
+    it = client.list_blobs(settings.bucket_case, prefix=f"bills/{id_prefix}", delimiter="/")
+    # prefixes are only populated once the pages have been consumed
+    for _ in it:
+        pass
+    ids = [p[len("bills/"):].rstrip("/") for p in it.prefixes]
+    return sorted(i for i in ids if i)
+
+async def list_bill_folder_files_async(bill_folder_id: str) -> List[Dict]:
+    return await asyncio.to_thread(list_bill_folder_files, bill_folder_id)
+
 def pick_best_by_kind(files: List[Dict]) -> Dict[str, Optional[Dict]]:
     grouped = {"EOB": [], "ITEMIZED": [], "STATEMENT": [], "UNKNOWN": []}
     for f in files:
@@ -1,4 +1,4 @@
-from google import genai
+from .client_registry import genai_client
 from .config import settings, Config
 
 
@@ -8,13 +8,10 @@ def get_genai_client(cfg: Config = None):
 
     This MVP always uses Vertex AI (no Developer API key),
     aligned with HIPAA/BAA usage.
+    The client is shared process-wide (see client_registry).
     """
     if cfg is None:
         # settings is a lazy proxy
         cfg = settings._get()  # type: ignore
 
-    return genai.Client(
-        vertexai=True,
-        project=cfg.project_id,
-        location=cfg.location,
-    )
+    return genai_client(cfg.project_id, cfg.location)
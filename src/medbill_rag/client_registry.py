@@ -0,0 +1,129 @@
+"""
+Process-wide registry of Google API clients.
+
+Clients are created lazily and reused, keyed by (service, project, location/endpoint),
+so channel and auth setup happen once per process instead of once per stage/file/upload.
+
+- genai.Client, DocumentProcessorServiceClient and storage.Client are shared across threads
+- grpc.aio clients (DocumentProcessorServiceAsyncClient) are bound to an event loop and are
+  therefore keyed per loop as well; close them with aclose_loop() before the loop exits
+- close_all() releases every client (also registered with atexit)
+"""
+import asyncio
+import atexit
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+_lock = threading.Lock()
+_clients: Dict[Tuple, Any] = {}
+_closers: Dict[Tuple, Callable[[Any], None]] = {}
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, Any]]" = weakref.WeakKeyDictionary()
+
+
+def get_client(
+    key: Tuple,
+    factory: Callable[[], Any],
+    close: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+            if close is not None:
+                _closers[key] = close
+    return client
+
+
+def get_loop_client(key: Tuple, factory: Callable[[], Any]) -> Any:
+    loop = asyncio.get_running_loop()
+    per_loop = _loop_clients.setdefault(loop, {})
+    client = per_loop.get(key)
+    if client is None:
+        client = factory()
+        per_loop[key] = client
+    return client
+
+
+# ---- services ----
+def genai_client(project: str, location: str):
+    from google import genai
+
+    return get_client(
+        ("genai", project, location),
+        lambda: genai.Client(vertexai=True, project=project, location=location),
+        close=lambda c: getattr(c, "close", lambda: None)(),
+    )
+
+
+def _docai_options(location: str) -> dict:
+    return {"api_endpoint": f"{location}-documentai.googleapis.com"}
+
+
+def docai_client(location: str):
+    from google.cloud import documentai_v1 as documentai
+
+    return get_client(
+        ("documentai", None, location),
+        lambda: documentai.DocumentProcessorServiceClient(client_options=_docai_options(location)),
+        close=lambda c: c.transport.close(),
+    )
+
+
+def docai_async_client(location: str):
+    from google.cloud import documentai_v1 as documentai
+
+    return get_loop_client(
+        ("documentai-aio", None, location),
+        lambda: documentai.DocumentProcessorServiceAsyncClient(client_options=_docai_options(location)),
+    )
+
+
+def storage_client(project: Optional[str] = None):
+    from google.cloud import storage
+
+    return get_client(
+        ("storage", project, None),
+        lambda: storage.Client(project=project) if project else storage.Client(),
+        close=lambda c: c.close(),
+    )
+
+
+# ---- close hooks ----
+async def aclose_loop() -> None:
+    """Close clients bound to the running loop (async Document AI, pooled REST client)."""
+    from .rest_client import aclose_transport
+
+    loop = asyncio.get_running_loop()
+    per_loop = _loop_clients.pop(loop, {})
+    for client in per_loop.values():
+        try:
+            await client.transport.close()
+        except Exception:
+            pass
+    await aclose_transport()
+
+
+def close_all() -> None:
+    """Close and forget every process-wide client."""
+    from .rest_client import close_transport
+
+    with _lock:
+        items = [(k, _clients[k], _closers.get(k)) for k in list(_clients)]
+        _clients.clear()
+        _closers.clear()
+    for _, client, close in items:
+        if close is None:
+            continue
+        try:
+            close(client)
+        except Exception:
+            pass
+    close_transport()
+
+
+atexit.register(close_all)
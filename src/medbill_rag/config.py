@@ -67,6 +67,78 @@ class Config:
     # Output file naming prefix
     output_file_header: str = ""
 
+    # Pinned Document AI processor version (default: processor's default version)
+    docai_processor_version: Optional[str] = None
+
+    # OCR engine: online | batch | local
+    ocr_engine: str = "online"
+    docai_batch_output_prefix: str = "docai_batch"
+    docai_batch_window_s: int = 2
+    docai_batch_max_docs: int = 500
+    docai_batch_timeout_s: int = 1800
+    ocr_local_dir: str = ""
+
+    # OCR cache
+    ocr_cache_enabled: bool = True
+    ocr_cache_dir: str = "~/.cache/medbill_rag/ocr"
+    ocr_cache_max_mb: int = 512
+    ocr_cache_shared: bool = False
+
+    # OCR text compaction before prompts (raw text is still uploaded)
+    ocr_compact_enabled: bool = True
+    ocr_compact_min_repeats: int = 3
+
+    # LLM response cache
+    llm_cache_enabled: bool = True
+    llm_cache_dir: str = "~/.cache/medbill_rag/llm"
+    llm_cache_max_mb: int = 256
+    llm_cache_max_age_hours: int = 24 * 7
+    llm_cache_disable_stages: str = ""
+
+    # KB retrieval: top-k chunks under a token budget (KB_TOP_K=0 -> whole KB)
+    kb_top_k: int = 8
+    kb_token_budget: int = 3000
+    # findings prompt: token budget shared by EOB / itemized / statement text
+    prompt_bill_token_budget: int = 8000
+    # itemized bill: parsed line-item table instead of OCR text when coverage is high enough
+    line_items_enabled: bool = True
+    line_items_min_coverage_pct: int = 60
+    # build_price_cash_lite.py output (empty = no price lookup); campus override
+    price_index_path: str = ""
+    price_campus: str = ""
+
+    # Vertex AI adaptive concurrency (per model+location) and retry on 429/5xx
+    rate_limit_initial: int = 8
+    rate_limit_min: int = 1
+    rate_limit_max: int = 64
+    rate_limit_max_retries: int = 5
+    rate_limit_backoff_max_s: int = 60
+
+    # Hedged LLM requests (async unary calls only)
+    hedge_enabled: bool = False
+    hedge_percentile: int = 95
+    hedge_budget_pct: int = 10
+    hedge_min_samples: int = 20
+
+    # Per-bill deadline (0 = none) and the minimum budget left to start an optional stage
+    bill_deadline_s: int = 0
+    deadline_stage_min_s: int = 30
+
+    # Local letter redaction; LLM second pass only when coverage is below the threshold
+    redaction_min_coverage_pct: int = 100
+    redaction_llm_fallback: bool = False
+
+    # Per-stage model routing ("stage=model,..." and/or a JSON file); unrouted stages use model_id
+    model_routes: str = ""
+    model_routes_file: str = ""
+
+    # Concurrency
+    ocr_max_workers: int = 3
+    stage_max_workers: int = 4
+    batch_concurrency: int = 4
+    # keep-alive connections per REST transport pool
+    rest_pool_size: int = 32
+
     @classmethod
     def from_env(cls) -> "Config":
         # Prefer new correct vars; fall back to older ones if present
@@ -97,6 +169,7 @@ class Config:
 
             docai_location=_opt("DOCAI_LOCATION", "us"),
             docai_processor_id=_req("DOCAI_PROCESSOR_ID"),
+            docai_processor_version=os.getenv("DOCAI_PROCESSOR_VERSION") or None,
 
             use_vertex=_opt_bool("USE_VERTEX", True),
 
@@ -104,6 +177,60 @@ class Config:
             annual_income_range=income_range,
             annual_income_usd=annual_income_usd_val,
             output_file_header=_opt("OUTPUT_FILE_HEADER", ""),
+
+            ocr_engine=_opt("OCR_ENGINE", "online"),
+            docai_batch_output_prefix=_opt("DOCAI_BATCH_OUTPUT_PREFIX", "docai_batch"),
+            docai_batch_window_s=_opt_int("DOCAI_BATCH_WINDOW_S", 2),
+            docai_batch_max_docs=_opt_int("DOCAI_BATCH_MAX_DOCS", 500),
+            docai_batch_timeout_s=_opt_int("DOCAI_BATCH_TIMEOUT_S", 1800),
+            ocr_local_dir=_opt("OCR_LOCAL_DIR", ""),
+
+            ocr_cache_enabled=_opt_bool("OCR_CACHE", True),
+            ocr_cache_dir=_opt("OCR_CACHE_DIR", "~/.cache/medbill_rag/ocr"),
+            ocr_cache_max_mb=_opt_int("OCR_CACHE_MAX_MB", 512),
+            ocr_cache_shared=_opt_bool("OCR_CACHE_SHARED", False),
+
+            ocr_compact_enabled=_opt_bool("OCR_COMPACT", True),
+            ocr_compact_min_repeats=_opt_int("OCR_COMPACT_MIN_REPEATS", 3),
+
+            llm_cache_enabled=_opt_bool("LLM_CACHE", True),
+            llm_cache_dir=_opt("LLM_CACHE_DIR", "~/.cache/medbill_rag/llm"),
+            llm_cache_max_mb=_opt_int("LLM_CACHE_MAX_MB", 256),
+            llm_cache_max_age_hours=_opt_int("LLM_CACHE_MAX_AGE_HOURS", 24 * 7),
+            llm_cache_disable_stages=_opt("LLM_CACHE_DISABLE_STAGES", ""),
+
+            kb_top_k=_opt_int("KB_TOP_K", 8),
+            kb_token_budget=_opt_int("KB_TOKEN_BUDGET", 3000),
+            prompt_bill_token_budget=_opt_int("PROMPT_BILL_TOKEN_BUDGET", 8000),
+            line_items_enabled=_opt_bool("LINE_ITEMS", True),
+            line_items_min_coverage_pct=_opt_int("LINE_ITEMS_MIN_COVERAGE_PCT", 60),
+            price_index_path=_opt("PRICE_INDEX", ""),
+            price_campus=_opt("PRICE_CAMPUS", ""),
+
+            rate_limit_initial=_opt_int("RATE_LIMIT_INITIAL", 8),
+            rate_limit_min=_opt_int("RATE_LIMIT_MIN", 1),
+            rate_limit_max=_opt_int("RATE_LIMIT_MAX", 64),
+            rate_limit_max_retries=_opt_int("RATE_LIMIT_MAX_RETRIES", 5),
+            rate_limit_backoff_max_s=_opt_int("RATE_LIMIT_BACKOFF_MAX_S", 60),
+
+            hedge_enabled=_opt_bool("HEDGE", False),
+            hedge_percentile=_opt_int("HEDGE_PERCENTILE", 95),
+            hedge_budget_pct=_opt_int("HEDGE_BUDGET_PCT", 10),
+            hedge_min_samples=_opt_int("HEDGE_MIN_SAMPLES", 20),
+
+            bill_deadline_s=_opt_int("BILL_DEADLINE_S", 0),
+            deadline_stage_min_s=_opt_int("DEADLINE_STAGE_MIN_S", 30),
+
+            redaction_min_coverage_pct=_opt_int("REDACTION_MIN_COVERAGE_PCT", 100),
+            redaction_llm_fallback=_opt_bool("REDACTION_LLM_FALLBACK", False),
+
+            model_routes=_opt("MODEL_ROUTES", ""),
+            model_routes_file=_opt("MODEL_ROUTES_FILE", ""),
+
+            ocr_max_workers=_opt_int("OCR_MAX_WORKERS", 3),
+            stage_max_workers=_opt_int("STAGE_MAX_WORKERS", 4),
+            batch_concurrency=_opt_int("BATCH_CONCURRENCY", 4),
+            rest_pool_size=_opt_int("REST_POOL_SIZE", 32),
         )
 
 
@@ -127,6 +254,7 @@ class _SettingsProxy:
             "BUCKET_KB": "bucket_kb",
             "DOCAI_LOCATION": "docai_location",
             "DOCAI_PROCESSOR_ID": "docai_processor_id",
+            "DOCAI_PROCESSOR_VERSION": "docai_processor_version",
             "USE_VERTEX": "use_vertex",
 
             # correct user profile keys
@@ -136,6 +264,63 @@ class _SettingsProxy:
             # output file header
             "OUTPUT_FILE_HEADER": "output_file_header",
 
+            # OCR engine
+            "OCR_ENGINE": "ocr_engine",
+            "OCR_LOCAL_DIR": "ocr_local_dir",
+
+            # OCR cache
+            "OCR_CACHE": "ocr_cache_enabled",
+            "OCR_CACHE_DIR": "ocr_cache_dir",
+            "OCR_CACHE_MAX_MB": "ocr_cache_max_mb",
+            "OCR_CACHE_SHARED": "ocr_cache_shared",
+
+            # OCR compaction
+            "OCR_COMPACT": "ocr_compact_enabled",
+            "OCR_COMPACT_MIN_REPEATS": "ocr_compact_min_repeats",
+
+            # LLM response cache
+            "LLM_CACHE": "llm_cache_enabled",
+            "LLM_CACHE_DIR": "llm_cache_dir",
+            "LLM_CACHE_MAX_MB": "llm_cache_max_mb",
+            "LLM_CACHE_MAX_AGE_HOURS": "llm_cache_max_age_hours",
+            "LLM_CACHE_DISABLE_STAGES": "llm_cache_disable_stages",
+
+            # KB retrieval
+            "KB_TOP_K": "kb_top_k",
+            "KB_TOKEN_BUDGET": "kb_token_budget",
+            "PROMPT_BILL_TOKEN_BUDGET": "prompt_bill_token_budget",
+            "LINE_ITEMS": "line_items_enabled",
+            "LINE_ITEMS_MIN_COVERAGE_PCT": "line_items_min_coverage_pct",
+            "PRICE_INDEX": "price_index_path",
+            "PRICE_CAMPUS": "price_campus",
+
+            # rate limiting
+            "RATE_LIMIT_INITIAL": "rate_limit_initial",
+            "RATE_LIMIT_MIN": "rate_limit_min",
+            "RATE_LIMIT_MAX": "rate_limit_max",
+            "RATE_LIMIT_MAX_RETRIES": "rate_limit_max_retries",
+            "RATE_LIMIT_BACKOFF_MAX_S": "rate_limit_backoff_max_s",
+
+            # hedging
+            "HEDGE": "hedge_enabled",
+            "HEDGE_PERCENTILE": "hedge_percentile",
+            "HEDGE_BUDGET_PCT": "hedge_budget_pct",
+            "HEDGE_MIN_SAMPLES": "hedge_min_samples",
+
+            # deadline
+            "BILL_DEADLINE_S": "bill_deadline_s",
+            "DEADLINE_STAGE_MIN_S": "deadline_stage_min_s",
+            "REDACTION_MIN_COVERAGE_PCT": "redaction_min_coverage_pct",
+            "REDACTION_LLM_FALLBACK": "redaction_llm_fallback",
+            "MODEL_ROUTES": "model_routes",
+            "MODEL_ROUTES_FILE": "model_routes_file",
+
+            # concurrency
+            "OCR_MAX_WORKERS": "ocr_max_workers",
+            "STAGE_MAX_WORKERS": "stage_max_workers",
+            "BATCH_CONCURRENCY": "batch_concurrency",
+            "REST_POOL_SIZE": "rest_pool_size",
+
             # allow direct
             "use_vertex": "use_vertex",
         }
@@ -0,0 +1,74 @@
+"""
+Per-bill deadline propagation.
+
+run_bill_folder(..., deadline_s=N) (or BILL_DEADLINE_S) opens a deadline scope; it is
+carried in a contextvar, so it follows the bill into asyncio tasks and to_thread calls
+without threading it through every signature. Call sites turn it into per-call
+timeouts with call_timeout(default):
+
+- no deadline: the call's usual timeout (`default`)
+- deadline: min(remaining, default); DeadlineExceeded once the budget is spent
+- floor: never less than `floor` and never raises (used to save artifacts already paid for)
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """The bill's time budget is spent."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None, floor: Optional[float] = None) -> float:
+        r = self.remaining()
+        if cap is not None:
+            r = min(r, cap)
+        if floor is not None:
+            return max(r, floor)
+        if r <= 0:
+            raise DeadlineExceeded(f"deadline of {self.seconds:g}s exceeded")
+        return r
+
+
+_current: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar("medbill_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    d = _current.get()
+    return d.remaining() if d is not None else None
+
+
+def call_timeout(default: Optional[float] = None, floor: Optional[float] = None) -> Optional[float]:
+    d = _current.get()
+    if d is None:
+        return default
+    return d.timeout(default, floor)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Install a deadline for the current context (no-op for None / 0)."""
+    if not seconds:
+        yield None
+        return
+    token = _current.set(Deadline(seconds))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
@@ -0,0 +1,143 @@
+"""
+Small on-disk text cache shared by the OCR and LLM response caches.
+
+- one file per key (<dir>/<key[:2]>/<key><suffix>), written atomically
+- size cap: least-recently-used entries (atime, set explicitly on every hit) are evicted,
+  down to EVICT_TO_FRACTION of the cap
+- optional age cap: entries older than max_age_seconds (mtime = write time) are dropped
+- puts keep a running byte total (initialised from one directory scan); the directory is only
+  walked when the total is over the cap or every SCAN_EVERY_PUTS puts (age cap, writes from
+  other processes sharing the directory)
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+SCAN_EVERY_PUTS = 256
+EVICT_TO_FRACTION = 0.9
+
+
+class DiskCache:
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        max_age_seconds: Optional[float] = None,
+        suffix: str = ".txt",
+    ):
+        self.directory = Path(directory).expanduser()
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._total: Optional[int] = None  # bytes on disk; None until the first scan
+        self._puts = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def _expired(self, mtime: float, now: float) -> bool:
+        return bool(self.max_age_seconds) and now - mtime > self.max_age_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        p = self._path(key)
+        try:
+            st = p.stat()
+            now = time.time()
+            if self._expired(st.st_mtime, now):
+                p.unlink()
+                self._account(-st.st_size)
+                return None
+            text = p.read_text(encoding="utf-8")
+            # LRU: atime = last use, mtime stays = write time
+            os.utime(p, (now, st.st_mtime))
+        except OSError:
+            return None
+        return text
+
+    def _account(self, delta: int) -> None:
+        with self._lock:
+            if self._total is not None:
+                self._total += delta
+
+    def put(self, key: str, text: str) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            old_size = p.stat().st_size
+        except OSError:
+            old_size = 0
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, p)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        try:
+            new_size = p.stat().st_size
+        except OSError:
+            new_size = 0
+        with self._lock:
+            self._puts += 1
+            if self._total is not None:
+                self._total += new_size - old_size
+            scan = (
+                self._total is None
+                or (self.max_bytes > 0 and self._total > self.max_bytes)
+                or self._puts % SCAN_EVERY_PUTS == 0
+            )
+        if scan:
+            self.evict()
+
+    def evict(self) -> None:
+        # one walk at a time; puts arriving meanwhile only update the running total
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._evict()
+        finally:
+            self._evict_lock.release()
+
+    def _evict(self) -> None:
+        if not self.directory.exists():
+            with self._lock:
+                self._total = 0
+            return
+        now = time.time()
+        entries = []
+        total = 0
+        for p in self.directory.glob(f"*/*{self.suffix}"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if self._expired(st.st_mtime, now):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+                continue
+            entries.append((st.st_atime, st.st_size, p))
+            total += st.st_size
+        if self.max_bytes > 0 and total > self.max_bytes:
+            # evict below the cap so the next puts do not trigger another walk right away
+            target = int(self.max_bytes * EVICT_TO_FRACTION)
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                try:
+                    p.unlink()
+                    total -= size
+                except OSError:
+                    continue
+                if total <= target:
+                    break
+        with self._lock:
+            self._total = total
@@ -1,7 +1,7 @@
 import json
-from .client import get_genai_client
-from .config import settings
-from .rest_client import generate_content as generate_content_rest
+from typing import Any, Dict, List, Tuple
+
+from .model_router import generate, generate_async
 
 EXTRACT_PROMPT = """
 You are extracting structured data from US medical billing documents.
@@ -20,19 +20,122 @@ Return JSON ONLY with keys:
 If unknown, use null.
 """
 
+# Bill-level fields merged into meta.json (first non-null value wins)
+META_KEYS = [
+    "provider_name",
+    "provider_state",
+    "payer_name",
+    "plan_name",
+    "dos_from",
+    "dos_to",
+    "total_charge",
+    "patient_responsibility",
+]
+
+MULTI_EXTRACT_PROMPT = """
+You are extracting structured data from a set of US medical billing documents that belong to ONE bill.
+Each document is delimited by [DOCUMENT n: LABEL] ... [END DOCUMENT n]; LABEL is a filename-based hint only.
+
+Return JSON ONLY with this structure:
+{
+  "documents": [
+    {
+      "index": n,
+      "doc_type": one of ["EOB","ITEMIZED","STATEMENT","UNKNOWN"],
+      "provider_name", "provider_state", "payer_name", "plan_name",
+      "dos_from", "dos_to", "total_charge", "patient_responsibility",
+      "is_out_of_network_mentioned": boolean
+    }
+  ],
+  "meta": {
+    "provider_name", "provider_state", "payer_name", "plan_name",
+    "dos_from", "dos_to", "total_charge", "patient_responsibility",
+    "is_out_of_network_mentioned": boolean
+  }
+}
+
+- One "documents" entry per input document, in input order.
+- "meta" is the best bill-level value for each field across all documents
+  (prefer the STATEMENT for patient_responsibility, the EOB for payer/plan, the ITEMIZED bill for total_charge).
+If unknown, use null.
+"""
+
+
+def _generate_json(stage: str, contents: list):
+    return generate(stage, contents, {"response_mime_type": "application/json"})
+
+
+async def _generate_json_async(stage: str, contents: list):
+    return await generate_async(stage, contents, {"response_mime_type": "application/json"})
+
+
 def extract_from_text(text: str) -> dict:
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if settings.model_id == "gemini-3-pro-preview":
-        resp = generate_content_rest(
-            model_id=settings.model_id,
-            contents=[EXTRACT_PROMPT, text],
-            config={"response_mime_type": "application/json"},
-        )
-    else:
-        client = get_genai_client()
-        resp = client.models.generate_content(
-            model=settings.model_id,
-            contents=[EXTRACT_PROMPT, text],
-            config={"response_mime_type": "application/json"},
-        )
+    """Single-document extraction (one Gemini call per text)."""
+    resp = _generate_json("extract", [EXTRACT_PROMPT, text])
+    return json.loads(resp.text)
+
+
+async def extract_from_text_async(text: str) -> dict:
+    resp = await _generate_json_async("extract", [EXTRACT_PROMPT, text])
     return json.loads(resp.text)
+
+
+def _documents_block(docs: Dict[str, str]) -> Tuple[List[str], str]:
+    labels = [k for k, t in docs.items() if t and t.strip()]
+    parts = []
+    for n, label in enumerate(labels, 1):
+        parts.append(f"[DOCUMENT {n}: {label}]\n{docs[label]}\n[END DOCUMENT {n}]")
+    return labels, "\n\n".join(parts)
+
+
+def _merge_meta(documents: List[dict]) -> dict:
+    meta = {k: None for k in META_KEYS}
+    for m in documents:
+        if not isinstance(m, dict):
+            continue
+        for k in META_KEYS:
+            if meta.get(k) is None and m.get(k) is not None:
+                meta[k] = m.get(k)
+    return meta
+
+
+def _normalize_multi(labels: List[str], data: Any) -> dict:
+    documents = data.get("documents") if isinstance(data, dict) else None
+    if not isinstance(documents, list):
+        documents = []
+    documents = [d for d in documents if isinstance(d, dict)]
+    for n, d in enumerate(documents):
+        idx = d.get("index")
+        pos = idx - 1 if isinstance(idx, int) and 1 <= idx <= len(labels) else n
+        d["label"] = labels[pos] if pos < len(labels) else None
+
+    merged = _merge_meta(documents)
+    model_meta = data.get("meta") if isinstance(data, dict) else None
+    if isinstance(model_meta, dict):
+        for k in META_KEYS:
+            if model_meta.get(k) is not None:
+                merged[k] = model_meta[k]
+        if "is_out_of_network_mentioned" in model_meta:
+            merged["is_out_of_network_mentioned"] = model_meta["is_out_of_network_mentioned"]
+    return {"documents": documents, "meta": merged}
+
+
+def extract_from_documents(docs: Dict[str, str]) -> dict:
+    """
+    Multi-document extraction in ONE Gemini call.
+    docs: {label: text} (e.g. {"EOB": ..., "ITEMIZED": ..., "STATEMENT": ...}); empty texts are skipped.
+    Returns {"documents": [per-document fields + "label"], "meta": merged bill-level fields}.
+    """
+    labels, block = _documents_block(docs)
+    if not labels:
+        return {"documents": [], "meta": _merge_meta([])}
+    resp = _generate_json("extract_multi", [MULTI_EXTRACT_PROMPT, block])
+    return _normalize_multi(labels, json.loads(resp.text))
+
+
+async def extract_from_documents_async(docs: Dict[str, str]) -> dict:
+    labels, block = _documents_block(docs)
+    if not labels:
+        return {"documents": [], "meta": _merge_meta([])}
+    resp = await _generate_json_async("extract_multi", [MULTI_EXTRACT_PROMPT, block])
+    return _normalize_multi(labels, json.loads(resp.text))
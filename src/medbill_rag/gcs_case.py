@@ -1,20 +1,30 @@
+import asyncio
 import json
-from google.cloud import storage
+from .client_registry import storage_client
 from .config import settings
+from .deadline import call_timeout
+
+GCS_TIMEOUT_S = 60
+# artifacts already paid for are still saved when the bill deadline is (nearly) spent
+GCS_MIN_TIMEOUT_S = 15
+
+
+def _upload_timeout():
+    return call_timeout(GCS_TIMEOUT_S, floor=GCS_MIN_TIMEOUT_S)
 
 def _bucket():
     if not settings.bucket_case:
         raise RuntimeError("BUCKET_CASE is not set")
-    return storage.Client().bucket(settings.bucket_case)
+    return storage_client().bucket(settings.bucket_case)
 
 def list_bill_blobs(bill_folder_id: str):
     prefix = f"bills/{bill_folder_id}/"
-    client = storage.Client()
-    return list(client.list_blobs(settings.bucket_case, prefix=prefix))
+    client = storage_client()
+    return list(client.list_blobs(settings.bucket_case, prefix=prefix, timeout=call_timeout(GCS_TIMEOUT_S)))
 
 def upload_text_to_bill_outputs(bill_folder_id: str, filename: str, text: str, content_type="text/plain; charset=utf-8"):
     blob = _bucket().blob(f"bills/{bill_folder_id}/outputs/{filename}")
-    blob.upload_from_string(text, content_type=content_type)
+    blob.upload_from_string(text, content_type=content_type, timeout=_upload_timeout())
 
 def upload_json_to_bill_outputs(bill_folder_id: str, filename: str, data: dict):
     upload_text_to_bill_outputs(
@@ -23,3 +33,44 @@ def upload_json_to_bill_outputs(bill_folder_id: str, filename: str, data: dict):
         json.dumps(data, ensure_ascii=False, indent=2),
         content_type="application/json; charset=utf-8",
     )
+
+# google-cloud-storage has no asyncio API; the async variants hand the blocking
+# call to the loop's default executor so the event loop itself never blocks.
+async def upload_text_to_bill_outputs_async(bill_folder_id: str, filename: str, text: str, content_type="text/plain; charset=utf-8"):
+    await asyncio.to_thread(upload_text_to_bill_outputs, bill_folder_id, filename, text, content_type)
+
+async def upload_json_to_bill_outputs_async(bill_folder_id: str, filename: str, data: dict):
+    await asyncio.to_thread(upload_json_to_bill_outputs, bill_folder_id, filename, data)
+
+
+class BillOutputWriter:
+    """
+    Incremental upload of one outputs/ artifact (GCS resumable upload via blob.open("w")).
+    Text is sent in CHUNK_SIZE requests while it is being generated; the object becomes
+    visible when close() finalizes the upload (an abandoned upload leaves no object).
+    """
+    CHUNK_SIZE = 256 * 1024  # resumable uploads need multiples of 256 KiB
+
+    def __init__(self, bill_folder_id: str, filename: str, content_type="text/plain; charset=utf-8"):
+        self._blob = _bucket().blob(f"bills/{bill_folder_id}/outputs/{filename}")
+        self._content_type = content_type
+        self._f = None
+
+    def _open(self):
+        return self._blob.open(
+            "w", chunk_size=self.CHUNK_SIZE, content_type=self._content_type, timeout=_upload_timeout(),
+        )
+
+    async def write(self, text: str):
+        if self._f is None:
+            self._f = await asyncio.to_thread(self._open)
+        await asyncio.to_thread(self._f.write, text)
+
+    async def close(self):
+        if self._f is None:
+            # nothing was streamed: still create the (empty) artifact
+            await asyncio.to_thread(
+                self._blob.upload_from_string, "", content_type=self._content_type, timeout=_upload_timeout(),
+            )
+            return
+        await asyncio.to_thread(self._f.close)
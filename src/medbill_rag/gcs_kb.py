@@ -1,23 +1,9 @@
-from pathlib import Path
+from .kb_bundle import load_kb_bundle
 
-def load_local_global_kb_text(rag_base_dir: str) -> str:
-    base = Path(rag_base_dir)
-    if not base.exists():
-        return ""
-
-    parts = []
-    for p in sorted(base.rglob("*.md")):
-        try:
-            parts.append(f"\n\n# FILE: {p.relative_to(base)}\n")
-            parts.append(p.read_text(encoding="utf-8"))
-        except Exception:
-            continue
 
-    for p in sorted(base.rglob("*.csv")):
-        try:
-            parts.append(f"\n\n# FILE: {p.relative_to(base)}\n")
-            parts.append(p.read_text(encoding="utf-8"))
-        except Exception:
-            continue
-
-    return "\n".join(parts)
+def load_local_global_kb_text(rag_base_dir: str) -> str:
+    """
+    Global KB text for rag_base_dir, served from the precompiled bundle (see kb_bundle).
+    The bundle is built on first use if the image did not ship one.
+    """
+    return load_kb_bundle(rag_base_dir).text
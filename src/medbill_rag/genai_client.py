@@ -1,13 +1,9 @@
-from google import genai
+from .client_registry import genai_client
 from .config import Config
 
 
 def get_genai_client(cfg: Config):
     """
-    Vertex AI Gemini client (no Developer API key).
+    Vertex AI Gemini client (no Developer API key), shared process-wide.
     """
-    return genai.Client(
-        vertexai=True,
-        project=cfg.project_id,
-        location=cfg.location,
-    )
+    return genai_client(cfg.project_id, cfg.location)
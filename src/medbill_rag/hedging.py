@@ -0,0 +1,190 @@
+"""
+Request hedging for async LLM calls.
+
+Hedging works per attempt inside rate_limit.call_with_backoff_async (pass stage=...): if an
+attempt has not answered after the HEDGE_PERCENTILE latency of recent attempts for the same
+(model, stage), one duplicate is sent and the first successful result wins (the other is
+cancelled). Backoff sleeps and retries are never part of an attempt, so a call waiting out
+a 429/503 is not duplicated. Hedges are capped by a budget: at most HEDGE_BUDGET_PCT% of
+attempts (plus a small burst) may be duplicated, and the duplicate needs a limiter slot that
+is free right away, so a slow or throttled backend never sees doubled load.
+
+- HEDGE=true enables it (off by default); HEDGE_MIN_SAMPLES attempts are observed first
+- every completed attempt (primary or hedge) records its latency from its own start; a
+  primary cancelled because its hedge won is recorded as a censored sample of at least the
+  threshold, so slow primaries keep the percentile from drifting down
+- only unary async calls are hedged; streams write artifacts as they go and sync calls
+  cannot be cancelled, so they are never duplicated
+- stats() exposes per-key latency percentile and hedges sent / won
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .config import Config, settings
+
+WINDOW = 200
+BUDGET_BURST = 2.0
+
+
+class LatencyTracker:
+    """Recent attempt latencies (seconds) for one (model, stage)."""
+
+    def __init__(self, window: int = WINDOW):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._samples)
+        if not values:
+            return None
+        # nearest-rank
+        k = max(1, math.ceil(p / 100 * len(values)))
+        return values[k - 1]
+
+
+class HedgeBudget:
+    """Token bucket: each primary attempt earns pct/100 of a hedge, a hedge spends one."""
+
+    def __init__(self, pct: float):
+        self.ratio = max(0.0, pct) / 100
+        self._tokens = BUDGET_BURST
+        self._lock = threading.Lock()
+
+    def on_call(self) -> None:
+        with self._lock:
+            self._tokens = min(BUDGET_BURST, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class _Key:
+    def __init__(self, pct: float):
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget(pct)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+
+_lock = threading.Lock()
+_keys: Dict[Tuple[str, str], _Key] = {}
+
+
+def _get(model_id: str, stage: str, cfg: Config) -> _Key:
+    key = (model_id, stage)
+    k = _keys.get(key)
+    if k is None:
+        with _lock:
+            k = _keys.setdefault(key, _Key(cfg.hedge_budget_pct))
+    return k
+
+
+def stats(p: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    cfg = settings._get()
+    p = p if p is not None else cfg.hedge_percentile
+    return {
+        f"{model}/{stage}": {
+            "calls": k.calls,
+            "hedges": k.hedges,
+            "hedge_wins": k.hedge_wins,
+            f"p{int(p)}_s": round(k.latency.percentile(p) or 0.0, 3),
+        }
+        for (model, stage), k in list(_keys.items())
+    }
+
+
+async def _timed(call: Callable[[], Awaitable[Any]]) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    result = await call()
+    return result, time.perf_counter() - t0
+
+
+async def hedged_attempt(
+    model_id: str,
+    stage: str,
+    call: Callable[[], Awaitable[Any]],
+    limiter,
+    cfg: Optional[Config] = None,
+    on_error: Optional[Callable[[BaseException], None]] = None,
+) -> Any:
+    """
+    Await one attempt of call(), for which the caller holds a slot of limiter; send one
+    duplicate (on a second slot, only if one is free) if it is slower than the hedge
+    threshold. on_error(exc) sees failures of attempts that are not raised to the caller.
+    """
+    cfg = cfg or settings._get()
+    if not cfg.hedge_enabled:
+        return await call()
+
+    k = _get(model_id, stage, cfg)
+    k.calls += 1
+    k.budget.on_call()
+    threshold = k.latency.percentile(cfg.hedge_percentile) if len(k.latency) >= cfg.hedge_min_samples else None
+
+    t0 = time.perf_counter()
+    primary = asyncio.ensure_future(_timed(call))
+    tasks = [primary]
+    hedge_slot = False
+    try:
+        if threshold is not None:
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if not done and limiter.try_acquire():
+                if k.budget.try_spend():
+                    hedge_slot = True
+                    k.hedges += 1
+                    tasks.append(asyncio.ensure_future(_timed(call)))
+                else:
+                    limiter.release()
+        return await _first_success(k, tasks, on_error)
+    finally:
+        if hedge_slot and not primary.done():
+            # censored: the primary took at least this long (and at least the threshold)
+            k.latency.record(max(time.perf_counter() - t0, threshold))
+        # losers (and everything, if we were cancelled) are cancelled
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        if hedge_slot:
+            limiter.release()
+
+
+async def _first_success(k: _Key, tasks: list, on_error=None) -> Any:
+    pending = set(tasks)
+    errors: list = []
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        winner = None
+        for task in sorted(done, key=tasks.index):
+            if task.exception() is not None:
+                errors.append(task.exception())
+                continue
+            result, elapsed = task.result()
+            k.latency.record(elapsed)
+            if winner is None:
+                winner = (task, result)
+        if winner is not None:
+            if winner[0] is not tasks[0]:
+                k.hedge_wins += 1
+            for e in errors if on_error else ():
+                on_error(e)
+            return winner[1]
+    for e in errors[1:] if on_error else ():
+        on_error(e)
+    raise errors[0]
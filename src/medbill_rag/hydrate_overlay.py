@@ -1,12 +1,12 @@
 import json
-from google.cloud import storage
+from .client_registry import storage_client
 from .config import settings
 from .ids import hospital_id as _hid, payer_id as _pid
 
 def _kb_bucket():
     if not settings.bucket_kb:
         raise RuntimeError("BUCKET_KB is not set")
-    return storage.Client().bucket(settings.bucket_kb)
+    return storage_client().bucket(settings.bucket_kb)
 
 def ensure_hospital_overlay(provider_name: str, state: str | None):
     hid = _hid(provider_name, state)
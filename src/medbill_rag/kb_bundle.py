@@ -0,0 +1,217 @@
+"""
+Precompiled knowledge-base bundle.
+
+Compiles rag_base/ (*.md then *.csv, same order and layout as the old per-bill rglob
+loader) into a single versioned file:
+
+    <JSON header line>\\n<UTF-8 KB text>
+
+The header carries the bundle format version, a sha256 content hash and the source file
+list with mtimes. The pipeline memory-maps the bundle instead of re-reading rag_base for
+every bill; long-running processes re-check source mtimes at most every
+KB_BUNDLE_CHECK_S seconds and rebuild only when something changed.
+
+Build at image build time:
+    python -m medbill_rag.kb_bundle rag_base
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BUNDLE_FORMAT = "medbill-kb-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = ".kbbundle"
+KB_BUNDLE_CHECK_S = 30
+
+
+def default_bundle_path(rag_base_dir: str) -> Path:
+    base = Path(rag_base_dir)
+    return base.parent / f"{base.name}{BUNDLE_SUFFIX}"
+
+
+def _source_files(base: Path) -> List[Path]:
+    return sorted(base.rglob("*.md")) + sorted(base.rglob("*.csv"))
+
+
+def _dir_mtimes(base: Path) -> Dict[str, float]:
+    # directory mtimes change when files are added/removed/renamed
+    out = {".": base.stat().st_mtime}
+    for p in base.rglob("*"):
+        if p.is_dir():
+            out[str(p.relative_to(base))] = p.stat().st_mtime
+    return out
+
+
+def compile_kb_text(rag_base_dir: str) -> Tuple[str, List[dict]]:
+    base = Path(rag_base_dir)
+    parts = []
+    files = []
+    for p in _source_files(base):
+        try:
+            text = p.read_text(encoding="utf-8")
+        except Exception:
+            continue
+        rel = str(p.relative_to(base))
+        parts.append(f"\n\n# FILE: {rel}\n")
+        parts.append(text)
+        st = p.stat()
+        files.append({"path": rel, "size": st.st_size, "mtime": st.st_mtime})
+    return "\n".join(parts), files
+
+
+def build_bundle(rag_base_dir: str, out_path: Optional[str] = None) -> Path:
+    base = Path(rag_base_dir)
+    text, files = compile_kb_text(rag_base_dir)
+    data = text.encode("utf-8")
+    header = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "hash": hashlib.sha256(data).hexdigest(),
+        "built_at": time.time(),
+        "files": files,
+        "dirs": _dir_mtimes(base),
+    }
+    out = Path(out_path) if out_path else default_bundle_path(rag_base_dir)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(json.dumps(header, ensure_ascii=False).encode("utf-8"))
+        f.write(b"\n")
+        f.write(data)
+    os.replace(tmp, out)
+    return out
+
+
+class KbBundle:
+    """A loaded bundle: .hash, .header and lazily decoded .text (backed by mmap when possible)."""
+
+    def __init__(self, header: dict, body, path: Optional[Path] = None):
+        self.header = header
+        self.hash: str = header["hash"]
+        self.path = path
+        self._body = body  # mmap slice source or bytes
+        self._offset = 0
+        self._text: Optional[str] = None
+
+    @classmethod
+    def open(cls, path: Path) -> "KbBundle":
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        nl = mm.find(b"\n")
+        if nl < 0:
+            raise ValueError(f"not a KB bundle: {path}")
+        header = json.loads(bytes(mm[:nl]).decode("utf-8"))
+        if header.get("format") != BUNDLE_FORMAT or header.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"unsupported KB bundle: {path}")
+        b = cls(header, mm, path)
+        b._offset = nl + 1
+        return b
+
+    @classmethod
+    def empty(cls) -> "KbBundle":
+        b = cls({"hash": hashlib.sha256(b"").hexdigest(), "files": [], "dirs": {}}, b"")
+        b._text = ""
+        return b
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = bytes(self._body[self._offset:]).decode("utf-8")
+        return self._text
+
+    def is_stale(self, rag_base_dir: str) -> bool:
+        """Cheap check: stat known sources and directories, no file reads."""
+        base = Path(rag_base_dir)
+        if not base.exists():
+            return bool(self.header.get("files"))
+        try:
+            for rel, mtime in self.header.get("dirs", {}).items():
+                if (base / rel).stat().st_mtime != mtime:
+                    return True
+            for f in self.header.get("files", []):
+                st = (base / f["path"]).stat()
+                if st.st_mtime != f["mtime"] or st.st_size != f["size"]:
+                    return True
+            if len(self.header.get("dirs", {})) != len(_dir_mtimes(base)):
+                return True
+        except OSError:
+            return True
+        return False
+
+
+_lock = threading.Lock()
+# rag_base_dir -> (bundle, last check time)
+_loaded: Dict[str, tuple] = {}
+
+
+def _load_or_build(rag_base_dir: str, bundle_path: Path) -> KbBundle:
+    if bundle_path.exists():
+        try:
+            b = KbBundle.open(bundle_path)
+            if not b.is_stale(rag_base_dir):
+                return b
+        except (OSError, ValueError):
+            pass
+    try:
+        return KbBundle.open(build_bundle(rag_base_dir, str(bundle_path)))
+    except OSError:
+        # read-only location: keep an in-memory bundle
+        text, files = compile_kb_text(rag_base_dir)
+        data = text.encode("utf-8")
+        base = Path(rag_base_dir)
+        header = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "hash": hashlib.sha256(data).hexdigest(),
+            "files": files,
+            "dirs": _dir_mtimes(base),
+        }
+        b = KbBundle(header, data)
+        b._text = text
+        return b
+
+
+def load_kb_bundle(rag_base_dir: str, bundle_path: Optional[str] = None) -> KbBundle:
+    """
+    Process-wide bundle for rag_base_dir, built on first use if missing or stale.
+    Re-validated against source mtimes at most every KB_BUNDLE_CHECK_S seconds.
+    """
+    if not Path(rag_base_dir).exists():
+        return KbBundle.empty()
+    key = str(Path(rag_base_dir).resolve())
+    path = Path(bundle_path) if bundle_path else default_bundle_path(rag_base_dir)
+    now = time.monotonic()
+    hit = _loaded.get(key)
+    if hit and now - hit[1] < KB_BUNDLE_CHECK_S:
+        return hit[0]
+    with _lock:
+        hit = _loaded.get(key)
+        if hit and now - hit[1] < KB_BUNDLE_CHECK_S:
+            return hit[0]
+        if hit and not hit[0].is_stale(rag_base_dir):
+            bundle = hit[0]
+        else:
+            bundle = _load_or_build(rag_base_dir, path)
+        _loaded[key] = (bundle, now)
+        return bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m medbill_rag.kb_bundle", description="Compile rag_base into a KB bundle")
+    parser.add_argument("rag_base", nargs="?", default="rag_base")
+    parser.add_argument("-o", "--output", help=f"Bundle path (default: <rag_base>{BUNDLE_SUFFIX})")
+    args = parser.parse_args(argv)
+    out = build_bundle(args.rag_base, args.output)
+    b = KbBundle.open(out)
+    print(f"✅ KB bundle: {out} files={len(b.header['files'])} hash={b.hash[:12]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Lexical top-k retrieval over the KB bundle.
+
+The bundle (see kb_bundle) is split into chunks (markdown by heading / paragraph groups,
+CSV by row groups with the header repeated) and indexed in-process with BM25. The
+index is built once per bundle hash. A query built from the bill (OCR text + meta:
+payer, plan, provider, state, out-of-network mentions) selects the best chunks that
+fit in KB_TOKEN_BUDGET (at most KB_TOP_K); only those go into the findings prompt.
+"""
+import math
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import Config, settings
+from .kb_bundle import KbBundle
+from .prompt_packer import estimate_tokens
+
+CHUNK_TOKENS = 200
+CSV_CHUNK_ROWS = 20
+BM25_K1 = 1.5
+BM25_B = 0.75
+META_TERM_WEIGHT = 3.0
+
+_FILE_MARKER = re.compile(r"^# FILE: (.+)$", re.MULTILINE)
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have if in is it its of on or that the this to was "
+    "were will with you your we our not no".split()
+)
+
+# a bill that mentions any of these gets NSA / balance-billing terms added to its query
+_OON_PATTERNS = re.compile(
+    r"out[\s-]*of[\s-]*network|\boon\b|non[\s-]*participating|balance[\s-]*bill|surprise",
+    re.IGNORECASE,
+)
+_OON_TERMS = "out of network oon nsa no surprises act balance billing emergency"
+
+# the five findings angles: every bill gets a light baseline query over these
+_BASE_TERMS = "charity care financial assistance fap fpl 501r self pay cash discount network benefit deductible copay coinsurance"
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+@dataclass
+class Chunk:
+    id: str
+    source: str
+    text: str
+    tokens: int
+
+
+# ---- chunking ----
+def _split_files(kb_text: str) -> Iterable[Tuple[str, str]]:
+    marks = list(_FILE_MARKER.finditer(kb_text))
+    for i, m in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(kb_text)
+        yield m.group(1).strip(), kb_text[m.end():end].strip("\n")
+
+
+def _pack(prefix: str, blocks: List[str]) -> List[str]:
+    """Greedily join blocks into chunks of ~CHUNK_TOKENS, each starting with prefix."""
+    out, cur = [], []
+    size = estimate_tokens(prefix)
+    for block in blocks:
+        n = estimate_tokens(block)
+        if cur and size + n > CHUNK_TOKENS:
+            out.append("\n".join([prefix] + cur))
+            cur, size = [], estimate_tokens(prefix)
+        cur.append(block)
+        size += n
+    if cur:
+        out.append("\n".join([prefix] + cur))
+    return out
+
+
+def _chunk_markdown(source: str, text: str) -> List[str]:
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    para: List[str] = []
+
+    def flush():
+        if para:
+            sections[-1][1].append("\n".join(para))
+            para.clear()
+
+    for line in text.splitlines():
+        if line.startswith("#"):
+            flush()
+            sections.append((line.lstrip("#").strip(), []))
+        elif not line.strip():
+            flush()
+        else:
+            para.append(line)
+    flush()
+
+    out = []
+    for heading, paras in sections:
+        if not paras:
+            continue
+        prefix = f"# FILE: {source}" + (f" > {heading}" if heading else "")
+        out.extend(_pack(prefix, paras))
+    return out
+
+
+def _chunk_csv(source: str, text: str) -> List[str]:
+    lines = [l for l in text.splitlines() if l.strip()]
+    if not lines:
+        return []
+    header, rows = lines[0], lines[1:]
+    prefix = f"# FILE: {source}\n{header}"
+    out = []
+    for i in range(0, max(len(rows), 1), CSV_CHUNK_ROWS):
+        out.extend(_pack(prefix, rows[i:i + CSV_CHUNK_ROWS]))
+    return out
+
+
+def chunk_kb_text(kb_text: str) -> List[Chunk]:
+    chunks = []
+    for source, body in _split_files(kb_text):
+        parts = _chunk_csv(source, body) if source.lower().endswith(".csv") else _chunk_markdown(source, body)
+        for i, text in enumerate(parts):
+            chunks.append(Chunk(id=f"{source}#{i}", source=source, text=text, tokens=estimate_tokens(text)))
+    return chunks
+
+
+# ---- BM25 index ----
+class Bm25Index:
+    def __init__(self, chunks: List[Chunk]):
+        self.chunks = chunks
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        for i, c in enumerate(chunks):
+            tf = Counter(tokenize(c.text))
+            self.lengths.append(sum(tf.values()))
+            for term, n in tf.items():
+                self.postings.setdefault(term, []).append((i, n))
+        n_docs = len(chunks)
+        self.avgdl = (sum(self.lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            t: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+            for t, p in self.postings.items()
+        }
+
+    def score(self, query: Dict[str, float]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for term, qw in query.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for i, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[i] / (self.avgdl or 1)
+                s = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+                scores[i] = scores.get(i, 0.0) + qw * s
+        return scores
+
+
+_lock = threading.Lock()
+_indexes: Dict[str, Bm25Index] = {}
+
+
+def get_index(bundle: KbBundle) -> Bm25Index:
+    idx = _indexes.get(bundle.hash)
+    if idx is None:
+        with _lock:
+            idx = _indexes.get(bundle.hash)
+            if idx is None:
+                idx = Bm25Index(chunk_kb_text(bundle.text))
+                # keep only the current bundle's index
+                _indexes.clear()
+                _indexes[bundle.hash] = idx
+    return idx
+
+
+# ---- query ----
+def build_query(meta: Dict, bill_texts: Iterable[str], vocabulary: Optional[Dict] = None) -> Dict[str, float]:
+    """
+    Weighted query terms: meta fields (payer, plan, provider, state) weigh META_TERM_WEIGHT,
+    OCR terms weigh 1 + log(tf) (restricted to the KB vocabulary when given).
+    """
+    query: Dict[str, float] = {}
+
+    def add(terms: Iterable[str], weight: float):
+        for t in terms:
+            if vocabulary is None or t in vocabulary:
+                query[t] = max(query.get(t, 0.0), weight)
+
+    add(tokenize(_BASE_TERMS), 1.0)
+
+    ocr_tf: Counter = Counter()
+    oon = False
+    for text in bill_texts:
+        if not text:
+            continue
+        ocr_tf.update(tokenize(text))
+        oon = oon or bool(_OON_PATTERNS.search(text))
+    for t, n in ocr_tf.items():
+        if vocabulary is None or t in vocabulary:
+            query[t] = max(query.get(t, 0.0), 1.0 + math.log(n))
+
+    meta_text = " ".join(
+        str(meta.get(k) or "")
+        for k in ("payer_name", "plan_name", "provider_name", "provider_name_normalized", "provider_state")
+    )
+    add(tokenize(meta_text), META_TERM_WEIGHT)
+    if oon or meta.get("network_status") in ("out_of_network", "OON"):
+        add(tokenize(_OON_TERMS), META_TERM_WEIGHT)
+    return query
+
+
+def retrieve_kb(
+    bundle: KbBundle,
+    meta: Dict,
+    bill_texts: Iterable[str],
+    cfg: Optional[Config] = None,
+) -> Tuple[str, Dict]:
+    """
+    Returns (retrieved text, stats) with the top-k chunks under the token budget.
+    KB_TOP_K=0 disables retrieval and returns the whole KB.
+    """
+    cfg = cfg or settings._get()
+    if cfg.kb_top_k <= 0:
+        text = bundle.text
+        return text, {"mode": "full", "tokens": estimate_tokens(text)}
+
+    idx = get_index(bundle)
+    scores = idx.score(build_query(meta, bill_texts, idx.postings))
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    picked: List[Chunk] = []
+    used = 0
+    for i, s in ranked:
+        if len(picked) >= cfg.kb_top_k:
+            break
+        c = idx.chunks[i]
+        if s <= 0 or used + c.tokens > cfg.kb_token_budget:
+            continue
+        picked.append(c)
+        used += c.tokens
+
+    stats = {
+        "mode": "bm25",
+        "chunks": [c.id for c in picked],
+        "tokens": used,
+        "index_chunks": len(idx.chunks),
+    }
+    return "\n\n".join(c.text for c in picked), stats
@@ -0,0 +1,337 @@
+"""
+Local parser for itemized-bill OCR text -> typed line items (line_items.json).
+
+Each pattern (dates, money, revenue codes, CPT/HCPCS, quantities) runs once over the
+whole text and its matches are bucketed per line (bisect on line offsets), so the cost
+is a handful of regex scans regardless of line count. A line with an amount plus a
+date, revenue code or CPT/HCPCS code becomes a LineItem, unless it is a summary line
+(totals, payments, amount due) or account / address context (account number, remit to,
+PO box, zip), which always stay unparsed:
+
+    date (ISO), revenue_code, code (+ code_type, modifier), description, quantity,
+    unit_amount, total_amount, flags, confidence
+
+Flags: no_date, date_carried (from a date header line above), no_code, qty_inferred,
+amount_mismatch (qty x unit != total), multi_amount (3+ amounts on the line), credit,
+code_unanchored (an all-digit code with no revenue code, date or description on the line
+- could be any 5-digit number).
+confidence: high (date + code, amounts consistent), low (mismatch, code_unanchored or no
+code at all), medium otherwise.
+
+format_table() renders a compact pipe table for the findings prompt (plus unparsed
+lines that carry amounts, e.g. totals), used instead of the raw OCR text when at least
+LINE_ITEMS_MIN_COVERAGE_PCT of the amount lines were parsed.
+"""
+import re
+import time
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bill_patterns import MONEY
+from .config import Config, settings
+
+FORMAT_VERSION = 1
+TABLE_DESCRIPTION_CHARS = 40
+
+_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})\b|\b(\d{4})-(\d{2})-(\d{2})\b")
+_REVENUE = re.compile(r"\b0\d{3}\b")
+_CPT = re.compile(
+    r"\b(?P<code>\d{4}[0-9FTU]|[A-V]\d{4})(?:-(?P<mod>[0-9A-Z]{2}))?\b"
+)
+_QTY = re.compile(r"(?<![\w.$,/-])(?P<qty>\d{1,4}(?:\.\d{1,2})?)(?![\w.,/%-])")
+_SUMMARY = re.compile(
+    r"\b(?:sub\s*-?total|total|balance|amount\s+due|payments?|adjustments?|paid|deductible|"
+    r"coinsurance|copay|insurance|discount|previous|credit\s+balance)\b",
+    re.IGNORECASE,
+)
+# account / address context: 5-digit numbers there are account numbers, PO boxes, zips
+_NON_ITEM = re.compile(
+    r"\b(?:account|acct|remit|p\.?\s?o\.?\s*box|zip(?:\s*code)?|address|suite|guarantor|mrn|"
+    r"invoice|phone|fax)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[A-Za-z]{3,}")
+_AMOUNT_TOLERANCE = 0.011
+
+
+def _not_item(text: str) -> bool:
+    return bool(_SUMMARY.search(text) or _NON_ITEM.search(text))
+
+
+@dataclass
+class LineItem:
+    line: int                        # 1-based line number in the OCR text
+    date: Optional[str] = None       # ISO YYYY-MM-DD
+    revenue_code: Optional[str] = None
+    code: Optional[str] = None       # CPT / HCPCS
+    code_type: Optional[str] = None  # "CPT" | "HCPCS"
+    modifier: Optional[str] = None
+    description: str = ""
+    quantity: Optional[float] = None
+    unit_amount: Optional[float] = None
+    total_amount: Optional[float] = None
+    flags: List[str] = field(default_factory=list)
+    confidence: str = "medium"
+    # published prices for the code at this campus (see price_index)
+    cash_price: Optional[float] = None
+    cash_price_max: Optional[float] = None
+    gross_charge: Optional[float] = None
+
+
+@dataclass
+class ParseResult:
+    items: List[LineItem]
+    unparsed_amount_lines: List[Tuple[int, str]]  # (line, text) with $ but not an item
+    lines: int
+    ms: float
+
+    @property
+    def coverage(self) -> float:
+        """Share of amount lines (other than summary / account / address lines) that became items."""
+        misses = sum(1 for _, text in self.unparsed_amount_lines if not _not_item(text))
+        total = len(self.items) + misses
+        return len(self.items) / total if total else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        by_conf: Dict[str, int] = {}
+        for it in self.items:
+            by_conf[it.confidence] = by_conf.get(it.confidence, 0) + 1
+        return {
+            "items": len(self.items),
+            "lines": self.lines,
+            "coverage": round(self.coverage, 3),
+            "by_confidence": by_conf,
+            "items_total": round(sum(it.total_amount or 0.0 for it in self.items), 2),
+            "ms": round(self.ms, 2),
+        }
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "format_version": FORMAT_VERSION,
+            "summary": self.summary(),
+            "items": [asdict(it) for it in self.items],
+        }
+
+
+def _iso_date(m: "re.Match") -> Optional[str]:
+    if m.group(4):
+        y, mo, d = int(m.group(4)), int(m.group(5)), int(m.group(6))
+    else:
+        mo, d, y = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        if y < 100:
+            y += 2000
+    if not (1 <= mo <= 12 and 1 <= d <= 31):
+        return None
+    return f"{y:04d}-{mo:02d}-{d:02d}"
+
+
+def _amount(m: "re.Match") -> float:
+    value = float(m.group("num").replace(",", "") + "." + (m.group("cents") or "00"))
+    if m.group("neg") or m.group("suffix"):
+        value = -value
+    return value
+
+
+def _bucket(pattern: "re.Pattern", text: str, starts: List[int]) -> Dict[int, List["re.Match"]]:
+    """One scan of the whole text; matches grouped by 0-based line index."""
+    out: Dict[int, List["re.Match"]] = {}
+    for m in pattern.finditer(text):
+        out.setdefault(bisect_right(starts, m.start()) - 1, []).append(m)
+    return out
+
+
+def _overlaps(m: "re.Match", spans: List[Tuple[int, int]]) -> bool:
+    return any(m.start() < e and s < m.end() for s, e in spans)
+
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= _AMOUNT_TOLERANCE * max(1.0, abs(b))
+
+
+def _amounts(item: LineItem, values: List[float], qty: Optional[float]) -> None:
+    """Fill quantity / unit / total from the line's amounts (left to right) and quantity token."""
+    if len(values) > 2:
+        item.flags.append("multi_amount")
+    total = values[-1]
+    unit = values[-2] if len(values) >= 2 else None
+    if len(values) > 2 and qty is not None:
+        # pick the (unit, total) pair that agrees with the quantity, if any
+        for i in range(len(values) - 1):
+            if _close(values[i] * qty, values[i + 1]):
+                unit, total = values[i], values[i + 1]
+                break
+    item.total_amount = total
+    if total < 0:
+        item.flags.append("credit")
+
+    if unit is None:
+        item.unit_amount = total if qty in (None, 1) else round(total / qty, 2)
+        if qty is None:
+            qty = 1
+            item.flags.append("qty_inferred")
+    elif qty is None:
+        if unit and _close(round(total / unit) * unit, total) and total / unit >= 1:
+            qty = float(round(total / unit))
+            item.flags.append("qty_inferred")
+        else:
+            item.flags.append("amount_mismatch")
+        item.unit_amount = unit
+    else:
+        item.unit_amount = unit
+        if not _close(unit * qty, total):
+            item.flags.append("amount_mismatch")
+    item.quantity = qty
+
+
+def _gaps(line: str, base: int, spans: List[Tuple[int, int]]) -> str:
+    """Description: the text between the recognised spans (absolute offsets; line starts at base)."""
+    parts = []
+    pos = 0
+    for s, e in sorted(spans):
+        s, e = max(s - base, 0), min(e - base, len(line))
+        if s > pos:
+            parts.append(line[pos:s])
+        pos = max(pos, e)
+    parts.append(line[pos:])
+    return re.sub(r"\s{2,}", " ", " ".join(parts)).strip(" \t|$-:")
+
+
+def parse_line_items(text: str) -> ParseResult:
+    t0 = time.perf_counter()
+    text = text or ""
+    lines = text.split("\n")
+    starts = []
+    pos = 0
+    for line in lines:
+        starts.append(pos)
+        pos += len(line) + 1
+
+    dates = _bucket(_DATE, text, starts)
+    money = _bucket(MONEY, text, starts)
+    revenue = _bucket(_REVENUE, text, starts)
+    cpts = _bucket(_CPT, text, starts)
+    qtys = _bucket(_QTY, text, starts)
+
+    items: List[LineItem] = []
+    unparsed: List[Tuple[int, str]] = []
+    current_date: Optional[str] = None
+    for i, line in enumerate(lines):
+        amounts = money.get(i, [])
+        line_dates = [d for d in (_iso_date(m) for m in dates.get(i, [])) if d]
+        if not amounts:
+            # a date header ("Date of Service: 01/02/2025") applies to the rows below it
+            if line_dates:
+                current_date = line_dates[0]
+            continue
+
+        money_spans = [m.span() for m in amounts]
+        date_spans = [m.span() for m in dates.get(i, [])]
+        taken = money_spans + date_spans
+        rev = [m for m in revenue.get(i, []) if not _overlaps(m, taken)]
+        taken += [m.span() for m in rev]
+        codes = [m for m in cpts.get(i, []) if not _overlaps(m, taken)]
+        taken += [m.span() for m in codes]
+
+        if not (line_dates or rev or codes) or _not_item(line):
+            unparsed.append((i + 1, line.strip()))
+            continue
+
+        item = LineItem(line=i + 1)
+        if line_dates:
+            item.date = line_dates[0]
+        elif current_date:
+            item.date = current_date
+            item.flags.append("date_carried")
+        else:
+            item.flags.append("no_date")
+        if rev:
+            item.revenue_code = rev[0].group(0)
+        if codes:
+            item.code = codes[0].group("code")
+            item.code_type = "CPT" if item.code[0].isdigit() else "HCPCS"
+            item.modifier = codes[0].group("mod")
+        else:
+            item.flags.append("no_code")
+
+        # quantity: last standalone number between the codes and the first amount
+        first_amount = amounts[0].start()
+        after = max((e for s, e in taken if s < first_amount and (s, e) not in money_spans), default=starts[i])
+        qty = None
+        qty_match = None
+        for m in qtys.get(i, []):
+            if after <= m.start() < first_amount and not _overlaps(m, taken) and 0 < float(m.group("qty")) <= 9999:
+                qty_match = m
+        if qty_match is not None:
+            qty = float(qty_match.group("qty"))
+            taken.append(qty_match.span())
+
+        _amounts(item, [_amount(m) for m in amounts], qty)
+
+        item.description = _gaps(line, starts[i], taken)
+
+        # a bare 5-digit number is only a CPT code next to a revenue code, date or description
+        if item.code and item.code.isdigit() and not (rev or line_dates or _WORD.search(item.description)):
+            item.flags.append("code_unanchored")
+
+        if "amount_mismatch" in item.flags or "code_unanchored" in item.flags or not (item.code or item.revenue_code):
+            item.confidence = "low"
+        elif item.code and item.date and "no_date" not in item.flags:
+            item.confidence = "high"
+        items.append(item)
+
+    return ParseResult(items, unparsed, len(lines), (time.perf_counter() - t0) * 1000)
+
+
+def _price_cell(low: Optional[float], high: Optional[float] = None) -> str:
+    if low is None:
+        return ""
+    if high is not None and high != low:
+        return f"{low:.2f}-{high:.2f}"
+    return f"{low:.2f}"
+
+
+def format_table(result: ParseResult) -> str:
+    """Compact pipe table (one row per item) + unparsed lines that carry amounts."""
+    priced = any(it.cash_price is not None for it in result.items)
+    header = "date|rev|code|description|qty|unit|total|flags"
+    rows = [header + "|cash|gross" if priced else header]
+    for it in result.items:
+        code = f"{it.code}-{it.modifier}" if it.code and it.modifier else (it.code or "")
+        cells = [
+            it.date or "",
+            it.revenue_code or "",
+            code,
+            it.description[:TABLE_DESCRIPTION_CHARS],
+            f"{it.quantity:g}" if it.quantity is not None else "",
+            f"{it.unit_amount:.2f}" if it.unit_amount is not None else "",
+            f"{it.total_amount:.2f}" if it.total_amount is not None else "",
+            ",".join(f for f in it.flags if f not in ("date_carried",)),
+        ]
+        if priced:
+            cells += [_price_cell(it.cash_price, it.cash_price_max), _price_cell(it.gross_charge)]
+        rows.append("|".join(cells))
+    if result.unparsed_amount_lines:
+        rows.append("")
+        rows.append("[Other lines with amounts (totals / payments / unparsed)]")
+        rows.extend(text for _, text in result.unparsed_amount_lines)
+    return "\n".join(rows)
+
+
+def parse_itemized(text: str, cfg: Optional[Config] = None) -> Optional[ParseResult]:
+    """parse_line_items(text), or None when LINE_ITEMS is off or there is no itemized text."""
+    cfg = cfg or settings._get()
+    if not cfg.line_items_enabled or not text:
+        return None
+    return parse_line_items(text)
+
+
+def prompt_table(result: Optional[ParseResult], cfg: Optional[Config] = None) -> str:
+    """
+    Table for the findings prompt, or "" (the prompt keeps the OCR text) unless coverage
+    is at least LINE_ITEMS_MIN_COVERAGE_PCT.
+    """
+    cfg = cfg or settings._get()
+    if result is None or not result.items or result.coverage * 100 < cfg.line_items_min_coverage_pct:
+        return ""
+    return format_table(result)
@@ -0,0 +1,169 @@
+"""
+Persistent response cache for LLM calls.
+
+Key = sha256(model id, full prompt contents, generation config [, extra key parts]).
+Reprocessing a bill with byte-identical prompts (e.g. after a downstream template fix)
+then skips the Gemini round trip.
+
+- disk store: LLM_CACHE_DIR, capped by LLM_CACHE_MAX_MB (LRU) and LLM_CACHE_MAX_AGE_HOURS
+- LLM_CACHE=false disables it; LLM_CACHE_DISABLE_STAGES=report,email opts stages out
+- JSON responses are only stored when they parse, so a bad answer is never pinned
+- stats() exposes process-wide hit/miss counters (total and per stage)
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from .config import Config, settings
+from .disk_cache import DiskCache
+
+
+class CachedResponse:
+    """Mimics the SDK response object (only .text is used by callers)."""
+    def __init__(self, text: str):
+        self.text = text
+
+
+def llm_cache_key(
+    model_id: str,
+    contents: Sequence[Any],
+    config: Optional[Dict[str, Any]] = None,
+    extra: Sequence[str] = (),
+) -> str:
+    payload = {
+        "model": model_id,
+        "contents": [c if isinstance(c, str) else repr(c) for c in contents],
+        "config": config or {},
+        "extra": list(extra),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_stage: Dict[str, Dict[str, int]] = {}
+
+    def add(self, stage: str, outcome: str) -> None:
+        with self._lock:
+            c = self._by_stage.setdefault(stage, {"hits": 0, "misses": 0, "bypass": 0})
+            c[outcome] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            by_stage = {k: dict(v) for k, v in self._by_stage.items()}
+        hits = sum(v["hits"] for v in by_stage.values())
+        misses = sum(v["misses"] for v in by_stage.values())
+        bypass = sum(v["bypass"] for v in by_stage.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "bypass": bypass,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "by_stage": by_stage,
+        }
+
+
+_counters = _Counters()
+_store: Optional[DiskCache] = None
+
+
+def stats() -> Dict[str, Any]:
+    return _counters.snapshot()
+
+
+def _get_store(cfg: Config) -> Optional[DiskCache]:
+    global _store
+    if not cfg.llm_cache_enabled:
+        return None
+    if _store is None:
+        max_age = cfg.llm_cache_max_age_hours * 3600 if cfg.llm_cache_max_age_hours else None
+        _store = DiskCache(
+            cfg.llm_cache_dir,
+            max_bytes=int(cfg.llm_cache_max_mb) * 1024 * 1024,
+            max_age_seconds=max_age,
+        )
+    return _store
+
+
+def _stage_enabled(cfg: Config, stage: str) -> bool:
+    disabled = {s.strip().lower() for s in (cfg.llm_cache_disable_stages or "").split(",") if s.strip()}
+    return stage.lower() not in disabled and "all" not in disabled
+
+
+def _cacheable(text: str, config: Optional[Dict[str, Any]]) -> bool:
+    if not text:
+        return False
+    if config and config.get("response_mime_type") == "application/json":
+        try:
+            json.loads(text)
+        except ValueError:
+            return False
+    return True
+
+
+def _lookup(stage: str, model_id: str, contents, config, extra, cfg: Config):
+    """Returns (store, key, cached_text); store is None when caching does not apply."""
+    store = _get_store(cfg)
+    if store is None or not _stage_enabled(cfg, stage):
+        _counters.add(stage, "bypass")
+        return None, None, None
+    key = llm_cache_key(model_id, contents, config, extra)
+    text = store.get(key)
+    _counters.add(stage, "hits" if text is not None else "misses")
+    return store, key, text
+
+
+def _store_text(store: DiskCache, key: str, text: str, config) -> None:
+    if not _cacheable(text, config):
+        return
+    try:
+        store.put(key, text)
+    except OSError:
+        pass
+
+
+def cached_generate(
+    stage: str,
+    model_id: str,
+    contents: List[Any],
+    config: Optional[Dict[str, Any]],
+    call: Callable[[], Any],
+    extra: Sequence[str] = (),
+    cfg: Optional[Config] = None,
+) -> Any:
+    """
+    Return the cached response for (model_id, contents, config) or run `call()`
+    (which must return an object with .text) and store its text.
+    """
+    cfg = cfg or settings._get()
+    store, key, text = _lookup(stage, model_id, contents, config, extra, cfg)
+    if text is not None:
+        return CachedResponse(text)
+    resp = call()
+    if store is not None:
+        _store_text(store, key, getattr(resp, "text", "") or "", config)
+    return resp
+
+
+async def cached_generate_async(
+    stage: str,
+    model_id: str,
+    contents: List[Any],
+    config: Optional[Dict[str, Any]],
+    call: Callable[[], Awaitable[Any]],
+    extra: Sequence[str] = (),
+    cfg: Optional[Config] = None,
+) -> Any:
+    """Async counterpart of cached_generate (`call` returns an awaitable)."""
+    cfg = cfg or settings._get()
+    store, key, text = await asyncio.to_thread(_lookup, stage, model_id, contents, config, extra, cfg)
+    if text is not None:
+        return CachedResponse(text)
+    resp = await call()
+    if store is not None:
+        await asyncio.to_thread(_store_text, store, key, getattr(resp, "text", "") or "", config)
+    return resp
@@ -2,30 +2,17 @@ import json
 from typing import Any, Dict, Optional, List
 
 from .config import Config
-from .genai_client import get_genai_client
-from .rest_client import generate_content as generate_content_rest
+from .model_router import generate
 
 
 def generate_text(
     prompt: str,
     cfg: Optional[Config] = None,
     model_id: Optional[str] = None,
+    stage: str = "text",
 ) -> str:
     cfg = cfg or Config.from_env()
-    model = model_id or cfg.model_id
-
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if model == "gemini-3-pro-preview":
-        resp = generate_content_rest(
-            model_id=model,
-            contents=[prompt],
-        )
-    else:
-        client = get_genai_client(cfg)
-        resp = client.models.generate_content(
-            model=model,
-            contents=[prompt],
-        )
+    resp = generate(stage, [prompt], model_id=model_id, cfg=cfg)
     return getattr(resp, "text", "") or ""
 
 
@@ -33,27 +20,13 @@ def generate_json(
     prompt: str,
     cfg: Optional[Config] = None,
     model_id: Optional[str] = None,
+    stage: str = "json",
 ) -> Dict[str, Any]:
     """
     Best-effort JSON response. If parsing fails, returns {"raw_text": "..."}.
     """
     cfg = cfg or Config.from_env()
-    model = model_id or cfg.model_id
-
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if model == "gemini-3-pro-preview":
-        resp = generate_content_rest(
-            model_id=model,
-            contents=[prompt],
-            config={"response_mime_type": "application/json"},
-        )
-    else:
-        client = get_genai_client(cfg)
-        resp = client.models.generate_content(
-            model=model,
-            contents=[prompt],
-            config={"response_mime_type": "application/json"},
-        )
+    resp = generate(stage, [prompt], {"response_mime_type": "application/json"}, model_id=model_id, cfg=cfg)
     text = getattr(resp, "text", "") or ""
     try:
         return json.loads(text)
@@ -0,0 +1,201 @@
+"""
+Per-stage model routing.
+
+Each LLM call names its pipeline stage (extract_multi, findings, report, email, letter,
+redaction, ...); the router picks the model for it:
+- MODEL_ROUTES="extract=gemini-2.5-flash,email=gemini-2.5-flash,findings=gemini-3-pro-preview"
+- MODEL_ROUTES_FILE=routes.json ({"stage": "model", ...}); MODEL_ROUTES entries win over it
+- a stage matches its exact name first, then its prefix ("extract" covers extract_multi),
+  then "default", then MODEL_ID
+- built in: redaction -> gemini-2.5-flash (the LLM fallback of the local redactor)
+
+The router also owns the transport: models in REST_MODELS go through rest_client (REST),
+all others through the google-genai SDK. Both paths share the LLM cache, the per-model
+rate limiter and (async unary calls) hedging.
+"""
+import json
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .client_registry import genai_client
+from .config import Config, settings
+from .llm_cache import cached_generate, cached_generate_async
+from .rate_limit import call_with_backoff, call_with_backoff_async
+from .rest_client import consume_stream
+from .rest_client import generate_content as generate_content_rest
+from .rest_client import generate_content_async as generate_content_rest_async
+from .rest_client import generate_content_stream_async as generate_content_stream_rest_async
+
+# served through the REST endpoint (not available via the SDK in this project)
+REST_MODELS = frozenset({"gemini-3-pro-preview"})
+
+DEFAULT_ROUTES = {
+    "redaction": "gemini-2.5-flash",
+}
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """'stage=model,stage=model' -> {stage: model}."""
+    routes = {}
+    for item in (spec or "").split(","):
+        stage, sep, model = item.partition("=")
+        if not sep:
+            if item.strip():
+                raise ValueError(f"MODEL_ROUTES entry must be stage=model: {item.strip()!r}")
+            continue
+        if stage.strip() and model.strip():
+            routes[stage.strip()] = model.strip()
+    return routes
+
+
+def _load_file(path: str) -> Dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"MODEL_ROUTES_FILE must contain a JSON object: {path}")
+    return {str(k): str(v) for k, v in data.items() if v}
+
+
+_lock = threading.Lock()
+_routes: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+
+def routes(cfg: Optional[Config] = None) -> Dict[str, str]:
+    """Effective stage -> model map (defaults < MODEL_ROUTES_FILE < MODEL_ROUTES)."""
+    cfg = cfg or settings._get()
+    key = (cfg.model_routes or "", cfg.model_routes_file or "")
+    r = _routes.get(key)
+    if r is None:
+        r = dict(DEFAULT_ROUTES)
+        if key[1]:
+            r.update(_load_file(key[1]))
+        r.update(parse_routes(key[0]))
+        with _lock:
+            _routes[key] = r
+    return r
+
+
+def model_for(stage: str, cfg: Optional[Config] = None) -> str:
+    cfg = cfg or settings._get()
+    r = routes(cfg)
+    for name in (stage, stage.split("_", 1)[0], "default"):
+        if r.get(name):
+            return r[name]
+    return cfg.model_id
+
+
+def models_for(stages: Iterable[str], cfg: Optional[Config] = None) -> Dict[str, str]:
+    """{stage: model} (for meta.json)."""
+    return {s: model_for(s, cfg) for s in stages}
+
+
+def uses_rest(model_id: str) -> bool:
+    return model_id in REST_MODELS
+
+
+def generate(
+    stage: str,
+    contents: List[str],
+    config: Optional[Dict[str, Any]] = None,
+    cache_extra: Sequence[str] = (),
+    model_id: Optional[str] = None,
+    cfg: Optional[Config] = None,
+) -> Any:
+    """Generate with the stage's model (REST or SDK); returns an object with .text."""
+    cfg = cfg or settings._get()
+    model = model_id or model_for(stage, cfg)
+    if uses_rest(model):
+        return generate_content_rest(
+            model_id=model,
+            contents=contents,
+            config=config,
+            stage=stage,
+            cache_extra=cache_extra,
+        )
+    client = genai_client(cfg.project_id, cfg.location)
+    return cached_generate(
+        stage, model, contents, config,
+        lambda: call_with_backoff(model, lambda: client.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config,
+        ), location=cfg.location, cfg=cfg),
+        extra=cache_extra,
+        cfg=cfg,
+    )
+
+
+async def generate_async(
+    stage: str,
+    contents: List[str],
+    config: Optional[Dict[str, Any]] = None,
+    cache_extra: Sequence[str] = (),
+    model_id: Optional[str] = None,
+    cfg: Optional[Config] = None,
+) -> Any:
+    """Async counterpart of generate (SDK path uses client.aio)."""
+    cfg = cfg or settings._get()
+    model = model_id or model_for(stage, cfg)
+    if uses_rest(model):
+        return await generate_content_rest_async(
+            model_id=model,
+            contents=contents,
+            config=config,
+            stage=stage,
+            cache_extra=cache_extra,
+        )
+    client = genai_client(cfg.project_id, cfg.location)
+
+    async def call():
+        return await client.aio.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+
+    # limiter + retries; hedging may duplicate a single slow attempt
+    return await cached_generate_async(
+        stage, model, contents, config,
+        lambda: call_with_backoff_async(model, call, cfg.location, cfg, stage=stage),
+        extra=cache_extra,
+        cfg=cfg,
+    )
+
+
+async def generate_stream_async(
+    stage: str,
+    contents: List[str],
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    config: Optional[Dict[str, Any]] = None,
+    cache_extra: Sequence[str] = (),
+    model_id: Optional[str] = None,
+    cfg: Optional[Config] = None,
+) -> Any:
+    """
+    Streaming generate: on_chunk(text) is awaited per chunk as it arrives (REST
+    :streamGenerateContent or SDK generate_content_stream); returns the full response.
+    """
+    cfg = cfg or settings._get()
+    model = model_id or model_for(stage, cfg)
+    if uses_rest(model):
+        return await generate_content_stream_rest_async(
+            model_id=model,
+            contents=contents,
+            config=config,
+            stage=stage,
+            on_chunk=on_chunk,
+            cache_extra=cache_extra,
+        )
+    client = genai_client(cfg.project_id, cfg.location)
+
+    async def open_stream() -> AsyncIterator[str]:
+        stream = await client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    return await consume_stream(stage, model, contents, config, open_stream, on_chunk=on_chunk, cache_extra=cache_extra)
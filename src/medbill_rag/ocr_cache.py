@@ -0,0 +1,185 @@
+"""
+Content-addressed cache for Document AI OCR text.
+
+Key = sha256(bucket, blob name, generation, md5, processor id, processor version), so a
+re-uploaded PDF or a different processor never hits a stale entry.
+
+Tiers:
+- local disk (OCR_CACHE_DIR), LRU-evicted once OCR_CACHE_MAX_MB is exceeded
+- optional shared tier under gs://$BUCKET_CASE/cache/ocr/ (OCR_CACHE_SHARED=true); reads are
+  bounded by the bill deadline (a slow read is a miss), writes run in the background so the
+  OCR text is returned without waiting for the bucket
+"""
+import asyncio
+import hashlib
+from typing import Dict, Optional, Set, Tuple
+
+from .client_registry import storage_client
+from .config import Config, settings
+from .deadline import call_timeout
+from .disk_cache import DiskCache
+from .gcs_case import GCS_TIMEOUT_S
+from .ocr_docai import ocr_gcs_file_async
+
+SHARED_PREFIX = "cache/ocr/"
+# background shared-tier writes: not tied to the bill deadline, but never unbounded
+SHARED_PUT_TIMEOUT_S = 30
+
+HIT_LOCAL = "hit-local"
+HIT_SHARED = "hit-shared"
+MISS = "miss"
+DISABLED = "disabled"
+
+
+def ocr_cache_key(
+    bucket: str,
+    blob_name: str,
+    generation: Optional[str],
+    md5_hash: Optional[str],
+    processor_id: str,
+    processor_version: Optional[str],
+) -> Optional[str]:
+    """Returns None when the blob has no generation/md5 (content cannot be identified)."""
+    if not generation and not md5_hash:
+        return None
+    raw = "\x1f".join([
+        bucket or "",
+        blob_name or "",
+        str(generation or ""),
+        md5_hash or "",
+        processor_id or "",
+        processor_version or "default",
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class OcrCache:
+    def __init__(self, local_dir: str, max_bytes: int, shared_bucket: Optional[str] = None):
+        self.local = DiskCache(local_dir, max_bytes)
+        self.shared_bucket = shared_bucket
+
+    # ---- shared tier ----
+    def _shared_blob(self, key: str):
+        return storage_client().bucket(self.shared_bucket).blob(f"{SHARED_PREFIX}{key}.txt")
+
+    def _get_shared(self, key: str) -> Optional[str]:
+        if not self.shared_bucket:
+            return None
+        from google.api_core.exceptions import NotFound
+        try:
+            # no client-side retries: a failed read is a miss and OCR runs instead
+            return self._shared_blob(key).download_as_text(
+                encoding="utf-8", timeout=call_timeout(GCS_TIMEOUT_S), retry=None
+            )
+        except NotFound:
+            return None
+
+    def put_shared(self, key: str, text: str) -> None:
+        if not self.shared_bucket:
+            return
+        self._shared_blob(key).upload_from_string(
+            text, content_type="text/plain; charset=utf-8", timeout=SHARED_PUT_TIMEOUT_S, retry=None
+        )
+
+    # ---- public ----
+    def get(self, key: str) -> Tuple[Optional[str], str]:
+        text = self.local.get(key)
+        if text is not None:
+            return text, HIT_LOCAL
+        text = self._get_shared(key)
+        if text is not None:
+            self.local.put(key, text)
+            return text, HIT_SHARED
+        return None, MISS
+
+    def put(self, key: str, text: str) -> None:
+        self.local.put(key, text)
+        self.put_shared(key, text)
+
+
+_cache: Optional[OcrCache] = None
+
+
+def get_ocr_cache(cfg: Optional[Config] = None) -> Optional[OcrCache]:
+    """Process-wide cache built from settings; None when OCR_CACHE=false."""
+    global _cache
+    cfg = cfg or settings._get()
+    if not cfg.ocr_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = OcrCache(
+            local_dir=cfg.ocr_cache_dir,
+            max_bytes=int(cfg.ocr_cache_max_mb) * 1024 * 1024,
+            shared_bucket=cfg.bucket_case if cfg.ocr_cache_shared else None,
+        )
+    return _cache
+
+
+def _file_key(f: Dict, cfg: Config) -> Optional[str]:
+    return ocr_cache_key(
+        f.get("bucket") or cfg.bucket_case,
+        f.get("blob_name"),
+        f.get("generation"),
+        f.get("md5_hash"),
+        cfg.docai_processor_id,
+        cfg.docai_processor_version,
+    )
+
+
+async def cache_lookup_async(f: Dict, cfg: Optional[Config] = None) -> Tuple[Optional[str], Optional[str], str]:
+    """
+    Returns (key, text, status). key is None when caching does not apply (status "disabled");
+    text is None on a miss. Cache read errors count as a miss.
+    """
+    cfg = cfg or settings._get()
+    cache = get_ocr_cache(cfg)
+    key = _file_key(f, cfg) if cache is not None else None
+    if key is None:
+        return None, None, DISABLED
+    try:
+        text, status = await asyncio.to_thread(cache.get, key)
+    except Exception:
+        text, status = None, MISS
+    return key, text, status
+
+
+# in-flight shared-tier writes (referenced so they are not garbage-collected mid-upload)
+_shared_writes: Set["asyncio.Task"] = set()
+
+
+def _shared_write_done(task: "asyncio.Task") -> None:
+    _shared_writes.discard(task)
+    if not task.cancelled():
+        # a cache write failure must not fail the bill (and must not be logged as unretrieved)
+        task.exception()
+
+
+async def cache_store_async(key: Optional[str], text: str, cfg: Optional[Config] = None) -> None:
+    cache = get_ocr_cache(cfg)
+    if cache is None or key is None:
+        return
+    try:
+        await asyncio.to_thread(cache.local.put, key, text)
+    except Exception:
+        # a cache write failure must not fail the bill
+        pass
+    if cache.shared_bucket:
+        # fire-and-forget: the caller gets the OCR text without waiting for the bucket
+        task = asyncio.create_task(asyncio.to_thread(cache.put_shared, key, text))
+        _shared_writes.add(task)
+        task.add_done_callback(_shared_write_done)
+
+
+async def ocr_file_cached_async(f: Dict, cfg: Optional[Config] = None) -> Tuple[str, str]:
+    """
+    OCR one discovered file (see case_discovery.list_bill_folder_files) through the cache.
+    Returns (text, status) where status is hit-local / hit-shared / miss / disabled.
+    """
+    cfg = cfg or settings._get()
+    key, text, status = await cache_lookup_async(f, cfg)
+    if text is not None:
+        return text, status
+
+    text = await ocr_gcs_file_async(f["gcs_uri"], f["mime_type"], cfg=cfg)
+    await cache_store_async(key, text, cfg)
+    return text, status
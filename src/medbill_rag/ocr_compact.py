@@ -0,0 +1,128 @@
+"""
+Deterministic compaction of OCR text before it goes into prompts.
+
+Document AI text for multi-page statements repeats page headers, remit-to blocks and
+legal footers on every page. Compaction:
+- splits the text into pages (form feeds and "Page 2 of 5" style lines) and counts each
+  header / footer line (above the page's first / below its last line with an amount, code
+  or date) once per page; one found on OCR_COMPACT_MIN_REPEATS+ pages is kept on the first
+  of them only, so nothing between charge rows (split table cells) is ever dropped
+  ("Page n of m" lines match regardless of the numbers)
+- never drops lines with dollar amounts or CPT / HCPCS / revenue / ICD codes (identical
+  charge lines are real charges), nor lines without words (table cells such as "1")
+- collapses runs of spaces/tabs and blank lines
+Text without page markers is one page: nothing repeats across pages, nothing is dropped.
+
+The raw text is still uploaded as *_text.txt; only prompts see the compact text.
+"""
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from .bill_patterns import BILLING_CODE, DATE, MONEY
+from .config import Config, settings
+from .prompt_packer import estimate_tokens
+
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_BLANKS = re.compile(r"\n{3,}")
+_PAGE = re.compile(r"\bpage\s*\d+(\s*(of|/)\s*\d+)?\b", re.IGNORECASE)
+_WORD = re.compile(r"[A-Za-z]{2,}")
+
+
+def _line_key(line: str) -> str:
+    key = line.lower()
+    if _PAGE.search(key):
+        key = re.sub(r"\d+", "#", key)
+    return key
+
+
+def _paged_lines(text: str) -> List[Tuple[int, str]]:
+    """[(page, normalized line)]; a new page starts at a form feed and after a "Page n" line."""
+    out = []
+    page = 0
+    for raw in text.split("\n"):
+        parts = raw.split("\f")
+        for i, part in enumerate(parts):
+            if i:
+                page += 1
+            line = _SPACES.sub(" ", part).strip()
+            if line or i == 0:
+                out.append((page, line))
+            if _PAGE.search(line):
+                page += 1
+    return out
+
+
+def _droppable(line: str) -> bool:
+    return bool(_WORD.search(line)) and not MONEY.search(line) and not BILLING_CODE.search(line)
+
+
+def _edge_lines(lines: List[Tuple[int, str]]) -> Set[int]:
+    """Indexes (into lines) of each page's header / footer lines: outside its first..last evidence line."""
+    by_page: Dict[int, List[int]] = {}
+    for i, (page, line) in enumerate(lines):
+        if line:
+            by_page.setdefault(page, []).append(i)
+    edge = set()
+    for idx in by_page.values():
+        evidence = [i for i in idx if MONEY.search(lines[i][1]) or BILLING_CODE.search(lines[i][1]) or DATE.search(lines[i][1])]
+        if not evidence:
+            edge.update(idx)
+            continue
+        edge.update(i for i in idx if i < evidence[0] or i > evidence[-1])
+    return edge
+
+
+def compact_text(text: str, min_repeats: int = 3) -> Tuple[str, Dict[str, int]]:
+    """Returns (compact text, stats)."""
+    if not text:
+        return text or "", {"chars_in": 0, "chars_out": 0, "chars_saved": 0, "tokens_saved": 0, "lines_removed": 0}
+
+    lines = _paged_lines(text)
+    edge = _edge_lines(lines)
+    pages: Dict[str, Set[int]] = {}
+    first_page: Dict[str, int] = {}
+    for i, (page, line) in enumerate(lines):
+        if i in edge and _droppable(line):
+            key = _line_key(line)
+            pages.setdefault(key, set()).add(page)
+            first_page.setdefault(key, page)
+
+    out = []
+    removed = 0
+    for i, (page, line) in enumerate(lines):
+        if i in edge:
+            key = _line_key(line)
+            if key in pages and len(pages[key]) >= min_repeats and page != first_page[key]:
+                removed += 1
+                continue
+        out.append(line)
+
+    compact = _BLANKS.sub("\n\n", "\n".join(out)).strip()
+    stats = {
+        "chars_in": len(text),
+        "chars_out": len(compact),
+        "chars_saved": len(text) - len(compact),
+        "tokens_saved": estimate_tokens(text) - estimate_tokens(compact),
+        "lines_removed": removed,
+    }
+    return compact, stats
+
+
+def compact_texts(texts: Dict[str, str], cfg: Optional[Config] = None) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """Compact {kind: text}; returns ({kind: compact text}, {kind: stats}). OCR_COMPACT=false is a no-op."""
+    cfg = cfg or settings._get()
+    if not cfg.ocr_compact_enabled:
+        return dict(texts), {}
+    out, stats = {}, {}
+    for k, text in texts.items():
+        out[k], st = compact_text(text, cfg.ocr_compact_min_repeats)
+        if text:
+            stats[k] = st
+    return out, stats
+
+
+def format_stats(stats: Dict[str, Dict]) -> str:
+    """One line: 'EOB -1,234 chars/-310 tok; ITEMIZED ...'."""
+    return "; ".join(
+        f"{k} -{st['chars_saved']:,} chars/-{st['tokens_saved']:,} tok" for k, st in stats.items()
+    )
@@ -1,7 +1,28 @@
 from typing import Optional
 from google.cloud import documentai_v1 as documentai
 
+from .client_registry import docai_async_client, docai_client
 from .config import Config
+from .deadline import call_timeout
+
+# per-request timeout (shortened to the remaining bill deadline, if any)
+OCR_TIMEOUT_S = 300
+
+
+def _processor_name(client, cfg: Config, pid: str) -> str:
+    if cfg.docai_processor_version:
+        return client.processor_version_path(cfg.project_id, cfg.docai_location, pid, cfg.docai_processor_version)
+    return client.processor_path(cfg.project_id, cfg.docai_location, pid)
+
+
+def _process_request(name: str, gcs_uri: str, mime_type: str) -> documentai.ProcessRequest:
+    return documentai.ProcessRequest(
+        name=name,
+        gcs_document=documentai.GcsDocument(
+            gcs_uri=gcs_uri,
+            mime_type=mime_type,
+        ),
+    )
 
 
 def ocr_gcs_file(
@@ -19,21 +40,39 @@ def ocr_gcs_file(
 
     cfg = cfg or Config.from_env()
     pid = processor_id or cfg.docai_processor_id
-    loc = cfg.docai_location
 
-    client = documentai.DocumentProcessorServiceClient(
-        client_options={"api_endpoint": f"{loc}-documentai.googleapis.com"}
-    )
-    name = client.processor_path(cfg.project_id, loc, pid)
+    client = docai_client(cfg.docai_location)
+    name = _processor_name(client, cfg, pid)
 
-    request = documentai.ProcessRequest(
-        name=name,
-        gcs_document=documentai.GcsDocument(
-            gcs_uri=gcs_uri,
-            mime_type=mime_type,
-        ),
+    result = client.process_document(
+        request=_process_request(name, gcs_uri, mime_type),
+        timeout=call_timeout(OCR_TIMEOUT_S),
     )
+    doc = result.document
+    return doc.text or ""
+
 
-    result = client.process_document(request=request)
+async def ocr_gcs_file_async(
+    gcs_uri: str,
+    mime_type: str,
+    processor_id: Optional[str] = None,
+    cfg: Optional[Config] = None,
+) -> str:
+    """
+    Async variant of ocr_gcs_file using the grpc.aio Document AI client.
+    """
+    if not gcs_uri:
+        return ""
+
+    cfg = cfg or Config.from_env()
+    pid = processor_id or cfg.docai_processor_id
+
+    client = docai_async_client(cfg.docai_location)
+    name = _processor_name(client, cfg, pid)
+
+    result = await client.process_document(
+        request=_process_request(name, gcs_uri, mime_type),
+        timeout=call_timeout(OCR_TIMEOUT_S),
+    )
     doc = result.document
     return doc.text or ""
@@ -0,0 +1,173 @@
+"""
+Document AI batch OCR (batch_process_documents).
+
+Online process_document is page-limited and quota-heavy for long itemized bills. This
+engine instead submits files as one long-running operation that writes Document JSON to
+gs://$BUCKET_CASE/$DOCAI_BATCH_OUTPUT_PREFIX/<run id>/, polls it asynchronously and
+returns the text per file.
+
+Requests arriving within DOCAI_BATCH_WINDOW_S (e.g. from concurrently running bills in
+batch mode) are coalesced into one operation of up to DOCAI_BATCH_MAX_DOCS files.
+"""
+import asyncio
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import documentai_v1 as documentai
+
+from .client_registry import docai_async_client, storage_client
+from .config import Config, settings
+from .deadline import call_timeout
+from .ocr_cache import cache_lookup_async, cache_store_async
+from .ocr_docai import _processor_name
+from .ocr_engines import OcrResult
+
+
+def _split_gs(uri: str) -> Tuple[str, str]:
+    rest = uri[len("gs://"):] if uri.startswith("gs://") else uri
+    bucket, _, prefix = rest.partition("/")
+    return bucket, prefix
+
+
+def _read_output_text(dest_uri: str, cleanup: bool = True) -> str:
+    """Concatenate the text of every Document JSON shard under dest_uri (in shard order)."""
+    bucket, prefix = _split_gs(dest_uri)
+    blobs = [b for b in storage_client().list_blobs(bucket, prefix=prefix) if b.name.endswith(".json")]
+    docs = [
+        documentai.Document.from_json(b.download_as_bytes(), ignore_unknown_fields=True)
+        for b in blobs
+    ]
+    docs.sort(key=lambda d: int(d.shard_info.shard_index or 0))
+    text = "".join(d.text or "" for d in docs)
+    if cleanup:
+        # OCR text is PHI; do not leave a second copy behind (the OCR cache keeps the result)
+        for b in blobs:
+            try:
+                b.delete()
+            except Exception:
+                pass
+    return text
+
+
+class BatchOcrEngine:
+    name = "batch"
+
+    def __init__(self, cfg: Optional[Config] = None):
+        self.cfg = cfg or settings._get()
+        self.window_s = max(0, self.cfg.docai_batch_window_s)
+        self.max_docs = max(1, self.cfg.docai_batch_max_docs)
+        self._pending: List[Tuple[Dict, "asyncio.Future[str]"]] = []
+        self._timer: Optional["asyncio.Task[None]"] = None
+        self._running: set = set()
+
+    # ---- public ----
+    async def ocr_files(self, files: Dict) -> Dict[object, OcrResult]:
+        results = {}
+        waiting = {}
+        for k, f in files.items():
+            key, text, status = await cache_lookup_async(f, self.cfg)
+            if text is not None:
+                results[k] = OcrResult(text=text, cache=status)
+            else:
+                waiting[k] = (key, status, self._enqueue(f))
+
+        for k, (key, status, fut) in waiting.items():
+            try:
+                # the shared operation keeps running; this bill only waits as long as its deadline allows
+                text = await asyncio.wait_for(asyncio.shield(fut), call_timeout(None))
+            except Exception as e:
+                results[k] = OcrResult(error=f"{type(e).__name__}: {e}")
+                continue
+            await cache_store_async(key, text, self.cfg)
+            results[k] = OcrResult(text=text, cache=status)
+        return results
+
+    # ---- coalescing ----
+    def _enqueue(self, f: Dict) -> "asyncio.Future[str]":
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((f, fut))
+        if len(self._pending) >= self.max_docs:
+            self._submit(self._take())
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return fut
+
+    def _take(self) -> List[Tuple[Dict, "asyncio.Future[str]"]]:
+        batch, self._pending = self._pending[:self.max_docs], self._pending[self.max_docs:]
+        return batch
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window_s)
+        self._timer = None
+        while self._pending:
+            self._submit(self._take())
+
+    def _submit(self, batch) -> None:
+        task = asyncio.create_task(self._run_batch(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    # ---- one long-running operation ----
+    async def _run_batch(self, batch) -> None:
+        by_uri: Dict[str, List["asyncio.Future[str]"]] = {}
+        mime: Dict[str, str] = {}
+        for f, fut in batch:
+            by_uri.setdefault(f["gcs_uri"], []).append(fut)
+            mime[f["gcs_uri"]] = f["mime_type"]
+
+        try:
+            texts = await self._process(mime)
+        except Exception as e:
+            for futs in by_uri.values():
+                for fut in futs:
+                    if not fut.done():
+                        fut.set_exception(e)
+            return
+
+        for uri, futs in by_uri.items():
+            out = texts.get(uri)
+            if out is None:
+                out = RuntimeError(f"batch OCR returned no result for {uri}")
+            for fut in futs:
+                if fut.done():
+                    continue
+                if isinstance(out, BaseException):
+                    fut.set_exception(out)
+                else:
+                    fut.set_result(out)
+
+    async def _process(self, mime: Dict[str, str]) -> Dict[str, object]:
+        """Returns {gcs_uri: text or exception}."""
+        cfg = self.cfg
+        client = docai_async_client(cfg.docai_location)
+        out_prefix = (
+            f"gs://{cfg.bucket_case}/{cfg.docai_batch_output_prefix.strip('/')}/{uuid.uuid4().hex}/"
+        )
+        request = documentai.BatchProcessRequest(
+            name=_processor_name(client, cfg, cfg.docai_processor_id),
+            input_documents=documentai.BatchDocumentsInputConfig(
+                gcs_documents=documentai.GcsDocuments(documents=[
+                    documentai.GcsDocument(gcs_uri=uri, mime_type=m) for uri, m in mime.items()
+                ]),
+            ),
+            document_output_config=documentai.DocumentOutputConfig(
+                gcs_output_config=documentai.DocumentOutputConfig.GcsOutputConfig(gcs_uri=out_prefix),
+            ),
+        )
+
+        operation = await client.batch_process_documents(request=request)
+        # AsyncOperation.result polls the LRO without blocking the loop
+        await operation.result(timeout=cfg.docai_batch_timeout_s)
+        metadata = operation.metadata
+
+        out: Dict[str, object] = {}
+        for st in metadata.individual_process_statuses:
+            uri = st.input_gcs_source
+            if st.status and st.status.code:
+                out[uri] = RuntimeError(f"Document AI batch status {st.status.code}: {st.status.message}")
+                continue
+            try:
+                out[uri] = await asyncio.to_thread(_read_output_text, st.output_gcs_destination)
+            except Exception as e:
+                out[uri] = e
+        return out
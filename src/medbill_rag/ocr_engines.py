@@ -0,0 +1,87 @@
+"""
+Selectable OCR engines (OCR_ENGINE / run_bill_folder(ocr_engine=...)).
+
+- online: Document AI process_document per file (default)
+- batch:  Document AI batch_process_documents, coalesced across bills (ocr_docai_batch)
+- local:  reads pre-extracted text from OCR_LOCAL_DIR; a stand-in for tests / offline runs
+
+Every engine takes {key: file dict from case_discovery} and returns {key: OcrResult}.
+"""
+import asyncio
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from .config import Config, settings
+from .ocr_cache import ocr_file_cached_async
+
+
+@dataclass
+class OcrResult:
+    text: str = ""
+    # OCR cache status (hit-local / hit-shared / miss / disabled / local)
+    cache: Optional[str] = None
+    error: Optional[str] = None
+
+
+class OnlineOcrEngine:
+    name = "online"
+
+    def __init__(self, cfg: Optional[Config] = None):
+        self.cfg = cfg or settings._get()
+
+    async def ocr_files(self, files: Dict) -> Dict[object, OcrResult]:
+        sem = asyncio.Semaphore(max(1, self.cfg.ocr_max_workers or 1))
+
+        async def one(f):
+            async with sem:
+                return await ocr_file_cached_async(f, self.cfg)
+
+        outs = await asyncio.gather(*(one(f) for f in files.values()), return_exceptions=True)
+        results = {}
+        for k, out in zip(files, outs):
+            if isinstance(out, BaseException):
+                results[k] = OcrResult(error=f"{type(out).__name__}: {out}")
+            else:
+                results[k] = OcrResult(text=out[0] or "", cache=out[1])
+        return results
+
+
+class LocalOcrEngine:
+    """
+    Looks up <root>/<blob_name>.txt, then <root>/<blob_name without extension>.txt.
+    """
+    name = "local"
+
+    def __init__(self, cfg: Optional[Config] = None, root: Optional[str] = None):
+        cfg = cfg or settings._get()
+        self.root = Path(root or cfg.ocr_local_dir or ".").expanduser()
+
+    def _read(self, f: Dict) -> str:
+        blob = f.get("blob_name") or f["gcs_uri"].split("/", 3)[-1]
+        for p in (self.root / f"{blob}.txt", (self.root / blob).with_suffix(".txt")):
+            if p.is_file():
+                return p.read_text(encoding="utf-8")
+        raise FileNotFoundError(f"no local OCR text for {blob} under {self.root}")
+
+    async def ocr_files(self, files: Dict) -> Dict[object, OcrResult]:
+        results = {}
+        for k, f in files.items():
+            try:
+                results[k] = OcrResult(text=self._read(f), cache="local")
+            except Exception as e:
+                results[k] = OcrResult(error=f"{type(e).__name__}: {e}")
+        return results
+
+
+def get_ocr_engine(name: Optional[str] = None, cfg: Optional[Config] = None):
+    cfg = cfg or settings._get()
+    name = (name or cfg.ocr_engine or "online").strip().lower()
+    if name == "online":
+        return OnlineOcrEngine(cfg)
+    if name == "batch":
+        from .ocr_docai_batch import BatchOcrEngine
+        return BatchOcrEngine(cfg)
+    if name == "local":
+        return LocalOcrEngine(cfg)
+    raise ValueError(f"Unknown OCR engine: {name!r} (expected online, batch or local)")
@@ -1,20 +1,38 @@
+import asyncio
 import json
 from pathlib import Path
 
-from .case_discovery import list_bill_folder_files, pick_best_by_kind
-from .ocr_docai import ocr_gcs_file
-from .extract_structured import extract_from_text
+from .case_discovery import list_bill_folder_files_async, pick_best_by_kind
+from .ocr_engines import get_ocr_engine
+from .ocr_compact import compact_texts, format_stats
+from .extract_structured import META_KEYS, extract_from_documents_async
 from .extract_meta import _inject_known_user_inputs
 from .hydrate_overlay import ensure_hospital_overlay, ensure_payer_overlay
-from .gcs_kb import load_local_global_kb_text
-from .gcs_case import upload_json_to_bill_outputs, upload_text_to_bill_outputs
-from .client import get_genai_client
+from .kb_bundle import load_kb_bundle
+from .kb_retrieval import retrieve_kb
+from .line_items import parse_itemized, prompt_table
+from .price_index import price_line_items
+from .gcs_case import BillOutputWriter, upload_json_to_bill_outputs_async, upload_text_to_bill_outputs_async
 from .config import settings
 from .prompts import build_reduction_prompt
+from .redaction import name_terms, redact_text
 from .report_writer import build_report_md_prompt
 from .email_writer import build_user_email_prompt
 from .hospital_letter_writer import build_hospital_letter_prompt
-from .rest_client import generate_content as generate_content_rest
+from .client_registry import aclose_loop
+from .model_router import generate_async, generate_stream_async, models_for
+from .stage_graph import Stage, run_stages_async
+from .deadline import deadline_scope, remaining as remaining_budget
+
+
+REDACT_PROMPT = """
+You will be given a patient-led hospital billing letter. Redact or replace ALL personally identifiable information (PII/PHI), including:
+- Names, dates of birth, addresses, phone numbers, emails
+- Account numbers, claim numbers, policy numbers, medical record numbers
+- Bill folder IDs, signature lines with names/dates
+Replace each with "[REDACTED]" while keeping the rest of the letter structure intact and readable.
+Return ONLY the redacted letter text.
+"""
 
 
 def _output_filename(base_name: str) -> str:
@@ -23,33 +41,96 @@ def _output_filename(base_name: str) -> str:
     return f"{header}{base_name}" if header else base_name
 
 
-def run_bill_folder(bill_folder_id: str) -> dict:
-    files = list_bill_folder_files(bill_folder_id)
+_OCR_KINDS = ("EOB", "ITEMIZED", "STATEMENT")
+
+
+async def _ocr_picked(picked: dict, engine) -> tuple[dict, dict, dict]:
+    """
+    OCR the picked EOB / ITEMIZED / STATEMENT files with `engine` (see ocr_engines).
+    Returns ({kind: text}, {kind: error}, {kind: cache status}); a failed document yields ""
+    and an error entry so the rest of the bill can still be analyzed.
+    """
+    todo = {k: picked.get(k) for k in _OCR_KINDS if picked.get(k)}
+    texts = {k: "" for k in _OCR_KINDS}
+    errors = {}
+    cache_status = {}
+    if not todo:
+        return texts, errors, cache_status
+
+    results = await engine.ocr_files(todo)
+    for k, r in results.items():
+        if r.error:
+            errors[k] = r.error
+        else:
+            texts[k] = r.text or ""
+            cache_status[k] = r.cache
+    return texts, errors, cache_status
+
+
+def run_bill_folder(bill_folder_id: str, ocr_engine=None, on_chunk=None, deadline_s=None) -> dict:
+    """Blocking entry point; see run_bill_folder_async."""
+    async def _run():
+        try:
+            return await run_bill_folder_async(
+                bill_folder_id, ocr_engine=ocr_engine, on_chunk=on_chunk, deadline_s=deadline_s,
+            )
+        finally:
+            await aclose_loop()
+
+    return asyncio.run(_run())
+
+
+async def run_bill_folder_async(bill_folder_id: str, ocr_engine=None, on_chunk=None, deadline_s=None) -> dict:
+    """
+    ocr_engine: engine name ("online" / "batch" / "local"), an engine instance shared
+    across bills, or None for OCR_ENGINE.
+    on_chunk: optional callable(stage, text) receiving report / email / letter text as it
+    is generated (interactive callers; the artifacts are streamed to GCS either way).
+    deadline_s: time budget for the whole bill (default BILL_DEADLINE_S; 0 = none). OCR,
+    LLM and GCS calls get per-call timeouts from it; optional stages (report, email,
+    letter, redaction) are skipped when less than DEADLINE_STAGE_MIN_S remains.
+    """
+    if deadline_s is None:
+        deadline_s = settings.bill_deadline_s
+    with deadline_scope(deadline_s):
+        return await _run_bill_folder(bill_folder_id, ocr_engine, on_chunk)
+
+
+def _skip_for_deadline(stage: Stage):
+    left = remaining_budget()
+    if left is not None and left < settings.deadline_stage_min_s:
+        return f"deadline: {left:.1f}s left < DEADLINE_STAGE_MIN_S ({settings.deadline_stage_min_s}s)"
+    return None
+
+
+async def _run_bill_folder(bill_folder_id: str, ocr_engine, on_chunk) -> dict:
+    files = await list_bill_folder_files_async(bill_folder_id)
     if not files:
         out = {"bill_folder_id": bill_folder_id, "error": "No files found under bills/{id}/"}
-        upload_json_to_bill_outputs(bill_folder_id, "findings.json", out)
+        await upload_json_to_bill_outputs_async(bill_folder_id, "findings.json", out)
         return out
 
     picked = pick_best_by_kind(files)
 
-    def ocr_one(f):
-        if not f:
-            return ""
-        return ocr_gcs_file(f["gcs_uri"], f["mime_type"])
+    engine = ocr_engine if hasattr(ocr_engine, "ocr_files") else get_ocr_engine(ocr_engine)
+    raw_texts, ocr_errors, ocr_cache_status = await _ocr_picked(picked, engine)
 
-    eob_text = ocr_one(picked.get("EOB"))
-    itemized_text = ocr_one(picked.get("ITEMIZED"))
-    statement_text = ocr_one(picked.get("STATEMENT"))
+    # Persist raw OCR text artifacts for debugging/review (in parallel with extraction)
+    uploads = [
+        upload_text_to_bill_outputs_async(bill_folder_id, _output_filename("eob_text.txt"), raw_texts["EOB"] or ""),
+        upload_text_to_bill_outputs_async(bill_folder_id, _output_filename("itemized_text.txt"), raw_texts["ITEMIZED"] or ""),
+        upload_text_to_bill_outputs_async(bill_folder_id, _output_filename("statement_text.txt"), raw_texts["STATEMENT"] or ""),
+    ]
 
-    # Persist raw OCR text artifacts for debugging/review
-    upload_text_to_bill_outputs(bill_folder_id, _output_filename("eob_text.txt"), eob_text or "")
-    upload_text_to_bill_outputs(bill_folder_id, _output_filename("itemized_text.txt"), itemized_text or "")
-    upload_text_to_bill_outputs(bill_folder_id, _output_filename("statement_text.txt"), statement_text or "")
-
-    extracted = []
-    for t in [eob_text, itemized_text, statement_text]:
-        if t and t.strip():
-            extracted.append(extract_from_text(t))
+    # Prompts get compacted text (repeated page headers/footers, whitespace runs removed)
+    texts, compact_stats = compact_texts(raw_texts)
+    eob_text = texts["EOB"]
+    itemized_text = texts["ITEMIZED"]
+    statement_text = texts["STATEMENT"]
+    # One labelled extraction call for all documents (instead of one per document)
+    done = await asyncio.gather(*uploads, extract_from_documents_async(texts))
+    extraction = done[-1]
+    extracted = extraction["documents"]
 
     meta = {
         "provider_name": None,
@@ -64,14 +145,17 @@ def run_bill_folder(bill_folder_id: str) -> dict:
         "files_detected": [f.get("blob_name") for f in files],
         "picked": {k: (v.get("blob_name") if v else None) for k, v in picked.items() if k != "UNKNOWN"},
     }
+    meta["ocr_engine"] = engine.name
+    meta["ocr_cache"] = ocr_cache_status
+    if ocr_errors:
+        meta["ocr_errors"] = ocr_errors
+    if compact_stats:
+        meta["ocr_compaction"] = {"summary": format_stats(compact_stats), "documents": compact_stats}
 
-    # Merge best-known fields
-    for m in extracted:
-        if not isinstance(m, dict):
-            continue
-        for k in ["provider_name","provider_state","payer_name","plan_name","dos_from","dos_to","total_charge","patient_responsibility"]:
-            if meta.get(k) is None and m.get(k) is not None:
-                meta[k] = m.get(k)
+    # Merged best-known fields
+    for k in META_KEYS:
+        if meta.get(k) is None and extraction["meta"].get(k) is not None:
+            meta[k] = extraction["meta"][k]
 
     # Inject known user inputs (household size, income range) from env
     meta = _inject_known_user_inputs(meta, settings._get())
@@ -82,24 +166,42 @@ def run_bill_folder(bill_folder_id: str) -> dict:
     if settings.bucket_kb:
         try:
             if meta.get("provider_name"):
-                hid = ensure_hospital_overlay(meta["provider_name"], meta.get("provider_state"))
+                hid = await asyncio.to_thread(ensure_hospital_overlay, meta["provider_name"], meta.get("provider_state"))
             if meta.get("payer_name"):
-                pid = ensure_payer_overlay(meta["payer_name"], meta.get("plan_name"))
+                pid = await asyncio.to_thread(ensure_payer_overlay, meta["payer_name"], meta.get("plan_name"))
         except Exception as e:
             meta["overlay_warning"] = f"overlay skipped due to error: {type(e).__name__}"
 
     meta["hospital_id"] = hid
     meta["payer_id"] = pid
 
-    # Persist meta for downstream consumers
-    upload_json_to_bill_outputs(bill_folder_id, _output_filename("meta.json"), meta)
-
-    # Load non-PHI base docs locally
+    # Load non-PHI base docs from the precompiled KB bundle (mmap'd, shared across bills)
     project_root = Path(__file__).resolve().parents[2]
-    global_kb = load_local_global_kb_text(str(project_root / "rag_base"))
+    kb = await asyncio.to_thread(load_kb_bundle, str(project_root / "rag_base"))
+    meta["kb_bundle_hash"] = kb.hash
+    # Only the chunks relevant to this bill (BM25 top-k under KB_TOKEN_BUDGET)
+    retrieved_kb, meta["kb_retrieval"] = await asyncio.to_thread(
+        retrieve_kb, kb, meta, (eob_text, itemized_text, statement_text)
+    )
     overlay_kb = ""  # MVP: keep empty; add real overlay retrieval later
 
+    # Itemized bill -> typed line items (line_items.json) with published cash / gross prices;
+    # the prompt gets them as a compact table
+    line_items = await asyncio.to_thread(parse_itemized, itemized_text)
+    line_items_table = ""
+    if line_items is not None:
+        # prices are optional: a missing / unreadable PRICE_INDEX leaves the items unpriced
+        try:
+            price_stats = await asyncio.to_thread(price_line_items, line_items, meta.get("provider_name"))
+        except Exception as e:
+            price_stats = {"error": type(e).__name__}
+        line_items_table = prompt_table(line_items)
+        meta["line_items"] = {**line_items.summary(), "in_prompt": bool(line_items_table)}
+        if price_stats is not None:
+            meta["price_lookup"] = price_stats
+
     # Build prompt for findings.json with proper parameters
+    pack_stats = {}
     prompt = build_reduction_prompt(
         meta=meta,
         bill_texts={
@@ -107,117 +209,122 @@ def run_bill_folder(bill_folder_id: str) -> dict:
             "itemized_text": itemized_text,
             "statement_text": statement_text,
         },
-        retrieved_docs_text="",
+        retrieved_docs_text=retrieved_kb,
         eob_text=eob_text,
         itemized_text=itemized_text,
         statement_text=statement_text,
-        global_kb=global_kb,
+        global_kb="",
         overlay_kb=overlay_kb,
+        pack_stats=pack_stats,
+        itemized_table=line_items_table,
     )
+    meta["prompt_packing"] = pack_stats
+    meta["models"] = models_for(("extract_multi", "findings", "report", "email", "letter"))
+
+    # Persist meta for downstream consumers (after packing, so it records what was dropped)
+    outputs = [upload_json_to_bill_outputs_async(bill_folder_id, _output_filename("meta.json"), meta)]
+    if line_items is not None:
+        outputs.append(upload_json_to_bill_outputs_async(
+            bill_folder_id, _output_filename("line_items.json"), line_items.to_json()
+        ))
+    await asyncio.gather(*outputs)
 
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if settings.model_id == "gemini-3-pro-preview":
-        resp = generate_content_rest(
-            model_id=settings.model_id,
-            contents=[prompt],
+    # ===== Generation stages =====
+    # findings -> {report, email, letter}; letter -> redaction.
+    # Independent stages run concurrently (STAGE_MAX_WORKERS).
+    async def stage_findings():
+        resp = await generate_async(
+            "findings", [prompt],
             config={"response_mime_type": "application/json"},
+            cache_extra=(kb.hash,),
         )
-    else:
-        client = get_genai_client()
-        resp = client.models.generate_content(
-            model=settings.model_id,
-            contents=[prompt],
-            config={"response_mime_type":"application/json"},
-        )
-    findings_json = json.loads(resp.text)
-
-    # 1) findings.json
-    upload_json_to_bill_outputs(bill_folder_id, _output_filename("findings.json"), findings_json)
-
-    # 2) report.md (now LLM-generated)
-    report_prompt = build_report_md_prompt(bill_folder_id, meta, findings_json)
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if settings.model_id == "gemini-3-pro-preview":
-        report_resp = generate_content_rest(
-            model_id=settings.model_id,
-            contents=[report_prompt],
-        )
-    else:
-        client = get_genai_client()
-        report_resp = client.models.generate_content(
-            model=settings.model_id,
-            contents=[report_prompt],
-        )
-    upload_text_to_bill_outputs(
-        bill_folder_id,
-        "report.md",
-        report_resp.text,
-        content_type="text/markdown; charset=utf-8"
-    )
+        findings_json = json.loads(resp.text)
+        # 1) findings.json
+        await upload_json_to_bill_outputs_async(bill_folder_id, _output_filename("findings.json"), findings_json)
+        return findings_json
 
-    # 3) email_draft.txt
-    email_prompt = build_user_email_prompt(None, findings_json, meta)
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if settings.model_id == "gemini-3-pro-preview":
-        email_resp = generate_content_rest(
-            model_id=settings.model_id,
-            contents=[email_prompt],
-        )
-    else:
-        client = get_genai_client()
-        email_resp = client.models.generate_content(
-            model=settings.model_id,
-            contents=[email_prompt],
-        )
-    upload_text_to_bill_outputs(bill_folder_id, _output_filename("email_draft.txt"), email_resp.text)
-
-    # 4) hospital_letter_for_docs.txt
-    #    患者主導・署名欄付きの説明/交渉ドキュメント（Google Docs 貼り付け用）
-    #    Now LLM-generated instead of template-based
-    hospital_letter_prompt = build_hospital_letter_prompt(meta, findings_json, user_name=None)
-    # Use REST API for gemini-3-pro-preview, SDK for others
-    if settings.model_id == "gemini-3-pro-preview":
-        hospital_letter_resp = generate_content_rest(
-            model_id=settings.model_id,
-            contents=[hospital_letter_prompt],
+    async def stream_to_output(stage: str, contents: list, filename: str, content_type="text/plain; charset=utf-8") -> str:
+        # Stream the model output straight into a resumable upload (and to on_chunk, if given)
+        writer = BillOutputWriter(bill_folder_id, filename, content_type=content_type)
+
+        async def handle(text: str):
+            await writer.write(text)
+            if on_chunk is not None:
+                on_chunk(stage, text)
+
+        resp = await generate_stream_async(stage, contents, handle)
+        await writer.close()
+        return resp.text
+
+    async def stage_report(findings):
+        # 2) report.md (now LLM-generated)
+        report_prompt = build_report_md_prompt(bill_folder_id, meta, findings)
+        return await stream_to_output(
+            "report", [report_prompt], "report.md",
+            content_type="text/markdown; charset=utf-8",
         )
-    else:
-        client = get_genai_client()
-        hospital_letter_resp = client.models.generate_content(
-            model=settings.model_id,
-            contents=[hospital_letter_prompt],
+
+    async def stage_email(findings):
+        # 3) email_draft.txt
+        email_prompt = build_user_email_prompt(None, findings, meta)
+        return await stream_to_output("email", [email_prompt], _output_filename("email_draft.txt"))
+
+    async def stage_letter(findings):
+        # 4) hospital_letter_for_docs.txt
+        #    患者主導・署名欄付きの説明/交渉ドキュメント（Google Docs 貼り付け用）
+        #    Now LLM-generated instead of template-based
+        hospital_letter_prompt = build_hospital_letter_prompt(meta, findings, user_name=None)
+        return await stream_to_output(
+            "letter", [hospital_letter_prompt], _output_filename("hospital_letter_for_docs.txt"),
         )
-    upload_text_to_bill_outputs(
-        bill_folder_id,
-        _output_filename("hospital_letter_for_docs.txt"),
-        hospital_letter_resp.text,
-        content_type="text/plain; charset=utf-8"
-    )
 
-    # 4b) Redact personal info from the hospital letter using Gemini 2.5 Flash (for safe re-use with other LLMs)
-    redact_prompt = f"""
-    You will be given a patient-led hospital billing letter. Redact or replace ALL personally identifiable information (PII/PHI), including:
-    - Names, dates of birth, addresses, phone numbers, emails
-    - Account numbers, claim numbers, policy numbers, medical record numbers
-    - Bill folder IDs, signature lines with names/dates
-    Replace each with "[REDACTED]" while keeping the rest of the letter structure intact and readable.
-    Return ONLY the redacted letter text.
-    """
+    redaction_stats = {}
 
-    redaction_resp = generate_content_rest(
-        model_id="gemini-2.5-flash",
-        contents=[redact_prompt, hospital_letter_resp.text],
-    )
-    upload_text_to_bill_outputs(
-        bill_folder_id,
-        _output_filename("hospital_letter_for_docs_redacted.txt"),
-        redaction_resp.text,
-        content_type="text/plain; charset=utf-8"
+    async def stage_redaction(letter):
+        # 4b) Redact personal info from the hospital letter (for safe re-use with other LLMs):
+        #     local detectors + names from this bill; LLM pass only when coverage is low
+        terms = name_terms(meta, raw_texts.values(), extra=(bill_folder_id,))
+        result = redact_text(letter, terms)
+        redacted = result.text
+        if result.low_coverage and settings.redaction_llm_fallback:
+            redaction_resp = await generate_async("redaction", [REDACT_PROMPT, redacted])
+            redacted = redaction_resp.text
+            result.llm_pass = True
+        redaction_stats.update(result.stats())
+        await upload_text_to_bill_outputs_async(
+            bill_folder_id,
+            _output_filename("hospital_letter_for_docs_redacted.txt"),
+            redacted,
+            content_type="text/plain; charset=utf-8"
+        )
+        return redacted
+
+    skipped = {}
+    results = await run_stages_async(
+        [
+            Stage("findings", stage_findings),
+            Stage("report", stage_report, ("findings",), optional=True),
+            Stage("email", stage_email, ("findings",), optional=True),
+            Stage("letter", stage_letter, ("findings",), optional=True),
+            Stage("redaction", stage_redaction, ("letter",), optional=True),
+        ],
+        max_workers=settings.stage_max_workers,
+        skip=_skip_for_deadline,
+        skipped=skipped,
     )
 
-    return {
+    out = {
         "bill_folder_id": bill_folder_id,
         "meta": meta,
-        "findings": findings_json,
+        "findings": results["findings"],
         "saved": True,
     }
+    if redaction_stats:
+        meta["redaction"] = redaction_stats
+    if skipped:
+        # record why artifacts are missing
+        meta["skipped_stages"] = skipped
+        out["skipped_stages"] = skipped
+    if redaction_stats or skipped:
+        await upload_json_to_bill_outputs_async(bill_folder_id, _output_filename("meta.json"), meta)
+    return out
@@ -0,0 +1,276 @@
+"""
+Cash-price lookup over scripts/build_price_cash_lite.py output.
+
+The CSV (campus, code, description, gross_charge, cash_price) is loaded once per
+process into a compact code-keyed index:
+- rows sorted by (code, campus); codes in a sorted list searched with bisect, campus /
+  description ids and prices in array-backed columns (prices as doubles, NaN = missing)
+- a bloom filter over codes answers most misses (codes the hospital does not publish)
+  without touching the sorted column
+- lookup(codes, campus) resolves a batch of codes at once -> {code: PriceMatch or None},
+  with min / max cash and gross prices across the matching rows
+
+PRICE_INDEX points at the CSV, or at the script's Parquet / Arrow IPC output (.parquet,
+.arrow / .feather; needs pyarrow, read through a memory map, schema version checked)
+(empty = disabled). The campus comes from PRICE_CAMPUS or
+is matched against the bill's provider name; prices from another hospital would be
+misleading, so nothing is attached when no campus matches.
+"""
+import csv
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as paipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+from .config import Config, settings
+from .line_items import ParseResult
+
+BLOOM_FP_RATE = 0.01
+
+# highest "medbill.schema_version" of the columnar build output this reader understands
+PRICE_SCHEMA_VERSION = 1
+COLUMNAR_SUFFIXES = (".parquet", ".arrow", ".feather")
+PRICE_COLUMNS = ["campus", "code", "description", "gross_charge", "cash_price"]
+
+
+class BloomFilter:
+    """Fixed-size bloom filter (double hashing over one blake2b digest)."""
+
+    def __init__(self, n: int, fp_rate: float = BLOOM_FP_RATE):
+        n = max(1, n)
+        self.m = max(64, int(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / n * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key: str):
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.m
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+def normalize_code(value) -> str:
+    """'99213.0' -> '99213', ' j1100 ' -> 'J1100', '250' (revenue code) -> '0250'."""
+    code = str(value or "").strip().upper()
+    if code in ("", "NAN", "NONE"):
+        return ""
+    if code.endswith(".0") and code[:-2].isdigit():
+        code = code[:-2]
+    if code.isdigit() and len(code) == 3:
+        code = "0" + code
+    return code
+
+
+def _price(value) -> float:
+    s = str(value or "").replace("$", "").replace(",", "").strip()
+    try:
+        v = float(s)
+    except ValueError:
+        return math.nan
+    return v if v > 0 else math.nan
+
+
+def _campus_tokens(name: str) -> List[str]:
+    name = re.sub(r"\bsaint\b", "st", (name or "").lower())
+    return [t for t in re.split(r"[^a-z0-9]+", name) if t]
+
+
+@dataclass
+class PriceMatch:
+    code: str
+    campus: str
+    rows: int
+    cash_min: Optional[float]
+    cash_max: Optional[float]
+    gross_min: Optional[float]
+    gross_max: Optional[float]
+    description: str
+
+
+class PriceIndex:
+    def __init__(self, rows: Iterable[Tuple[str, str, str, float, float]]):
+        """rows: (code, campus, description, gross, cash); code already normalized."""
+        self.campuses: List[str] = []
+        self.descriptions: List[str] = []
+        campus_ids: Dict[str, int] = {}
+        desc_ids: Dict[str, int] = {}
+        keyed = []
+        for code, campus, desc, gross, cash in rows:
+            cid = campus_ids.setdefault(campus, len(campus_ids))
+            did = desc_ids.setdefault(desc, len(desc_ids))
+            keyed.append((code, cid, cash, gross, did))
+        self.campuses = list(campus_ids)
+        self._campus_ids = campus_ids
+        self.descriptions = list(desc_ids)
+        keyed.sort()
+
+        self.codes: List[str] = [r[0] for r in keyed]
+        self.campus_id = array("H", (r[1] for r in keyed))
+        self.cash = array("d", (r[2] for r in keyed))
+        self.gross = array("d", (r[3] for r in keyed))
+        self.desc_id = array("I", (r[4] for r in keyed))
+
+        unique = set(self.codes)
+        self.bloom = BloomFilter(len(unique))
+        for code in unique:
+            self.bloom.add(code)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def resolve_campus(self, provider_name: str) -> Optional[str]:
+        """Campus whose name tokens all appear in the provider name (longest match wins)."""
+        words = set(_campus_tokens(provider_name))
+        best = None
+        for campus in self.campuses:
+            tokens = _campus_tokens(campus)
+            if tokens and all(t in words for t in tokens):
+                if best is None or len(tokens) > len(_campus_tokens(best)):
+                    best = campus
+        return best
+
+    def _match(self, code: str, campus: str) -> Optional[PriceMatch]:
+        if code not in self.bloom:
+            return None
+        lo = bisect_left(self.codes, code)
+        hi = bisect_right(self.codes, code, lo)
+        if lo == hi:
+            return None
+        cid = self._campus_ids.get(campus)
+        if cid is None:
+            return None
+        idx = [i for i in range(lo, hi) if self.campus_id[i] == cid]
+        if not idx:
+            return None
+        cash = [self.cash[i] for i in idx if not math.isnan(self.cash[i])]
+        gross = [self.gross[i] for i in idx if not math.isnan(self.gross[i])]
+        return PriceMatch(
+            code=code,
+            campus=campus,
+            rows=len(idx),
+            cash_min=min(cash) if cash else None,
+            cash_max=max(cash) if cash else None,
+            gross_min=min(gross) if gross else None,
+            gross_max=max(gross) if gross else None,
+            description=self.descriptions[self.desc_id[idx[0]]],
+        )
+
+    def lookup(self, codes: Iterable[str], campus: str) -> Dict[str, Optional[PriceMatch]]:
+        """Batch lookup: {normalized code: PriceMatch or None} for one campus."""
+        out: Dict[str, Optional[PriceMatch]] = {}
+        for code in sorted({normalize_code(c) for c in codes} - {""}):
+            out[code] = self._match(code, campus)
+        return out
+
+
+def read_price_csv(path: str) -> PriceIndex:
+    def rows():
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            for r in csv.DictReader(f):
+                code = normalize_code(r.get("code"))
+                cash = _price(r.get("cash_price"))
+                if not code or math.isnan(cash):
+                    continue
+                yield (
+                    code,
+                    (r.get("campus") or "").strip(),
+                    (r.get("description") or "").strip(),
+                    _price(r.get("gross_charge")),
+                    cash,
+                )
+    return PriceIndex(rows())
+
+
+def _columnar_price(value) -> float:
+    # float32 in the file -> round back to cents
+    return round(value, 2) if value is not None and value > 0 else math.nan
+
+
+def read_price_table(path: str) -> PriceIndex:
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError(f"PRICE_INDEX={path} is a Parquet / Arrow file; install pyarrow or use the CSV output")
+    if path.lower().endswith(".parquet"):
+        table = pq.read_table(path, columns=PRICE_COLUMNS, memory_map=True)
+    else:
+        table = paipc.open_file(pa.memory_map(path)).read_all().select(PRICE_COLUMNS)
+    version = int((table.schema.metadata or {}).get(b"medbill.schema_version", b"0"))
+    if version > PRICE_SCHEMA_VERSION:
+        raise ValueError(f"{path}: price schema version {version} is newer than supported ({PRICE_SCHEMA_VERSION})")
+
+    def rows():
+        cols = [table.column(c).to_pylist() for c in PRICE_COLUMNS]
+        for campus, code, desc, gross, cash in zip(*cols):
+            code = normalize_code(code)
+            cash = _columnar_price(cash)
+            if not code or math.isnan(cash):
+                continue
+            yield code, (campus or "").strip(), (desc or "").strip(), _columnar_price(gross), cash
+    return PriceIndex(rows())
+
+
+_lock = threading.Lock()
+# path -> (mtime, size, index)
+_loaded: Dict[str, tuple] = {}
+
+
+def load_price_index(path: str) -> PriceIndex:
+    """Process-wide index for path, reloaded when the file changes."""
+    st = os.stat(path)
+    hit = _loaded.get(path)
+    if hit and hit[:2] == (st.st_mtime, st.st_size):
+        return hit[2]
+    with _lock:
+        hit = _loaded.get(path)
+        if hit and hit[:2] == (st.st_mtime, st.st_size):
+            return hit[2]
+        index = read_price_table(path) if path.lower().endswith(COLUMNAR_SUFFIXES) else read_price_csv(path)
+        _loaded[path] = (st.st_mtime, st.st_size, index)
+        return index
+
+
+def price_line_items(result: ParseResult, provider_name: Optional[str], cfg: Optional[Config] = None) -> Optional[Dict]:
+    """
+    Attach cash / gross prices to parsed line items (CPT/HCPCS code, else revenue code).
+    Returns stats for meta.json, or None when PRICE_INDEX is not set.
+    """
+    cfg = cfg or settings._get()
+    if not cfg.price_index_path:
+        return None
+    t0 = time.perf_counter()
+    index = load_price_index(cfg.price_index_path)
+    campus = cfg.price_campus or index.resolve_campus(provider_name or "")
+    stats = {"campus": campus, "index_rows": len(index), "priced": 0, "items": len(result.items)}
+    if campus:
+        keys = [normalize_code(it.code or it.revenue_code) for it in result.items]
+        matches = index.lookup(keys, campus)
+        for it, key in zip(result.items, keys):
+            m = matches.get(key)
+            if m is None:
+                continue
+            it.cash_price, it.cash_price_max = m.cash_min, m.cash_max
+            it.gross_charge = m.gross_min
+            stats["priced"] += 1
+    stats["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return stats
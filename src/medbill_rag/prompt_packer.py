@@ -0,0 +1,135 @@
+"""
+Token-budget-aware packing of prompt sections.
+
+Replaces fixed character slicing (eob[:6000], itemized[:8000], ...) with:
+- a local token estimate (no tokenizer round trip)
+- a budget and priority per section; budget a short section does not use is handed to
+  the next sections in priority order
+- when a section is over budget, evidence lines (dollar amounts, CPT/HCPCS/revenue/ICD
+  codes, dates) are kept ahead of boilerplate, in original order
+- stats per section (tokens in/out, dropped lines, dropped evidence lines) for meta.json
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .bill_patterns import BILLING_CODE, DATE, MONEY
+from .config import Config, settings
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+# share of PROMPT_BILL_TOKEN_BUDGET per bill document, in priority order
+BILL_SECTIONS = (
+    ("itemized_text", 0.45),
+    ("eob_text", 0.30),
+    ("statement_text", 0.25),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE-style estimate: one token per punctuation mark, ~4 chars per word piece."""
+    if not text:
+        return 0
+    n = 0
+    for piece in _PIECE.findall(text):
+        n += (len(piece) + 3) // 4 if len(piece) > 4 else 1
+    return n
+
+
+def line_priority(line: str) -> int:
+    """2 = evidence (amounts / codes / dates), 1 = other text, 0 = blank or punctuation only."""
+    if MONEY.search(line) or BILLING_CODE.search(line) or DATE.search(line):
+        return 2
+    if any(c.isalnum() for c in line):
+        return 1
+    return 0
+
+
+@dataclass
+class Section:
+    name: str
+    text: str
+    budget: int
+    priority: int = 0  # lower packs first and receives unused budget first
+
+
+def _fit_lines(text: str, budget: int) -> Tuple[str, Dict]:
+    lines = text.splitlines()
+    costs = [estimate_tokens(l) + 1 for l in lines]
+    prios = [line_priority(l) for l in lines]
+
+    keep = [False] * len(lines)
+    used = 0
+    for level in (2, 1):
+        for i, p in enumerate(prios):
+            if p == level and not keep[i] and used + costs[i] <= budget:
+                keep[i] = True
+                used += costs[i]
+
+    dropped = [i for i, k in enumerate(keep) if not k and prios[i] > 0]
+    out: List[str] = []
+    gap = 0
+    for i, line in enumerate(lines):
+        if keep[i]:
+            if gap:
+                out.append(f"[... {gap} line(s) omitted ...]")
+                gap = 0
+            out.append(line)
+        elif prios[i] > 0:
+            gap += 1
+    if gap:
+        out.append(f"[... {gap} line(s) omitted ...]")
+
+    stats = {
+        "dropped_lines": len(dropped),
+        "dropped_evidence_lines": sum(1 for i in dropped if prios[i] == 2),
+    }
+    return "\n".join(out), stats
+
+
+def pack_sections(sections: List[Section]) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """
+    Returns ({name: packed text}, {name: stats}). Sections are packed in priority order;
+    leftover budget is carried to the next section.
+    """
+    packed: Dict[str, str] = {}
+    stats: Dict[str, Dict] = {}
+    carry = 0
+    for s in sorted(sections, key=lambda s: s.priority):
+        budget = s.budget + carry
+        tokens_in = estimate_tokens(s.text)
+        if tokens_in <= budget:
+            packed[s.name] = s.text
+            st = {"dropped_lines": 0, "dropped_evidence_lines": 0}
+            tokens_out = tokens_in
+        else:
+            # omission markers cost tokens too: shrink the line budget until the result fits
+            target = budget
+            for _ in range(4):
+                packed[s.name], st = _fit_lines(s.text, target)
+                tokens_out = estimate_tokens(packed[s.name])
+                if tokens_out <= budget:
+                    break
+                target -= tokens_out - budget
+        carry = max(0, budget - tokens_out)
+        stats[s.name] = {"budget": budget, "tokens_in": tokens_in, "tokens_out": tokens_out, **st}
+    return packed, stats
+
+
+def pack_bill_texts(texts: Dict[str, str], cfg: Optional[Config] = None) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """Pack eob_text / itemized_text / statement_text into PROMPT_BILL_TOKEN_BUDGET."""
+    cfg = cfg or settings._get()
+    total = cfg.prompt_bill_token_budget
+    sections = [
+        Section(name, texts.get(name) or "", int(total * share), priority=i)
+        for i, (name, share) in enumerate(BILL_SECTIONS)
+    ]
+    # documents that are absent give their whole share away up front
+    present = [s for s in sections if s.text]
+    spare = sum(s.budget for s in sections if not s.text)
+    if present:
+        present[0].budget += spare
+        for s in sections:
+            if not s.text:
+                s.budget = 0
+    return pack_sections(sections)
@@ -1,5 +1,7 @@
 from typing import Dict, Any, Optional
 
+from .prompt_packer import pack_bill_texts
+
 
 def build_reduction_prompt(
     meta: Dict[str, Any],
@@ -10,6 +12,8 @@ def build_reduction_prompt(
     statement_text: str = "",
     global_kb: str = "",
     overlay_kb: str = "",
+    pack_stats: Optional[Dict[str, Any]] = None,
+    itemized_table: str = "",
     **kwargs
 ) -> str:
     """
@@ -17,12 +21,31 @@ def build_reduction_prompt(
     Identifies bill reduction opportunities with specific amounts, evidence, and legal basis.
     Incorporates guardrails to avoid over-claiming eligibility, mislabeling errors,
     and surfacing de minimis issues that are not practically useful.
+
+    Bill texts are packed into PROMPT_BILL_TOKEN_BUDGET (see prompt_packer); if pack_stats
+    is given it receives per-document packing stats (tokens kept, lines dropped).
+    itemized_table (line_items.prompt_table) replaces the itemized OCR text when non-empty;
+    "" (no line items, or parse coverage below LINE_ITEMS_MIN_COVERAGE_PCT) keeps the OCR text.
     """
     # Handle both old and new calling conventions
     if bill_texts:
         eob_text = bill_texts.get("eob_text", eob_text)
         statement_text = bill_texts.get("statement_text", statement_text)
         itemized_text = bill_texts.get("itemized_text", itemized_text)
+    if itemized_table:
+        itemized_text = itemized_table
+
+    # Fit the documents into the token budget, evidence lines first
+    packed, stats = pack_bill_texts({
+        "eob_text": eob_text,
+        "statement_text": statement_text,
+        "itemized_text": itemized_text,
+    })
+    eob_text = packed["eob_text"]
+    statement_text = packed["statement_text"]
+    itemized_text = packed["itemized_text"]
+    if pack_stats is not None:
+        pack_stats.update(stats)
 
     # Combine retrieved docs
     retrieved_docs_text = retrieved_docs_text or ""
@@ -62,6 +85,17 @@ def build_reduction_prompt(
     total_charge_line = format_currency(total_charge)
     patient_resp_line = format_currency(patient_resp)
 
+    if itemized_table:
+        itemized_header = (
+            "[ITEMIZED BILL - Detailed Charges, parsed line items]\n"
+            "(one row per charge: date|revenue code|CPT/HCPCS[-modifier]|description|qty|unit price|total|parse flags; "
+            "amount_mismatch / qty_inferred / no_code rows were parsed with lower confidence; "
+            "cash|gross columns, when present, are this campus's published discounted cash price (min-max) and "
+            "gross charge for the code from its price transparency file - use them as evidence for SelfPayDiscount)"
+        )
+    else:
+        itemized_header = "[ITEMIZED BILL - Detailed Charges]"
+
     prompt = f"""
 You are a US medical billing reduction analyst specializing in identifying bill reduction opportunities with concrete evidence and legal/policy basis.
 
@@ -93,13 +127,13 @@ We focus on 5 priority reduction angles:
 
 [OCR Text from Documents]
 [EOB - Explanation of Benefits]
-{eob_text[:6000] if eob_text else "(EOB not provided)"}
+{eob_text if eob_text else "(EOB not provided)"}
 
 [STATEMENT - Patient Statement]
-{statement_text[:6000] if statement_text else "(Statement not provided)"}
+{statement_text if statement_text else "(Statement not provided)"}
 
-[ITEMIZED BILL - Detailed Charges]
-{itemized_text[:8000] if itemized_text else "(Itemized bill not provided)"}
+{itemized_header}
+{itemized_text if itemized_text else "(Itemized bill not provided)"}
 
 [Critical Reasoning Discipline]
 - Clearly separate:
@@ -0,0 +1,310 @@
+"""
+Adaptive concurrency limiting and retry for Vertex AI calls.
+
+One AdaptiveLimiter per (model, location), shared by threads and event loops:
+- AIMD: every success raises the limit by 1/limit (about +1 per round of calls), a
+  429/503 halves it (at most once per THROTTLE_WINDOW_S so a burst counts once)
+- RATE_LIMIT_INITIAL (8) / RATE_LIMIT_MIN (1) / RATE_LIMIT_MAX (64) bound the limit
+- retryable errors (429, 500, 503, 504) are retried up to RATE_LIMIT_MAX_RETRIES times
+  with full-jitter exponential backoff capped at RATE_LIMIT_BACKOFF_MAX_S; a
+  Retry-After header takes precedence
+- stats() exposes current limit, in-flight calls and queue depth per key
+- call_with_backoff_async(..., stage=...) hedges single attempts (see hedging); the
+  backoff sleeps between attempts are never hedged
+- under a bill deadline (see deadline) async attempts are bounded by the remaining
+  budget and no retry is scheduled past it; the caller then gets DeadlineExceeded
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .config import Config, settings
+from .deadline import DeadlineExceeded, call_timeout, remaining
+from .hedging import hedged_attempt
+
+RETRYABLE_STATUS = frozenset({429, 500, 503, 504})
+THROTTLE_STATUS = frozenset({429, 503})
+THROTTLE_WINDOW_S = 1.0
+BACKOFF_BASE_S = 1.0
+
+
+def http_status(exc: BaseException) -> Optional[int]:
+    """HTTP status of a REST (VertexHTTPError) or SDK (google.genai / api_core) error."""
+    for attr in ("status_code", "code"):
+        v = getattr(exc, attr, None)
+        if isinstance(v, int):
+            return v
+    return None
+
+
+def _parse_retry_after(value) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    v = getattr(exc, "retry_after", None)
+    if v is not None:
+        return v
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return _parse_retry_after(headers.get("Retry-After"))
+    except AttributeError:
+        return None
+
+
+def backoff_delay(attempt: int, exc: BaseException, cfg: Config) -> float:
+    cap = float(cfg.rate_limit_backoff_max_s)
+    ra = retry_after(exc)
+    if ra is not None:
+        return min(ra, cap)
+    return random.uniform(0, min(cap, BACKOFF_BASE_S * (2 ** attempt)))
+
+
+class AdaptiveLimiter:
+    def __init__(self, key: str, initial: int, minimum: int, maximum: int):
+        self.key = key
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        # threading.Event (sync callers) or (loop, future) (async callers), FIFO
+        self._waiters: deque = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _take(self) -> bool:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wake(self) -> None:
+        # caller holds the lock; a woken waiter already owns its slot
+        while self._waiters and self.in_flight < int(self.limit):
+            w = self._waiters.popleft()
+            if isinstance(w, threading.Event):
+                self.in_flight += 1
+                w.set()
+                continue
+            loop, fut = w
+            if fut.done():
+                continue
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._hand_over, fut)
+            except RuntimeError:
+                # loop already closed
+                self.in_flight -= 1
+
+    def _hand_over(self, fut: "asyncio.Future[None]") -> None:
+        if fut.cancelled():
+            self.release()
+        else:
+            fut.set_result(None)
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._take():
+                return
+            ev = threading.Event()
+            self._waiters.append(ev)
+        ev.wait()
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (never queues)."""
+        with self._lock:
+            return self._take()
+
+    async def acquire_async(self) -> None:
+        with self._lock:
+            if self._take():
+                return
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            w = (loop, fut)
+            self._waiters.append(w)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                if w in self._waiters:
+                    self._waiters.remove(w)
+                    raise
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= THROTTLE_WINDOW_S:
+                self.limit = max(float(self.minimum), self.limit / 2)
+                self._last_decrease = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "throttled": self.throttled,
+        }
+
+
+_lock = threading.Lock()
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+
+def get_limiter(model_id: str, location: Optional[str] = None, cfg: Optional[Config] = None) -> AdaptiveLimiter:
+    cfg = cfg or settings._get()
+    key = (model_id, location or cfg.location)
+    lim = _limiters.get(key)
+    if lim is None:
+        with _lock:
+            lim = _limiters.get(key)
+            if lim is None:
+                lim = AdaptiveLimiter(
+                    f"{key[0]}@{key[1]}",
+                    cfg.rate_limit_initial,
+                    cfg.rate_limit_min,
+                    cfg.rate_limit_max,
+                )
+                _limiters[key] = lim
+    return lim
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {lim.key: lim.snapshot() for lim in list(_limiters.values())}
+
+
+def _should_retry(exc: BaseException, attempt: int, cfg: Config, can_retry) -> bool:
+    return (
+        http_status(exc) in RETRYABLE_STATUS
+        and attempt < cfg.rate_limit_max_retries
+        and (can_retry is None or can_retry())
+    )
+
+
+def _check_deadline(exc: BaseException, delay: float = 0.0) -> None:
+    """Turn a failure into DeadlineExceeded when the bill budget cannot cover (another) attempt."""
+    left = remaining()
+    if left is not None and left <= delay:
+        raise DeadlineExceeded(f"deadline exceeded ({type(exc).__name__}: {exc})") from exc
+
+
+def call_with_backoff(
+    model_id: str,
+    call: Callable[[], Any],
+    location: Optional[str] = None,
+    cfg: Optional[Config] = None,
+) -> Any:
+    """Run call() under the (model, location) limiter, retrying quota/overload errors."""
+    cfg = cfg or settings._get()
+    limiter = get_limiter(model_id, location, cfg)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            result = call()
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if http_status(e) in THROTTLE_STATUS:
+                limiter.on_throttle()
+            _check_deadline(e)
+            if not _should_retry(e, attempt, cfg, None):
+                raise
+            delay = backoff_delay(attempt, e, cfg)
+            _check_deadline(e, delay)
+        else:
+            limiter.on_success()
+            return result
+        finally:
+            limiter.release()
+        time.sleep(delay)
+        attempt += 1
+
+
+async def call_with_backoff_async(
+    model_id: str,
+    call: Callable[[], Awaitable[Any]],
+    location: Optional[str] = None,
+    cfg: Optional[Config] = None,
+    can_retry: Optional[Callable[[], bool]] = None,
+    stage: Optional[str] = None,
+) -> Any:
+    """
+    Async counterpart of call_with_backoff. can_retry() is consulted before a retry
+    (e.g. a stream that already delivered chunks must not be restarted). With a stage,
+    each attempt may be hedged (hedging.hedged_attempt).
+    """
+    cfg = cfg or settings._get()
+    limiter = get_limiter(model_id, location, cfg)
+
+    def throttled(e: BaseException) -> None:
+        if http_status(e) in THROTTLE_STATUS:
+            limiter.on_throttle()
+
+    if stage is not None:
+        plain = call
+
+        def call() -> Awaitable[Any]:
+            return hedged_attempt(model_id, stage, plain, limiter, cfg, throttled)
+
+    attempt = 0
+    while True:
+        timeout = call_timeout(None)
+        await limiter.acquire_async()
+        try:
+            if timeout is None:
+                result = await call()
+            else:
+                result = await asyncio.wait_for(call(), call_timeout(timeout))
+        except DeadlineExceeded:
+            raise
+        except asyncio.TimeoutError as e:
+            if timeout is None:
+                raise
+            raise DeadlineExceeded("deadline exceeded while waiting for the model") from e
+        except Exception as e:
+            throttled(e)
+            _check_deadline(e)
+            if not _should_retry(e, attempt, cfg, can_retry):
+                raise
+            delay = backoff_delay(attempt, e, cfg)
+            _check_deadline(e, delay)
+        else:
+            limiter.on_success()
+            return result
+        finally:
+            limiter.release()
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -0,0 +1,310 @@
+"""
+Local, deterministic PII redaction for the hospital letter.
+
+Replaces the gemini-2.5-flash redaction round trip with detectors that run in-process:
+- regex: emails, phone/fax numbers, SSNs, full dates, street / PO box / "City, ST 12345"
+  addresses, labelled identifiers (account, claim, member, policy, group, MRN ... numbers),
+  long unlabelled ID-like tokens and title + name ("Dr. Jane Roe")
+- a per-bill name dictionary seeded from meta, the bill's OCR text and the letter itself
+  ("Patient Name: ...", "Guarantor: ...", "Physician: ...", "Dear ..."), matched as full
+  name, "LAST, FIRST" and single name tokens, plus literal terms such as the bill folder id
+
+Every hit becomes "[REDACTED]"; template placeholders ("[Patient Name]") are left alone.
+
+coverage is the share of PII fields in the output ("Account Number: ...", "DOB: ...",
+"Patient Name: ...") whose value no longer shows digits / names. Below
+REDACTION_MIN_COVERAGE_PCT the result is flagged low_coverage and the pipeline may run
+the LLM redaction prompt over the locally redacted text (REDACTION_LLM_FALLBACK=true).
+"""
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Set, Tuple
+
+from .config import Config, settings
+
+REDACTED = "[REDACTED]"
+
+_MONTH = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*\.?"
+_STREET_SUFFIX = (
+    r"(?i:street|st|avenue|ave|road|rd|boulevard|blvd|drive|dr|lane|ln|way|court|ct|place|pl"
+    r"|parkway|pkwy|highway|hwy|circle|cir|terrace|ter|trail|trl)"
+)
+
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+_PHONE = re.compile(
+    r"(?<![\w$.])(?:\+?1[\s.-]?)?(?:\(\d{3}\)\s?|\d{3}[\s.-])\d{3}[\s.-]\d{4}"
+    r"(?:\s*(?:x|ext\.?)\s*\d{1,5})?\b",
+    re.IGNORECASE,
+)
+_SSN = re.compile(r"\b\d{3}-\d{2}-\d{4}\b")
+_DATE = re.compile(
+    r"\b\d{1,2}[/-]\d{1,2}[/-](?:\d{4}|\d{2})\b"
+    r"|\b\d{4}-\d{2}-\d{2}\b"
+    rf"|\b{_MONTH}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}\b"
+    rf"|\b\d{{1,2}}\s+{_MONTH},?\s+\d{{4}}\b",
+    re.IGNORECASE,
+)
+_STREET = re.compile(
+    rf"\b\d{{1,6}}\s+(?:[NSEW]\.?\s+)?(?:[A-Z0-9][\w'.-]*\s+){{1,4}}{_STREET_SUFFIX}\b\.?"
+    r"(?:,?\s+(?i:apt|suite|ste|unit|#)\.?\s*[\w-]+)?"
+)
+_PO_BOX = re.compile(r"\bP\.?\s?O\.?\s+Box\s+\d+\b", re.IGNORECASE)
+_CITY_ZIP = re.compile(r"\b[A-Z][A-Za-z.'-]+(?:\s+[A-Z][A-Za-z.'-]+){0,3},\s*[A-Z]{2}\s+\d{5}(?:-\d{4})?\b")
+_LABELLED_ID = re.compile(
+    r"\b(?:patient\s+)?(?:account|acct|claim|member|subscriber|policy|group|medical\s+record|mrn"
+    r"|patient|guarantor|invoice|reference|ref|visit|encounter|case|id)"
+    r"(?:\s*(?:#|no\.?|number|num|id))?\b\**\s*[:#]?\s*\**\s*"
+    r"(?P<value>[A-Z0-9][A-Z0-9-]{3,}(?:[ ](?=[A-Z0-9-]*\d)[A-Z0-9-]{2,})*)\b",
+    re.IGNORECASE,
+)
+_LONG_ID = re.compile(r"\b(?=[A-Z0-9-]*\d)(?=[A-Z0-9-]*[A-Z])[A-Z0-9][A-Z0-9-]{7,}\b|\b\d{8,}\b")
+_TITLE_NAME = re.compile(
+    r"\b(?:Dr|Mr|Mrs|Ms|Miss)\.?\s+(?P<name>[A-Z][A-Za-z'-]+(?:\s+[A-Z]\.?)?(?:\s+[A-Z][A-Za-z'-]+)?)"
+)
+_PLACEHOLDER = re.compile(r"\[[^\]\n]{1,60}\]")
+
+# name sources: "<label>: <name>" (OCR forms, letter header) and "Dear <name>,"
+_NAME_LABEL = re.compile(
+    r"\b(?:(?:patient|guarantor|subscriber|member|insured|printed)\s+name|patient|guarantor|subscriber"
+    r"|insured|policy\s*holder|responsible\s+party|beneficiary|name"
+    r"|(?:attending|rendering|referring|ordering|treating)?\s*(?:physician|provider|doctor))"
+    r"\**\s*[:\-]\s*\**\s*(?P<name>[^\n\t|]{3,60})",
+    re.IGNORECASE,
+)
+_DEAR = re.compile(r"\bDear\s+(?P<name>[A-Z][A-Za-z'-]+(?:\s+[A-Z]\.?)?(?:\s+[A-Z][A-Za-z'-]+)?)")
+_NAME_TOKEN = re.compile(r"[A-Za-z][A-Za-z'-]*")
+_NAME_SHAPE = re.compile(r"[A-Za-z][A-Za-z'.,\s-]*")
+
+# a candidate containing any of these is an organisation / label, not a person
+_NOT_A_NAME = frozenset(
+    "hospital medical center health healthcare clinic care services group insurance plan "
+    "company inc llc corp associates physicians university department billing financial "
+    "patient account number date birth dob id member claim policy address phone balance "
+    "amount total due statement services information n/a none unknown your the of".split()
+)
+# single name tokens that are also ordinary words are only matched as part of a full name
+_COMMON_TOKENS = frozenset(
+    "may will bill mark grace hope faith joy june april august rose dean page king young "
+    "long white black brown green gray grey rich penny sun star".split()
+)
+_CREDENTIALS = frozenset("md do np pa rn dds phd jr sr ii iii iv".split())
+
+# "<PII label>: value" fields checked for coverage after redaction
+_FIELD = re.compile(
+    r"\b(?P<label>(?:(?:patient|guarantor|subscriber|insured|printed|member)\s+)?name|date\s+of\s+birth|dob"
+    r"|(?:account|acct|claim|member|subscriber|policy|group|medical\s+record|mrn)(?:\s*(?:#|no\.?|number|id))?"
+    r"|phone|telephone|e-?mail|address|ssn|social\s+security(?:\s+number)?)\b\**\s*[:#]\s*\**(?P<value>[^\n]*)",
+    re.IGNORECASE,
+)
+_MONEY_OR_PUNCT = re.compile(r"\$\s?[\d,]+(?:\.\d{2})?|[^\w\s]")
+
+
+def _has_digit(value: str) -> bool:
+    return any(c.isdigit() for c in value)
+
+
+# (kind, pattern, group, accept(match text) or None)
+_DETECTORS: List[Tuple[str, Pattern, Optional[str], Optional[Callable[[str], bool]]]] = [
+    ("email", _EMAIL, None, None),
+    ("ssn", _SSN, None, None),
+    ("phone", _PHONE, None, None),
+    ("date", _DATE, None, None),
+    ("address", _STREET, None, None),
+    ("address", _PO_BOX, None, None),
+    ("address", _CITY_ZIP, None, None),
+    ("identifier", _LABELLED_ID, "value", _has_digit),
+    ("identifier", _LONG_ID, None, None),
+    ("name", _TITLE_NAME, "name", None),
+]
+
+
+def person_name(value: str) -> Optional[List[str]]:
+    """
+    Name tokens (first ... last) if value looks like a person's name, else None.
+    Accepts "Jane Q. Roe", "ROE, JANE Q", "Jane Roe MD"; rejects organisations and labels.
+    """
+    if not value:
+        return None
+    value = re.split(r"\s{2,}|\t", value.strip())[0]
+    last_first = "," in value
+    tokens = []
+    for t in _NAME_TOKEN.findall(value):
+        low = t.lower().strip("'-")
+        if low in _NOT_A_NAME:
+            return None
+        if low in _CREDENTIALS:
+            continue
+        tokens.append(t)
+    if last_first:
+        head, _, tail = value.partition(",")
+        head_tokens = [t for t in _NAME_TOKEN.findall(head) if t.lower() not in _CREDENTIALS]
+        tail_tokens = [t for t in _NAME_TOKEN.findall(tail) if t.lower() not in _CREDENTIALS]
+        if head_tokens and tail_tokens:
+            tokens = tail_tokens + head_tokens
+    if not 2 <= len([t for t in tokens if len(t) > 1]) <= 4:
+        return None
+    return tokens
+
+
+def _names_in(text: str) -> Iterable[List[str]]:
+    for pattern in (_NAME_LABEL, _DEAR, _TITLE_NAME):
+        for m in pattern.finditer(text or ""):
+            tokens = person_name(m.group("name"))
+            if tokens:
+                yield tokens
+
+
+def name_terms(meta: Dict, texts: Iterable[str], extra: Iterable[str] = ()) -> Set[str]:
+    """
+    Dictionary terms for one bill: person names from meta (patient/guarantor/... name
+    fields, provider_name when it is a person) and from the OCR text, plus extra literal
+    terms (e.g. the bill folder id).
+    """
+    terms: Set[str] = {str(t) for t in extra if t}
+    for key in ("patient_name", "guarantor_name", "subscriber_name", "member_name", "provider_name"):
+        tokens = person_name(str(meta.get(key) or ""))
+        if tokens:
+            terms.add(" ".join(tokens))
+    for text in texts:
+        for tokens in _names_in(text or ""):
+            terms.add(" ".join(tokens))
+    return terms
+
+
+def _dictionary_patterns(terms: Iterable[str]) -> List[Pattern]:
+    phrases: Set[str] = set()
+    singles: Set[str] = set()
+    literals: Set[str] = set()
+    for term in terms:
+        tokens = _NAME_TOKEN.findall(term)
+        if not tokens or not _NAME_SHAPE.fullmatch(term):
+            literals.add(term)
+            continue
+        full = [t for t in tokens if len(t) > 1]
+        phrases.add(r"[\s,.]+".join(map(re.escape, tokens)))
+        if len(full) >= 2:
+            first, last = full[0], full[-1]
+            phrases.add(rf"{re.escape(first)}\s+{re.escape(last)}")
+            phrases.add(rf"{re.escape(last)},\s*{re.escape(first)}")
+        for t in full:
+            if len(t) >= 3 and t.lower() not in _COMMON_TOKENS:
+                singles.update({t.capitalize(), t.upper()})
+    patterns = []
+    if phrases:
+        alt = "|".join(sorted(phrases, key=len, reverse=True))
+        patterns.append(re.compile(rf"\b(?:{alt})\b", re.IGNORECASE))
+    if singles:
+        alt = "|".join(map(re.escape, sorted(singles, key=len, reverse=True)))
+        patterns.append(re.compile(rf"\b(?:{alt})\b"))
+    if literals:
+        alt = "|".join(map(re.escape, sorted(literals, key=len, reverse=True)))
+        patterns.append(re.compile(rf"(?<![\w-])(?:{alt})(?![\w-])", re.IGNORECASE))
+    return patterns
+
+
+@dataclass
+class RedactionResult:
+    text: str
+    counts: Dict[str, int] = field(default_factory=dict)
+    fields: int = 0
+    fields_exposed: int = 0
+    coverage: float = 1.0
+    low_coverage: bool = False
+    dictionary_terms: int = 0
+    ms: float = 0.0
+    llm_pass: bool = False
+
+    def stats(self) -> Dict:
+        """Counts only (no redacted values) for meta.json."""
+        return {
+            "redacted": self.counts,
+            "fields": self.fields,
+            "fields_exposed": self.fields_exposed,
+            "coverage": round(self.coverage, 3),
+            "low_coverage": self.low_coverage,
+            "dictionary_terms": self.dictionary_terms,
+            "ms": round(self.ms, 2),
+            "llm_pass": self.llm_pass,
+        }
+
+
+def _spans(text: str, terms: Set[str]) -> List[Tuple[int, int, str]]:
+    found = []
+    for kind, pattern, group, accept in _DETECTORS:
+        for m in pattern.finditer(text):
+            if accept is not None and not accept(m.group(group or 0)):
+                continue
+            found.append((m.start(group or 0), m.end(group or 0), kind))
+    for pattern in _dictionary_patterns(terms):
+        for m in pattern.finditer(text):
+            found.append((m.start(), m.end(), "dictionary"))
+
+    holes = [(m.start(), m.end()) for m in _PLACEHOLDER.finditer(text)]
+    found = [s for s in found if not any(a <= s[0] and s[1] <= b for a, b in holes)]
+
+    merged: List[Tuple[int, int, str]] = []
+    for start, end, kind in sorted(found):
+        if merged and start <= merged[-1][1]:
+            s, e, k = merged[-1]
+            merged[-1] = (s, max(e, end), k)
+        else:
+            merged.append((start, end, kind))
+    return merged
+
+
+def _field_exposed(label: str, value: str) -> Optional[bool]:
+    """None when the field holds no value (placeholder / blank), else whether PII is still visible."""
+    rest = _PLACEHOLDER.sub(" ", value.replace(REDACTED, " ")).replace("_", " ")
+    rest = _MONEY_OR_PUNCT.sub(" ", rest).strip()
+    if not rest and REDACTED not in value:
+        return None
+    if "name" in label.lower():
+        return person_name(rest) is not None
+    return bool(re.search(r"\d{3,}", rest))
+
+
+def coverage_of(text: str) -> Tuple[int, int]:
+    """(PII fields, fields whose value is still visible) in text."""
+    fields = exposed = 0
+    for m in _FIELD.finditer(text):
+        state = _field_exposed(m.group("label"), m.group("value"))
+        if state is None:
+            continue
+        fields += 1
+        exposed += int(state)
+    return fields, exposed
+
+
+def redact_text(text: str, terms: Iterable[str] = (), cfg: Optional[Config] = None) -> RedactionResult:
+    """Redact text with the regex detectors + dictionary terms (names in text itself are added)."""
+    cfg = cfg or settings._get()
+    t0 = time.perf_counter()
+    text = text or ""
+    terms = set(terms)
+    for tokens in _names_in(text):
+        terms.add(" ".join(tokens))
+
+    out: List[str] = []
+    counts: Dict[str, int] = {}
+    pos = 0
+    for start, end, kind in _spans(text, terms):
+        out.append(text[pos:start])
+        out.append(REDACTED)
+        counts[kind] = counts.get(kind, 0) + 1
+        pos = end
+    out.append(text[pos:])
+    redacted = "".join(out)
+
+    fields, exposed = coverage_of(redacted)
+    coverage = 1.0 - exposed / fields if fields else 1.0
+    return RedactionResult(
+        text=redacted,
+        counts=counts,
+        fields=fields,
+        fields_exposed=exposed,
+        coverage=coverage,
+        low_coverage=coverage * 100 < cfg.redaction_min_coverage_pct,
+        dictionary_terms=len(terms),
+        ms=(time.perf_counter() - t0) * 1000,
+    )
@@ -2,9 +2,14 @@
 REST API client for Gemini models that are not yet supported by Python SDK.
 Uses REST API calls to Vertex AI.
 """
+import asyncio
 import json
 import subprocess
-from typing import Optional, Dict, Any, List
+import threading
+import time
+import weakref
+from datetime import timezone
+from typing import Optional, Dict, Any, List, Sequence, AsyncIterator, Awaitable, Callable, Iterable, Iterator
 
 try:
     from google.auth import default
@@ -18,45 +23,189 @@ except ImportError:
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
 from .config import settings
+from .deadline import call_timeout
+from .llm_cache import CachedResponse, cached_generate, cached_generate_async
+from .rate_limit import _parse_retry_after, call_with_backoff, call_with_backoff_async
 
 
-def _get_access_token() -> str:
-    """Get GCP access token using Application Default Credentials (ADC)."""
-    # Try using google.auth first (works in Docker with service account or ADC)
-    if GOOGLE_AUTH_AVAILABLE:
+# Refresh tokens this long before they expire so in-flight calls never carry a stale one
+TOKEN_REFRESH_MARGIN_S = 300
+# gcloud print-access-token does not report expiry; tokens live ~60 min
+GCLOUD_TOKEN_TTL_S = 45 * 60
+REQUEST_TIMEOUT_S = 300
+
+
+_TOKEN_ERROR = (
+    "Failed to get access token. "
+    "Please ensure Application Default Credentials are set up. "
+    "In Docker, this can be done by:\n"
+    "1. Setting GOOGLE_APPLICATION_CREDENTIALS to a service account key file path, or\n"
+    "2. Running 'gcloud auth application-default login' on the host and mounting ~/.config/gcloud"
+)
+
+
+class _CredentialCache:
+    """
+    Process-wide, thread-safe access token cache.
+    ADC credentials are resolved once; the token is refreshed only when it is within
+    TOKEN_REFRESH_MARGIN_S of expiry. `gcloud auth print-access-token` is the fallback.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._token: Optional[str] = None
+        self._expires_at = 0.0  # time.time() seconds
+
+    def _fresh(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN_S
+
+    def cached_token(self) -> Optional[str]:
+        """Token if it is still fresh, without blocking on a refresh."""
+        return self._token if self._fresh() else None
+
+    def token(self) -> str:
+        tok = self.cached_token()
+        if tok:
+            return tok
+        with self._lock:
+            if self._fresh():
+                return self._token
+            self._token, self._expires_at = self._refresh()
+            return self._token
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+    def _refresh(self):
+        # Try using google.auth first (works in Docker with service account or ADC).
+        # Tried again on every refresh: a transient metadata-server / refresh error must not
+        # pin the process to the gcloud fallback (not installed in the Docker image).
+        adc_error: Optional[Exception] = None
+        if GOOGLE_AUTH_AVAILABLE:
+            try:
+                if self._credentials is None:
+                    self._credentials, _ = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+                self._credentials.refresh(Request())
+                expiry = getattr(self._credentials, "expiry", None)
+                if expiry is not None:
+                    # google.auth expiry is naive UTC
+                    expires_at = expiry.replace(tzinfo=timezone.utc).timestamp()
+                else:
+                    expires_at = time.time() + GCLOUD_TOKEN_TTL_S
+                return self._credentials.token, expires_at
+            except Exception as e:
+                # Fallback to gcloud command for this attempt only
+                adc_error = e
+
+        # Fallback: try gcloud command (for local development)
         try:
-            credentials, _ = default()
-            # Refresh the token if needed
-            if not credentials.valid:
-                credentials.refresh(Request())
-            return credentials.token
-        except Exception as e:
-            # Fallback to gcloud command if ADC fails
-            pass
-
-    # Fallback: try gcloud command (for local development)
-    try:
-        result = subprocess.run(
-            ["gcloud", "auth", "print-access-token"],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        return result.stdout.strip()
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        error_msg = (
-            "Failed to get access token. "
-            "Please ensure Application Default Credentials are set up. "
-            "In Docker, this can be done by:\n"
-            "1. Setting GOOGLE_APPLICATION_CREDENTIALS to a service account key file path, or\n"
-            "2. Running 'gcloud auth application-default login' on the host and mounting ~/.config/gcloud"
-        )
-        raise RuntimeError(error_msg) from e
+            result = subprocess.run(
+                ["gcloud", "auth", "print-access-token"],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            return result.stdout.strip(), time.time() + GCLOUD_TOKEN_TTL_S
+        except FileNotFoundError as e:
+            if adc_error is not None:
+                # no gcloud (e.g. Docker): the ADC error is the real cause
+                raise adc_error
+            raise RuntimeError(_TOKEN_ERROR) from e
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(_TOKEN_ERROR) from (adc_error or e)
+
+
+_credentials = _CredentialCache()
+
+
+def _get_access_token() -> str:
+    """Get GCP access token using Application Default Credentials (ADC), cached until near expiry."""
+    return _credentials.token()
+
+
+async def _get_access_token_async() -> str:
+    # Fast path without a thread hop; only a real refresh goes to the executor
+    return _credentials.cached_token() or await asyncio.to_thread(_credentials.token)
+
+
+class _RestTransport:
+    """
+    Long-lived keep-alive connection pools for the Vertex AI REST endpoint.
+    - sync: one requests.Session shared by all threads
+    - async: one httpx.AsyncClient per event loop (clients cannot cross loops)
+    Pool size comes from REST_POOL_SIZE (default 32).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _pool_size() -> int:
+        return max(1, int(settings.rest_pool_size or 1))
+
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    n = self._pool_size()
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=n)
+                    s.mount("https://", adapter)
+                    self._session = s
+        return self._session
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            n = self._pool_size()
+            client = httpx.AsyncClient(
+                timeout=REQUEST_TIMEOUT_S,
+                limits=httpx.Limits(max_connections=n, max_keepalive_connections=n),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close the current loop's async client (call before the loop shuts down)."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_transport = _RestTransport()
+
+
+async def aclose_transport() -> None:
+    await _transport.aclose()
+
+
+def close_transport() -> None:
+    _transport.close()
 
 
 def _build_request_body(contents: List[str], response_mime_type: Optional[str] = None) -> Dict[str, Any]:
@@ -79,6 +228,100 @@ def _build_request_body(contents: List[str], response_mime_type: Optional[str] =
     return body
 
 
+def _endpoint_url(model_id: str, method: str = "generateContent") -> str:
+    cfg = settings._get()
+    return (
+        f"https://aiplatform.googleapis.com/v1/projects/{cfg.project_id}"
+        f"/locations/{cfg.location}/publishers/google/models/{model_id}:{method}"
+    )
+
+
+class VertexHTTPError(RuntimeError):
+    """Non-2xx Vertex AI response; status_code / retry_after drive retries (see rate_limit)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _http_error(
+    status_code: int,
+    text: str,
+    error_json: Optional[Dict[str, Any]],
+    url: str,
+    request_body: Dict[str, Any],
+    headers: Optional[Any] = None,
+) -> VertexHTTPError:
+    """Build the VertexHTTPError raised for a non-2xx Vertex AI response."""
+    ra = _parse_retry_after((headers or {}).get("Retry-After"))
+    if error_json is not None:
+        error_msg = error_json.get("error", {}).get("message", text)
+        return VertexHTTPError(
+            f"API call failed with status {status_code}: {error_msg}\n"
+            f"Request URL: {url}\n"
+            f"Request body: {json.dumps(request_body, indent=2)}\n"
+            f"Response: {json.dumps(error_json, indent=2)}",
+            status_code,
+            ra,
+        )
+    return VertexHTTPError(
+        f"API call failed with status {status_code}: {text}\n"
+        f"Request URL: {url}\n"
+        f"Request body: {json.dumps(request_body, indent=2)}",
+        status_code,
+        ra,
+    )
+
+
+def _extract_text(response_json: Dict[str, Any]) -> str:
+    """Pull candidates[0].content.parts[0].text out of a generateContent response."""
+    # Vertex AI response structure: candidates[0].content.parts[0].text
+    if "candidates" in response_json and len(response_json["candidates"]) > 0:
+        candidate = response_json["candidates"][0]
+        if "content" in candidate and "parts" in candidate["content"]:
+            parts = candidate["content"]["parts"]
+            if len(parts) > 0 and "text" in parts[0]:
+                return parts[0]["text"]
+
+    # Check for errors in response
+    if "error" in response_json:
+        error_info = response_json["error"]
+        error_msg = error_info.get("message", "Unknown error")
+        raise RuntimeError(f"API returned an error: {error_msg}")
+
+    # Fallback: return raw response if structure is different
+    raise RuntimeError(f"Unexpected response structure: {response_json}")
+
+
+def _chunk_text(chunk_json: Dict[str, Any]) -> str:
+    """Text of one streamGenerateContent chunk ("" for chunks without text, e.g. final usage)."""
+    if "error" in chunk_json:
+        raise RuntimeError(f"API returned an error: {chunk_json['error'].get('message', 'Unknown error')}")
+    candidates = chunk_json.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(p.get("text", "") for p in parts)
+
+
+def _sse_data(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Decode `data: {...}` events of an alt=sse stream."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if line.startswith("data:"):
+            payload = line[len("data:"):].strip()
+            if payload:
+                yield json.loads(payload)
+
+
+class _Response:
+    """Mimics the SDK response object (only .text is used by callers)."""
+    def __init__(self, text: str):
+        self.text = text
+
+
 def generate_content_rest(
     model_id: str,
     contents: List[str],
@@ -95,13 +338,8 @@ def generate_content_rest(
     Returns:
         Response text from the model
     """
-    cfg = settings._get()
     access_token = _get_access_token()
-
-    url = (
-        f"https://aiplatform.googleapis.com/v1/projects/{cfg.project_id}"
-        f"/locations/{cfg.location}/publishers/google/models/{model_id}:generateContent"
-    )
+    url = _endpoint_url(model_id)
 
     request_body = _build_request_body(contents, response_mime_type)
 
@@ -112,30 +350,24 @@ def generate_content_rest(
                 "Authorization": f"Bearer {access_token}",
                 "Content-Type": "application/json; charset=utf-8",
             }
-            response = requests.post(url, json=request_body, headers=headers, timeout=300)
+            response = _transport.session().post(url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S))
+            if response.status_code == 401:
+                # token revoked/rotated early: refresh once and retry
+                _credentials.invalidate()
+                headers["Authorization"] = f"Bearer {_get_access_token()}"
+                response = _transport.session().post(url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S))
             if not response.ok:
                 # Try to get detailed error message
                 try:
                     error_json = response.json()
-                    error_msg = error_json.get("error", {}).get("message", response.text)
-                    error_details = json.dumps(error_json, indent=2)
-                    raise RuntimeError(
-                        f"API call failed with status {response.status_code}: {error_msg}\n"
-                        f"Request URL: {url}\n"
-                        f"Request body: {json.dumps(request_body, indent=2)}\n"
-                        f"Response: {error_details}"
-                    )
-                except (ValueError, KeyError):
-                    raise RuntimeError(
-                        f"API call failed with status {response.status_code}: {response.text}\n"
-                        f"Request URL: {url}\n"
-                        f"Request body: {json.dumps(request_body, indent=2)}"
-                    )
+                except ValueError:
+                    error_json = None
+                raise _http_error(response.status_code, response.text, error_json, url, request_body, response.headers)
             response_json = response.json()
         except requests.exceptions.RequestException as e:
             raise RuntimeError(f"API call failed: {e}") from e
     else:
-        # Fallback: use curl command
+        # Last resort (requests not installed): use curl command
         import tempfile
         from pathlib import Path
 
@@ -149,6 +381,7 @@ def generate_content_rest(
                 "-H", f"Authorization: Bearer {access_token}",
                 "-H", "Content-Type: application/json; charset=utf-8",
                 "-d", f"@{request_file}",
+                "--max-time", str(max(1, int(call_timeout(REQUEST_TIMEOUT_S)))),
                 url,
             ]
 
@@ -169,37 +402,213 @@ def generate_content_rest(
             except Exception:
                 pass
 
-    # Extract text from response
-    # Vertex AI response structure: candidates[0].content.parts[0].text
-    if "candidates" in response_json and len(response_json["candidates"]) > 0:
-        candidate = response_json["candidates"][0]
-        if "content" in candidate and "parts" in candidate["content"]:
-            parts = candidate["content"]["parts"]
-            if len(parts) > 0 and "text" in parts[0]:
-                return parts[0]["text"]
+    return _extract_text(response_json)
 
-    # Check for errors in response
-    if "error" in response_json:
-        error_info = response_json["error"]
-        error_msg = error_info.get("message", "Unknown error")
-        raise RuntimeError(f"API returned an error: {error_msg}")
 
-    # Fallback: return raw response if structure is different
-    raise RuntimeError(f"Unexpected response structure: {response_json}")
+async def generate_content_rest_async(
+    model_id: str,
+    contents: List[str],
+    response_mime_type: Optional[str] = None,
+) -> str:
+    """
+    Async variant of generate_content_rest (pooled httpx.AsyncClient).
+    Lets one event loop keep many generateContent calls in flight.
+    """
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError("httpx is required for async REST calls (pip install httpx)")
+
+    access_token = await _get_access_token_async()
+    url = _endpoint_url(model_id)
+    request_body = _build_request_body(contents, response_mime_type)
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json; charset=utf-8",
+    }
+
+    try:
+        client = _transport.async_client()
+        response = await client.post(url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S))
+        if response.status_code == 401:
+            # token revoked/rotated early: refresh once and retry
+            _credentials.invalidate()
+            headers["Authorization"] = f"Bearer {await _get_access_token_async()}"
+            response = await client.post(url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S))
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"API call failed: {e}") from e
+
+    if not response.is_success:
+        try:
+            error_json = response.json()
+        except ValueError:
+            error_json = None
+        raise _http_error(response.status_code, response.text, error_json, url, request_body, response.headers)
+
+    return _extract_text(response.json())
+
+
+def stream_generate_content_rest(
+    model_id: str,
+    contents: List[str],
+    response_mime_type: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_content_rest (:streamGenerateContent?alt=sse).
+    Yields text chunks as the model produces them.
+    """
+    if not REQUESTS_AVAILABLE:
+        raise RuntimeError("requests is required for streaming REST calls")
+
+    url = _endpoint_url(model_id, "streamGenerateContent") + "?alt=sse"
+    request_body = _build_request_body(contents, response_mime_type)
+    headers = {
+        "Authorization": f"Bearer {_get_access_token()}",
+        "Content-Type": "application/json; charset=utf-8",
+    }
+    try:
+        response = _transport.session().post(url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S), stream=True)
+        if response.status_code == 401:
+            response.close()
+            _credentials.invalidate()
+            headers["Authorization"] = f"Bearer {_get_access_token()}"
+            response = _transport.session().post(url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S), stream=True)
+        with response:
+            if not response.ok:
+                try:
+                    error_json = response.json()
+                except ValueError:
+                    error_json = None
+                raise _http_error(response.status_code, response.text, error_json, url, request_body, response.headers)
+            for chunk_json in _sse_data(response.iter_lines(decode_unicode=True)):
+                text = _chunk_text(chunk_json)
+                if text:
+                    yield text
+    except requests.exceptions.RequestException as e:
+        raise RuntimeError(f"API call failed: {e}") from e
+
+
+async def stream_generate_content_rest_async(
+    model_id: str,
+    contents: List[str],
+    response_mime_type: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Async variant of stream_generate_content_rest (pooled httpx.AsyncClient)."""
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError("httpx is required for async REST calls (pip install httpx)")
+
+    url = _endpoint_url(model_id, "streamGenerateContent") + "?alt=sse"
+    request_body = _build_request_body(contents, response_mime_type)
+    client = _transport.async_client()
+
+    for attempt in range(2):
+        headers = {
+            "Authorization": f"Bearer {await _get_access_token_async()}",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+        try:
+            async with client.stream(
+                "POST", url, json=request_body, headers=headers, timeout=call_timeout(REQUEST_TIMEOUT_S),
+            ) as response:
+                if response.status_code == 401 and attempt == 0:
+                    # token revoked/rotated early: refresh once and retry
+                    _credentials.invalidate()
+                    continue
+                if not response.is_success:
+                    await response.aread()
+                    try:
+                        error_json = response.json()
+                    except ValueError:
+                        error_json = None
+                    raise _http_error(response.status_code, response.text, error_json, url, request_body, response.headers)
+                async for line in response.aiter_lines():
+                    for chunk_json in _sse_data((line,)):
+                        text = _chunk_text(chunk_json)
+                        if text:
+                            yield text
+                return
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"API call failed: {e}") from e
+
+
+async def consume_stream(
+    stage: str,
+    model_id: str,
+    contents: List[str],
+    config: Optional[Dict[str, Any]],
+    open_stream: Callable[[], AsyncIterator[str]],
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    cache_extra: Sequence[str] = (),
+) -> Any:
+    """
+    Drain `open_stream()` through the LLM response cache, awaiting on_chunk(text) per chunk.
+    A cache hit is delivered to on_chunk as a single chunk. Returns an object with .text.
+    The stream holds a rate-limiter slot; it is retried only if it failed before any chunk.
+    """
+    emitted = False
+
+    async def drain():
+        nonlocal emitted
+        parts = []
+        async for text in open_stream():
+            parts.append(text)
+            emitted = True
+            if on_chunk is not None:
+                await on_chunk(text)
+        return _Response("".join(parts))
+
+    resp = await cached_generate_async(
+        stage, model_id, contents, config,
+        lambda: call_with_backoff_async(model_id, drain, can_retry=lambda: not emitted),
+        extra=cache_extra,
+    )
+    if isinstance(resp, CachedResponse) and on_chunk is not None and resp.text:
+        await on_chunk(resp.text)
+    return resp
+
+
+async def generate_content_stream_async(
+    model_id: Optional[str] = None,
+    contents: List[str] = None,
+    config: Optional[Dict[str, Any]] = None,
+    stage: str = "generate",
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    cache_extra: Sequence[str] = (),
+) -> Any:
+    """
+    Streaming counterpart of generate_content_async: on_chunk is awaited with each text
+    chunk as it arrives; the full response (.text) is returned and cached as usual.
+    """
+    if model_id is None:
+        model_id = settings.model_id
+
+    if contents is None:
+        raise ValueError("contents is required")
+
+    response_mime_type = (config or {}).get("response_mime_type")
+    return await consume_stream(
+        stage, model_id, contents, config,
+        lambda: stream_generate_content_rest_async(model_id, contents, response_mime_type),
+        on_chunk=on_chunk,
+        cache_extra=cache_extra,
+    )
 
 
 def generate_content(
     model_id: Optional[str] = None,
     contents: List[str] = None,
     config: Optional[Dict[str, Any]] = None,
+    stage: str = "generate",
+    cache_extra: Sequence[str] = (),
 ) -> Any:
     """
     Compatibility wrapper that mimics the SDK's generate_content interface.
+    Responses go through the LLM response cache (see llm_cache).
 
     Args:
         model_id: Model ID (defaults to settings.model_id)
         contents: List of prompt strings
         config: Optional config dict (e.g., {"response_mime_type": "application/json"})
+        stage: Pipeline stage name (cache opt-out / hit-rate counters)
+        cache_extra: Additional cache key parts (e.g. the KB bundle hash)
 
     Returns:
         Object with .text attribute containing the response
@@ -214,12 +623,40 @@ def generate_content(
     if config and "response_mime_type" in config:
         response_mime_type = config["response_mime_type"]
 
-    text = generate_content_rest(model_id, contents, response_mime_type)
-
     # Return an object that mimics the SDK response
-    class Response:
-        def __init__(self, text: str):
-            self.text = text
+    return cached_generate(
+        stage, model_id, contents, config,
+        lambda: call_with_backoff(
+            model_id, lambda: _Response(generate_content_rest(model_id, contents, response_mime_type)),
+        ),
+        extra=cache_extra,
+    )
+
 
-    return Response(text)
+async def generate_content_async(
+    model_id: Optional[str] = None,
+    contents: List[str] = None,
+    config: Optional[Dict[str, Any]] = None,
+    stage: str = "generate",
+    cache_extra: Sequence[str] = (),
+) -> Any:
+    """Async counterpart of generate_content (same arguments, same .text response)."""
+    if model_id is None:
+        model_id = settings.model_id
+
+    if contents is None:
+        raise ValueError("contents is required")
+
+    response_mime_type = None
+    if config and "response_mime_type" in config:
+        response_mime_type = config["response_mime_type"]
+
+    async def call():
+        return _Response(await generate_content_rest_async(model_id, contents, response_mime_type))
+
+    return await cached_generate_async(
+        stage, model_id, contents, config,
+        lambda: call_with_backoff_async(model_id, call, stage=stage),
+        extra=cache_extra,
+    )
 
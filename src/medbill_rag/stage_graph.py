@@ -0,0 +1,126 @@
+"""
+Small dependency-aware scheduler for pipeline stages.
+
+Each Stage names the results it needs (`inputs`); the executor starts a stage as soon
+as all of its inputs are available, running independent stages concurrently on one
+event loop, up to `max_workers` at a time.
+"""
+import asyncio
+import inspect
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    # names of upstream stages (or initial values) passed to fn as keyword args
+    inputs: Tuple[str, ...] = ()
+    # optional stages may be skipped (budget) or time out without failing the run
+    optional: bool = False
+
+
+class _Skipped(Exception):
+    """Internal: a stage was not started because another stage already failed."""
+
+
+def _check_graph(stages: Sequence[Stage], available: set) -> None:
+    names = [s.name for s in stages]
+    dup = {n for n in names if names.count(n) > 1}
+    if dup:
+        raise ValueError(f"Duplicate stage names: {sorted(dup)}")
+
+    known = available | set(names)
+    for s in stages:
+        missing = [i for i in s.inputs if i not in known]
+        if missing:
+            raise ValueError(f"Stage '{s.name}' depends on unknown inputs: {missing}")
+
+    # Kahn's algorithm: every stage must be reachable without cycles
+    done = set(available)
+    pending = list(stages)
+    while pending:
+        ready = [s for s in pending if all(i in done for i in s.inputs)]
+        if not ready:
+            raise ValueError(f"Stage graph has a cycle among: {[s.name for s in pending]}")
+        done.update(s.name for s in ready)
+        pending = [s for s in pending if s not in ready]
+
+
+async def run_stages_async(
+    stages: Sequence[Stage],
+    initial: Optional[Dict[str, Any]] = None,
+    max_workers: int = 4,
+    skip: Optional[Callable[[Stage], Optional[str]]] = None,
+    skipped: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Run `stages` respecting their declared inputs.
+    Coroutine functions are awaited on the running loop; plain functions run in a
+    worker thread. At most `max_workers` stages execute at once.
+    Returns {name: result} including `initial` values.
+    The first stage exception is re-raised after in-flight stages finish;
+    stages that have not started yet are not run.
+
+    Optional stages: skip(stage) is asked right before one starts and may return a
+    reason to skip it; an optional stage raising TimeoutError is skipped as well.
+    Skipped stages (and everything downstream of them) get no result and are
+    recorded in `skipped` as {name: reason}.
+    """
+    results: Dict[str, Any] = dict(initial or {})
+    _check_graph(stages, set(results))
+    skipped = skipped if skipped is not None else {}
+
+    sem = asyncio.Semaphore(max(1, max_workers))
+    errors: List[BaseException] = []
+    tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+    async def run_one(s: Stage) -> None:
+        for i in s.inputs:
+            if i in tasks:
+                await tasks[i]
+        upstream = [i for i in s.inputs if i in skipped]
+        if upstream:
+            skipped[s.name] = f"upstream skipped: {', '.join(upstream)}"
+            return
+        async with sem:
+            if errors:
+                raise _Skipped(s.name)
+            reason = skip(s) if (s.optional and skip is not None) else None
+            if reason:
+                skipped[s.name] = reason
+                return
+            kwargs = {i: results[i] for i in s.inputs}
+            try:
+                if inspect.iscoroutinefunction(s.fn):
+                    value = await s.fn(**kwargs)
+                else:
+                    value = await asyncio.to_thread(s.fn, **kwargs)
+            except TimeoutError as e:
+                if not s.optional:
+                    errors.append(e)
+                    raise
+                skipped[s.name] = f"timed out: {e}"
+                return
+            except BaseException as e:
+                errors.append(e)
+                raise
+        results[s.name] = value
+
+    for s in stages:
+        tasks[s.name] = asyncio.create_task(run_one(s), name=f"stage:{s.name}")
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def run_stages(
+    stages: Sequence[Stage],
+    initial: Optional[Dict[str, Any]] = None,
+    max_workers: int = 4,
+) -> Dict[str, Any]:
+    """Blocking wrapper around run_stages_async (must not be called from a running loop)."""
+    return asyncio.run(run_stages_async(stages, initial, max_workers))